@@ -0,0 +1,84 @@
+import logging
+import time
+from typing import Optional, Any, Coroutine
+
+import telegram.ext
+
+from common import profiling
+from common.logs import log_context
+from common.metrics import DUPLICATE_UPDATES, UPDATE_DURATION, UPDATE_STATEMENTS
+from db import routing
+from db.uow import (
+    DuplicateUpdate,
+    UnitOfWork,
+    UnitOfWorkStats,
+    current_unit_of_work,
+    stats_listeners,
+    unit_of_work,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _observe_statements(stats: UnitOfWorkStats) -> None:
+    UPDATE_STATEMENTS.observe(stats.statements)
+    if stats.duplicate:
+        DUPLICATE_UPDATES.inc()
+
+
+stats_listeners.append(_observe_statements)
+
+
+class Application(telegram.ext.Application):
+    """Каждое обновление обрабатывается в рамках одной единицы работы (см. db.uow)"""
+
+    async def process_update(self, update: object) -> None:
+        context = {}
+        update_key = None
+        user_id = None
+        if isinstance(update, telegram.Update):
+            context['update_id'] = update.update_id
+            if update.effective_user is not None:
+                context['user_id'] = user_id = update.effective_user.id
+            message = update.effective_message
+            update_key = (update.update_id, message.message_id if message is not None else 0)
+        token = log_context.set(context)
+        started_at = time.perf_counter()
+        uow = None
+        with UPDATE_DURATION.time():
+            profile = profiling.start(update)
+            # пользователь нужен маршрутизации чтений и слушателям статистики, поэтому сбрасывается после unit_of_work
+            user_token = routing.current_user_id.set(user_id)
+            try:
+                async with unit_of_work(update_key) as uow:
+                    await super().process_update(update)
+                if uow.stats.duplicate:
+                    logger.warning('Update already processed, changes rolled back')
+            finally:
+                routing.current_user_id.reset(user_token)
+                if profile is not None:
+                    await profiling.finish(profile)
+                context['duration'] = round(time.perf_counter() - started_at, 4)
+                logger.info('Update processed')
+                log_context.reset(token)
+                if uow is not None:
+                    self.update_processed(update, uow)
+
+    def update_processed(self, update: object, uow: UnitOfWork) -> None:
+        """Вызывается после фиксации или отката транзакции обновления"""
+
+    async def process_error(
+        self,
+        update: Optional[object],
+        error: Exception,
+        job: Any = None,
+        coroutine: Coroutine[Any, Any, Any] = None,
+    ) -> bool:
+        # исключения обработчиков перехватываются внутри process_update, транзакцию откатываем здесь
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.failed = True
+        if isinstance(error, DuplicateUpdate):
+            # не ошибка: изменения уже откатены, process_update запишет предупреждение
+            return False
+        return await super().process_error(update=update, error=error, job=job, coroutine=coroutine)
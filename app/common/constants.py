@@ -6,3 +6,4 @@ COMMAND_ENTRIES = 'entries'
 COMMAND_TRANSFERS = 'transfers'
 COMMAND_ACCOUNTS = 'accounts'
 COMMAND_CATEGORIES = 'categories'
+COMMAND_IMPORT = 'import'
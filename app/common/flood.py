@@ -0,0 +1,111 @@
+"""
+Защита от флуда: ограничение частоты входящих обновлений от одного пользователя
+
+Обработчик стоит в группе -1, до всех диалогов. У каждого пользователя своя корзина токенов,
+обновления сверх неё отбрасываются (ApplicationHandlerStop) и не доходят ни до ConversationHandler,
+ни до базы. Повторное нажатие той же кнопки того же сообщения в течение duplicate_window секунд
+отбрасывается, даже если токены есть, и токен не тратит: результата первого нажатия пользователь
+ещё не видел. На отброшенное нажатие кнопки бот отвечает (answerCallbackQuery), чтобы у кнопки не крутились
+часики, но не чаще раза в duplicate_window секунд, иначе флуд кнопкой превращался бы во флуд запросами к Bot API.
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+
+from common.metrics import DROPPED_UPDATES
+from common.outbox import TokenBucket
+
+REASON__RATE = 'rate'
+REASON__DUPLICATE = 'duplicate'
+
+
+@dataclass
+class _UserState:
+    bucket: TokenBucket
+    # (id сообщения, callback_data) последнего нажатия и его время
+    last_press: Optional[Tuple[int, str]] = None
+    last_press_at: float = 0.0
+    # когда бот последний раз отвечал на отброшенное нажатие
+    last_answer_at: Optional[float] = None
+
+
+class FloodGuard:
+
+    def __init__(self, rate: float, burst: float, duplicate_window: float):
+        """
+        :param rate: обновлений в секунду от одного пользователя
+        :param burst: сколько обновлений подряд можно прислать без ограничения
+        :param duplicate_window: сколько секунд повторное нажатие той же кнопки считается дублем
+        """
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self._users: Dict[int, _UserState] = {}
+        self._last_sweep = 0.0
+
+    def handler(self) -> TypeHandler:
+        return TypeHandler(Update, self.guard)
+
+    def _state(self, user_id: int) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            self._sweep()
+            state = self._users[user_id] = _UserState(TokenBucket(self.rate, self.burst))
+        return state
+
+    def _sweep(self) -> None:
+        """Выбрасывает состояние пользователей, которые давно ничего не присылали"""
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for user_id in [
+            user_id for user_id, state in self._users.items()
+            if state.bucket.idle and now - state.last_press_at > self.duplicate_window
+        ]:
+            del self._users[user_id]
+
+    def check(self, update: Update) -> Optional[str]:
+        """:return: причина, по которой обновление отбрасывается, или None"""
+        if update.effective_user is None:
+            return None
+        state = self._state(update.effective_user.id)
+
+        query = update.callback_query
+        if query is not None and query.message is not None:
+            now = time.monotonic()
+            press = (query.message.message_id, query.data)
+            if press == state.last_press and now - state.last_press_at < self.duplicate_window:
+                return REASON__DUPLICATE
+            state.last_press, state.last_press_at = press, now
+
+        if not state.bucket.try_acquire():
+            return REASON__RATE
+        return None
+
+    def _should_answer(self, update: Update) -> bool:
+        if update.callback_query is None:
+            return False
+        state = self._state(update.effective_user.id)
+        now = time.monotonic()
+        if state.last_answer_at is not None and now - state.last_answer_at < self.duplicate_window:
+            return False
+        state.last_answer_at = now
+        return True
+
+    async def guard(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        reason = self.check(update)
+        if reason is None:
+            return
+        DROPPED_UPDATES.labels(reason).inc()
+        if self._should_answer(update):
+            try:
+                await update.callback_query.answer()
+            except TelegramError:
+                # обновление отбрасывается в любом случае
+                pass
+        raise ApplicationHandlerStop
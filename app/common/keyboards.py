@@ -0,0 +1,143 @@
+"""
+Инлайн-клавиатуры со списками счетов и категорий
+
+Кнопки раскладываются по ROW_SIZE в ряд и разбиваются на страницы по PAGE_SIZE штук, чтобы не упираться
+в ограничения Telegram на размер клавиатуры. Готовая разметка кэшируется по (пользователь, вид списка, версия,
+страница), версия пользователя увеличивается после каждого обновления, в котором что-то было записано в базу
+"""
+from collections import OrderedDict
+from typing import Callable, Collection, Dict, Iterable, List, Sequence, Tuple, Union
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import CallbackQueryHandler, ContextTypes
+
+from db import routing
+from db.uow import UnitOfWorkStats, current_unit_of_work, stats_listeners
+
+PAGE_SIZE = 20
+ROW_SIZE = 2
+# сколько клавиатур держать в памяти, самые давние вытесняются
+CACHE_SIZE = 10_000
+
+PAGE_CALLBACK_PREFIX = 'page:'
+# кнопка с номером страницы ничего не делает, у неё пустой номер
+PAGE_CALLBACK_PATTERN = rf'^{PAGE_CALLBACK_PREFIX}\d*$'
+
+ACTION__PREV = '←'
+ACTION__NEXT = '→'
+ACTION__DRILL_DOWN = '›'
+
+Rows = Sequence[Sequence[InlineKeyboardButton]]
+Items = List[Tuple[str, Union[str, int]]]
+
+_versions: Dict[int, int] = {}
+_cache: 'OrderedDict[tuple, InlineKeyboardMarkup]' = OrderedDict()
+
+
+def invalidate(user_id: int) -> None:
+    _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def _invalidate_on_write(stats: UnitOfWorkStats) -> None:
+    # вызывается после фиксации транзакции, так что новая версия строится уже по записанным данным
+    user_id = routing.current_user_id.get()
+    if stats.writes and user_id is not None:
+        invalidate(user_id)
+
+
+stats_listeners.append(_invalidate_on_write)
+
+
+def account_items(accounts: Iterable) -> Items:
+    return [(f'{account.title} ({account.balance} {account.currency})', account.id) for account in accounts]
+
+
+def category_items(categories: Iterable, mark_disabled: bool = False, parent_ids: Collection[int] = ()) -> Items:
+    """
+    :param parent_ids: категории с подкатегориями, у их кнопок стрелка вглубь
+    """
+    items = []
+    for category in categories:
+        text = f'(скрыта) {category.title}' if mark_disabled and category.disabled else category.title
+        if category.id in parent_ids:
+            text = f'{text} {ACTION__DRILL_DOWN}'
+        items.append((text, category.id))
+    return items
+
+
+def _build(items: Items, header: Rows, page: int, page_size: int) -> InlineKeyboardMarkup:
+    pages = max(1, -(-len(items) // page_size))
+    page = min(max(page, 0), pages - 1)
+
+    keyboard = [list(row) for row in header]
+    page_items = items[page * page_size:(page + 1) * page_size]
+    for i in range(0, len(page_items), ROW_SIZE):
+        keyboard.append([
+            InlineKeyboardButton(text, callback_data=callback_data)
+            for text, callback_data in page_items[i:i + ROW_SIZE]
+        ])
+
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton(ACTION__PREV, callback_data=f'{PAGE_CALLBACK_PREFIX}{page - 1}'))
+        navigation.append(InlineKeyboardButton(f'{page + 1}/{pages}', callback_data=PAGE_CALLBACK_PREFIX))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton(ACTION__NEXT, callback_data=f'{PAGE_CALLBACK_PREFIX}{page + 1}'))
+        keyboard.append(navigation)
+
+    return InlineKeyboardMarkup(keyboard)
+
+
+def build_keyboard(
+    user_id: int,
+    kind: str,
+    items: Callable[[], Items],
+    header: Rows = (),
+    page: int = 0,
+    page_size: int = PAGE_SIZE,
+) -> InlineKeyboardMarkup:
+    """
+    Клавиатура со страницей списка
+
+    :param user_id: владелец списка
+    :param kind: вид списка, должен однозначно определять и кнопки, и header
+    :param items: пары (текст, callback_data), вызывается только если клавиатуры нет в кэше
+    :param header: ряды кнопок над списком, повторяются на каждой странице
+    :param page: номер страницы с нуля
+    :param page_size: сколько кнопок списка на странице
+    """
+    # версия увеличивается только по окончании обновления, поэтому после записи, даже уже
+    # зафиксированной перед ответом (см. db.uow), кэш со старой версией не годится
+    uow = current_unit_of_work()
+    cacheable = uow is None or not (uow.has_writes or uow.wrote)
+
+    key = (user_id, kind, _versions.get(user_id, 0), page, page_size)
+    if cacheable:
+        reply_markup = _cache.get(key)
+        if reply_markup is not None:
+            _cache.move_to_end(key)
+            return reply_markup
+
+    reply_markup = _build(items(), header, page, page_size)
+    if cacheable:
+        _cache[key] = reply_markup
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return reply_markup
+
+
+def page_handler(render: Callable[[ContextTypes.DEFAULT_TYPE, int], InlineKeyboardMarkup]) -> CallbackQueryHandler:
+    """
+    Обработчик кнопок перелистывания, ставится в состояние диалога перед остальными обработчиками
+
+    :param render: строит клавиатуру для страницы по данным из context.user_data
+    """
+    async def turn_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await update.callback_query.answer()
+        page = update.callback_query.data[len(PAGE_CALLBACK_PREFIX):]
+        if page:
+            await update.callback_query.edit_message_reply_markup(reply_markup=render(context, int(page)))
+        # None оставляет диалог в текущем состоянии
+
+    return CallbackQueryHandler(turn_page, pattern=PAGE_CALLBACK_PATTERN)
@@ -0,0 +1,144 @@
+"""
+Логирование без записи в поток вывода из цикла событий
+
+Корневой логгер пишет в очередь (QueueHandler), а форматирование и вывод в stderr выполняет
+QueueListener в отдельном потоке. В цикле событий остаются только создание записи и подстановка
+аргументов в сообщение.
+
+К каждой записи добавляется контекст текущего обновления (update_id, user_id, обработчик, состояние
+диалога), в конце обработки пишется запись с её длительностью. Записи ниже WARNING от шумных
+логгеров (LOGGING__SAMPLING) пропускаются с заданной вероятностью ещё до постановки в очередь.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# контекст обновления, обработчики дополняют его по ходу обработки
+log_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar('log_context', default=None)
+
+_listener: Optional[QueueListener] = None
+
+
+def update_context(**values: Any) -> None:
+    context = log_context.get()
+    if context is not None:
+        context.update(values)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING от логгера и его потомков"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # более длинные префиксы проверяются первыми: sqlalchemy.engine.Engine точнее sqlalchemy
+        self._rules = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._rates: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        try:
+            return self._rates[name]
+        except KeyError:
+            rate = next(
+                (rate for prefix, rate in self._rules if name == prefix or name.startswith(f'{prefix}.')), None,
+            )
+            self._rates[name] = rate
+            return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # аргументы подставляются сразу, пока их не изменили, а оформление остаётся потоку слушателя;
+        # очередь внутри процесса, поэтому exc_info передаётся как есть и трейсбек форматируется там же
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        context = log_context.get()
+        record.context = dict(context) if context else None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        context = getattr(record, 'context', None)
+        if context:
+            entry.update(context)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        context = getattr(record, 'context', None)
+        if not context:
+            return text
+        line, _, rest = text.partition('\n')
+        line = f'{line} [{" ".join(f"{key}={value}" for key, value in context.items())}]'
+        return f'{line}\n{rest}' if rest else line
+
+
+def configure(level: str = 'INFO', json_format: bool = True, sql: bool = False,
+              sampling: Optional[Dict[str, float]] = None) -> None:
+    """
+    Направляет корневой логгер в очередь и запускает поток, который пишет записи в stderr
+
+    :param sql: SQL-запросы в лог, как echo=True у движка, но через ту же очередь
+    :param sampling: логгер -> доля записей ниже WARNING, которые попадают в лог
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    if sampling:
+        handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+    if sql:
+        logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop() -> None:
+    """Дописывает оставшиеся в очереди записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop)
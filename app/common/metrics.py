@@ -0,0 +1,139 @@
+"""
+Метрики в формате Prometheus
+
+Метрики собираются всегда, HTTP-сервер для их выдачи поднимается, только если задан METRICS_PORT.
+Дочерние метрики с известными заранее метками создаются один раз при регистрации обработчиков,
+чтобы на каждое обновление приходилось только observe без поиска по меткам
+"""
+import functools
+import time
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from telegram.ext import BaseHandler, ConversationHandler
+
+from common import logs
+
+PREFIX = 'expensegram'
+
+# от сотни микросекунд до десяти секунд
+_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+UPDATE_DURATION = Histogram(
+    f'{PREFIX}_update_duration_seconds',
+    'Обработка обновления целиком, включая фиксацию транзакции',
+    buckets=_BUCKETS,
+)
+UPDATE_STATEMENTS = Histogram(
+    f'{PREFIX}_update_statements',
+    'SQL-запросов на одно обновление',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DUPLICATE_UPDATES = Counter(
+    f'{PREFIX}_duplicate_updates_total',
+    'Повторно доставленные обновления, изменения которых отброшены',
+)
+DROPPED_UPDATES = Counter(
+    f'{PREFIX}_dropped_updates_total',
+    'Входящие обновления, отброшенные защитой от флуда',
+    ['reason'],
+)
+WORKER_RESTARTS = Counter(
+    f'{PREFIX}_worker_restarts_total',
+    'Перезапуски упавших процессов-обработчиков (режим супервизора)',
+)
+HANDLER_DURATION = Histogram(
+    f'{PREFIX}_handler_duration_seconds',
+    'Время работы колбэка обработчика',
+    ['handler', 'callback'],
+    buckets=_BUCKETS,
+)
+CONVERSATIONS = Gauge(
+    f'{PREFIX}_conversations',
+    'Незавершённые диалоги',
+    ['handler'],
+)
+BOT_API_DURATION = Histogram(
+    f'{PREFIX}_bot_api_request_duration_seconds',
+    'Запрос к Bot API без учёта ожидания в очереди',
+    ['endpoint'],
+    buckets=_BUCKETS,
+)
+BOT_API_WAIT = Histogram(
+    f'{PREFIX}_bot_api_queue_wait_seconds',
+    'Ожидание в очереди исходящих запросов из-за ограничений Telegram',
+    buckets=_BUCKETS,
+)
+BOT_API_ERRORS = Counter(
+    f'{PREFIX}_bot_api_errors_total',
+    'Ошибки запросов к Bot API',
+    ['endpoint', 'error'],
+)
+DB_QUERY_DURATION = Histogram(
+    f'{PREFIX}_db_query_duration_seconds',
+    'Выполнение SQL-запроса',
+    ['database', 'operation'],
+    buckets=_BUCKETS,
+)
+DB_POOL_CHECKOUT = Histogram(
+    f'{PREFIX}_db_pool_checkout_seconds',
+    'Ожидание соединения из пула, включая открытие нового',
+    ['database'],
+    buckets=_BUCKETS,
+)
+
+
+def serve(port: int, addr: str) -> None:
+    """Отдаёт метрики по HTTP из отдельного потока"""
+    start_http_server(port, addr)
+
+
+def _timed(callback, histogram, handler: str, state: Optional[object]):
+    callback_name = _callback_name(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        # в логе видно, какой обработчик и в каком состоянии диалога обрабатывал обновление
+        logs.update_context(handler=handler, callback=callback_name, state=state)
+        started_at = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            histogram.observe(time.perf_counter() - started_at)
+
+    return wrapper
+
+
+def _callback_name(callback) -> str:
+    # колбэки, созданные фабриками (например, keyboards.page_handler), называются по фабрике
+    return callback.__qualname__.replace('.<locals>', '')
+
+
+def instrument(
+    handler: BaseHandler,
+    name: str,
+    _seen: Optional[Dict[int, BaseHandler]] = None,
+    _state: Optional[object] = None,
+) -> BaseHandler:
+    """
+    Оборачивает колбэки обработчика замером времени, у диалога - колбэки всех состояний
+
+    :param handler: обработчик или ConversationHandler
+    :param name: значение метки handler
+    """
+    seen = {} if _seen is None else _seen
+    if id(handler) in seen:
+        return handler
+    seen[id(handler)] = handler
+
+    if isinstance(handler, ConversationHandler):
+        nested = [(nested_handler, None) for nested_handler in (*handler.entry_points, *handler.fallbacks)]
+        for state, state_handlers in handler.states.items():
+            nested.extend((nested_handler, state) for nested_handler in state_handlers)
+        for nested_handler, state in nested:
+            instrument(nested_handler, name, seen, state)
+        CONVERSATIONS.labels(name).set_function(lambda: len(handler._conversations))
+    else:
+        histogram = HANDLER_DURATION.labels(name, _callback_name(handler.callback))
+        handler.callback = _timed(handler.callback, histogram, name, _state)
+    return handler
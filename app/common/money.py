@@ -0,0 +1,94 @@
+"""
+Денежные суммы в минорных единицах валюты (копейках, центах) - целых числах
+
+В базе суммы хранятся в BIGINT: целые складываются быстрее DECIMAL и в PostgreSQL, и в Python, и без
+преобразований ложатся в массивы int64 для векторных вычислений. Сколько минорных единиц в основной,
+задаёт показатель валюты: 2 у рубля и доллара, 0 у иены, 3 у кувейтского динара. Показатель хранится
+у счёта (AccountModel.exponent), суммы записей, переводов и проводок - в валюте своего счёта.
+
+Money - сумма вместе с показателем для обработчиков и шаблонов: разбор ввода пользователя, арифметика
+и вывод с нужным числом знаков после запятой
+"""
+import re
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Optional
+
+DEFAULT_EXPONENT = 2
+
+# ISO 4217: валюты, у которых не две цифры после запятой
+EXPONENTS = {
+    'BIF': 0, 'CLP': 0, 'DJF': 0, 'GNF': 0, 'ISK': 0, 'JPY': 0, 'KMF': 0, 'KRW': 0, 'PYG': 0,
+    'RWF': 0, 'UGX': 0, 'UYI': 0, 'VND': 0, 'VUV': 0, 'XAF': 0, 'XOF': 0, 'XPF': 0,
+    'BHD': 3, 'IQD': 3, 'JOD': 3, 'KWD': 3, 'LYD': 3, 'OMR': 3, 'TND': 3,
+    'CLF': 4, 'UYW': 4,
+    # не ISO, но счета в биткоинах встречаются: сатоши
+    'BTC': 8,
+}
+# валюта счёта - свободный текст, для показателя знак или название приводится к коду
+CURRENCY_ALIASES = {
+    '¥': 'JPY', 'иена': 'JPY', 'иен': 'JPY',
+    '₩': 'KRW', 'вон': 'KRW',
+    '₿': 'BTC',
+}
+
+THOUSANDS_SUFFIXES = ('k', 'к')
+
+
+def currency_exponent(currency: str) -> int:
+    currency = currency.strip()
+    code = CURRENCY_ALIASES.get(currency.lower(), currency.upper())
+    return EXPONENTS.get(code, DEFAULT_EXPONENT)
+
+
+@dataclass(frozen=True)
+class Money:
+    minor: int
+    exponent: int = DEFAULT_EXPONENT
+
+    @classmethod
+    def from_decimal(cls, amount: Decimal, exponent: int = DEFAULT_EXPONENT) -> 'Money':
+        """Лишние знаки после запятой округляются"""
+        return cls(int(amount.scaleb(exponent).to_integral_value(ROUND_HALF_UP)), exponent)
+
+    @classmethod
+    def parse(cls, text: str, exponent: int = DEFAULT_EXPONENT) -> Optional['Money']:
+        """
+        Сумма, как её пишет пользователь: 350, 350,50, 1.5k (каждая k или к - тысяча); знак отбрасывается
+
+        :return: None, если в тексте нет числа
+        """
+        thousands = sum(text.count(suffix) for suffix in THOUSANDS_SUFFIXES)
+        digits = re.sub(r'[^0-9.,]+', '', text).replace(',', '.')
+        try:
+            amount = Decimal(digits)
+        except InvalidOperation:
+            return None
+        return cls.from_decimal(amount.scaleb(3 * thousands), exponent)
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.minor).scaleb(-self.exponent)
+
+    def _check(self, other: 'Money') -> None:
+        if self.exponent != other.exponent:
+            raise ValueError(f'Cannot combine amounts with exponents {self.exponent} and {other.exponent}')
+
+    def __add__(self, other: 'Money') -> 'Money':
+        self._check(other)
+        return Money(self.minor + other.minor, self.exponent)
+
+    def __sub__(self, other: 'Money') -> 'Money':
+        self._check(other)
+        return Money(self.minor - other.minor, self.exponent)
+
+    def __neg__(self) -> 'Money':
+        return Money(-self.minor, self.exponent)
+
+    def __bool__(self) -> bool:
+        return bool(self.minor)
+
+    def __str__(self) -> str:
+        if not self.exponent:
+            return str(self.minor)
+        whole, fraction = divmod(abs(self.minor), 10 ** self.exponent)
+        return f'{"-" if self.minor < 0 else ""}{whole}.{fraction:0{self.exponent}d}'
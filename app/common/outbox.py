@@ -0,0 +1,254 @@
+"""
+Очередь исходящих запросов к Bot API
+
+Ограничения Telegram: около 30 сообщений в секунду на бота, 1 сообщение в секунду в личный чат
+и 20 сообщений в минуту в группу. Запросы, адресованные чату, ждут токен в корзине чата, затем
+в общей корзине. При 429 (RetryAfter) отправка приостанавливается на указанное время и запрос
+повторяется. Если правка сообщения ещё ждёт своей очереди, а для того же сообщения пришла новая,
+отправляется только последняя, а ожидавшие получают её результат
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from common.metrics import BOT_API_DURATION, BOT_API_ERRORS, BOT_API_WAIT
+from common.profiling import current_profile
+
+logger = logging.getLogger(__name__)
+
+# правки, которые можно схлопывать: имеет значение только последнее состояние сообщения
+COALESCED_ENDPOINTS = frozenset({
+    'editMessageText',
+    'editMessageReplyMarkup',
+    'editMessageCaption',
+})
+
+# запросов в секунду на весь бот; при нескольких процессах делится между ними
+OVERALL_RATE = 30
+
+JSONResult = Union[bool, Dict[str, Any], List[Dict[str, Any]]]
+
+
+class TokenBucket:
+    """Корзина токенов, ожидающие обслуживаются в порядке очереди"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: сколько токенов добавляется в секунду
+        :param capacity: максимальный запас токенов (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def idle(self) -> bool:
+        """Корзина полна и никто её не ждёт, её можно выбросить"""
+        self._refill()
+        return not self._lock.locked() and self.tokens >= self.capacity
+
+    def try_acquire(self) -> bool:
+        """Берёт токен без ожидания, если он есть"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+@dataclass
+class _PendingEdit:
+    callback: Callable[..., Coroutine[Any, Any, JSONResult]]
+    args: Any
+    kwargs: Dict[str, Any]
+    future: asyncio.Future
+    started: bool = False
+
+
+class Outbox(BaseRateLimiter[None]):
+
+    def __init__(
+        self,
+        overall_rate: float = OVERALL_RATE,
+        overall_burst: float = 1,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate: float = 20 / 60,
+        group_burst: float = 5,
+        max_retries: int = 3,
+    ):
+        """
+        :param overall_rate: запросов в секунду на весь бот
+        :param overall_burst: сколько запросов можно отправить подряд без ожидания
+        :param chat_rate: запросов в секунду в один личный чат
+        :param chat_burst: сколько запросов в личный чат можно отправить подряд без ожидания
+        :param group_rate: запросов в секунду в одну группу
+        :param group_burst: сколько запросов в группу можно отправить подряд без ожидания
+        :param max_retries: сколько раз повторять запрос после RetryAfter
+        """
+        self.overall_rate = overall_rate
+        self.overall_burst = overall_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+
+        self.coalesced = 0
+        self.retries = 0
+
+        self._overall: Optional[TokenBucket] = None
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._edits: Dict[Tuple, _PendingEdit] = {}
+        self._resume_at = 0.0
+        self._last_sweep = 0.0
+
+    async def initialize(self) -> None:
+        # корзины создаются внутри работающего цикла событий
+        self._overall = TokenBucket(self.overall_rate, self.overall_burst)
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            self._sweep()
+            # у групп и каналов отрицательный id или @username
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            bucket = self._chats[chat_id] = TokenBucket(
+                self.chat_rate if is_private else self.group_rate,
+                self.chat_burst if is_private else self.group_burst,
+            )
+        return bucket
+
+    def _sweep(self) -> None:
+        """Выбрасывает корзины неактивных чатов, чтобы словарь не рос бесконечно"""
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.idle]:
+            del self._chats[chat_id]
+
+    async def _acquire(self, chat_id: Union[int, str]) -> None:
+        started_at = time.perf_counter()
+        await self._chat_bucket(chat_id).acquire()
+        await self._overall.acquire()
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        waited = time.perf_counter() - started_at
+        BOT_API_WAIT.observe(waited)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.api_wait += waited
+
+    async def _call(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+    ) -> JSONResult:
+        histogram = BOT_API_DURATION.labels(endpoint)
+        profile = current_profile.get()
+        for attempt in range(self.max_retries + 1):
+            started_at = time.perf_counter()
+            try:
+                result = await callback(*args, **kwargs)
+            except Exception as e:
+                duration = time.perf_counter() - started_at
+                histogram.observe(duration)
+                if profile is not None:
+                    profile.api_calls.append((endpoint, duration))
+                BOT_API_ERRORS.labels(endpoint, type(e).__name__).inc()
+                if not isinstance(e, RetryAfter) or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning('%s: rate limited by Telegram, retrying in %s s', endpoint, e.retry_after)
+                # 429 означает, что превышен какой-то из лимитов, приостанавливаем все отправки
+                self._resume_at = max(self._resume_at, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            else:
+                duration = time.perf_counter() - started_at
+                histogram.observe(duration)
+                if profile is not None:
+                    profile.api_calls.append((endpoint, duration))
+                return result
+
+    async def _process_edit(
+        self,
+        key: Tuple,
+        chat_id: Union[int, str],
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+    ) -> JSONResult:
+        pending = self._edits.get(key)
+        if pending is not None and not pending.started:
+            # предыдущая правка ещё не отправлена: подменяем её содержимое и ждём общий результат
+            pending.callback, pending.args, pending.kwargs = callback, args, kwargs
+            self.coalesced += 1
+            return await asyncio.shield(pending.future)
+
+        pending = self._edits[key] = _PendingEdit(callback, args, kwargs, asyncio.get_running_loop().create_future())
+        try:
+            await self._acquire(chat_id)
+            pending.started = True
+            del self._edits[key]
+            result = await self._call(pending.callback, pending.args, pending.kwargs, endpoint)
+        except BaseException as e:
+            if self._edits.get(key) is pending:
+                del self._edits[key]
+            if isinstance(e, Exception):
+                pending.future.set_exception(e)
+                # помечаем исключение полученным, если схлопнутых правок не было
+                pending.future.exception()
+            else:
+                pending.future.cancel()
+            raise
+        pending.future.set_result(result)
+        return result
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[None],
+    ) -> JSONResult:
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # ответы на callback-запросы, getMe, getFile и т.п. лимитами на сообщения не ограничены
+            return await self._call(callback, args, kwargs, endpoint)
+
+        if endpoint in COALESCED_ENDPOINTS and 'message_id' in data:
+            key = (endpoint, chat_id, data['message_id'])
+            return await self._process_edit(key, chat_id, callback, args, kwargs, endpoint)
+
+        await self._acquire(chat_id)
+        return await self._call(callback, args, kwargs, endpoint)
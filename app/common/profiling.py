@@ -0,0 +1,183 @@
+"""
+Профилирование отдельных обновлений
+
+Обновления пользователей из PROFILING__USER_IDS и случайная доля PROFILING__SAMPLE_RATE остальных
+обрабатываются под cProfile, попутно записываются SQL-запросы (без параметров) и запросы к Bot API
+с их длительностью. Если обновление обрабатывалось дольше PROFILING__THRESHOLD, отчёт сохраняется
+в PROFILING__DIR: <имя>.prof (pstats) и <имя>.json, хранятся последние PROFILING__KEEP отчётов.
+
+cProfile один на поток, поэтому одновременно профилируется не больше одного обновления, а при
+CONCURRENT_UPDATES в профиль попадают и обновления, обрабатывавшиеся параллельно.
+
+Сводка по сохранённым отчётам: python -m common.profiling [--top N] [--last N]
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import pstats
+import random
+import re
+import time
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+
+from config import settings
+
+_user_ids = frozenset(settings.PROFILING.USER_IDS)
+
+
+@dataclass
+class UpdateProfile:
+    update_id: Optional[int]
+    user_id: Optional[int]
+    kind: str
+    profiler: cProfile.Profile = field(default_factory=cProfile.Profile)
+    started_at: float = field(default_factory=time.perf_counter)
+    cpu_started_at: float = field(default_factory=time.process_time)
+    # (база, запрос, секунды)
+    queries: List[Tuple[str, str, float]] = field(default_factory=list)
+    # (метод, секунды)
+    api_calls: List[Tuple[str, float]] = field(default_factory=list)
+    # ожидание в очереди исходящих запросов
+    api_wait: float = 0
+    token: Optional[Token] = None
+
+
+current_profile: ContextVar[Optional[UpdateProfile]] = ContextVar('current_profile', default=None)
+_running: Optional[UpdateProfile] = None
+
+
+def _kind(update: Update) -> str:
+    """Команда или тип обновления, сам текст сообщения в отчёт не попадает"""
+    if update.callback_query is not None:
+        return 'callback_query'
+    message = update.effective_message
+    if message is not None and message.text and message.text.startswith('/'):
+        return message.text.split(maxsplit=1)[0]
+    if message is not None and message.document is not None:
+        return 'document'
+    return 'message'
+
+
+def _selected(user_id: Optional[int]) -> bool:
+    if user_id is not None and user_id in _user_ids:
+        return True
+    return settings.PROFILING.SAMPLE_RATE > 0 and random.random() < settings.PROFILING.SAMPLE_RATE
+
+
+def start(update: object) -> Optional[UpdateProfile]:
+    """Начинает профилирование обновления, если оно выбрано и профилировщик свободен"""
+    global _running
+    if _running is not None or not isinstance(update, Update):
+        return None
+    user_id = update.effective_user.id if update.effective_user is not None else None
+    if not _selected(user_id):
+        return None
+
+    profile = UpdateProfile(update_id=update.update_id, user_id=user_id, kind=_kind(update))
+    try:
+        profile.profiler.enable()
+    except ValueError:
+        # уже работает другой профилировщик
+        return None
+    profile.token = current_profile.set(profile)
+    _running = profile
+    return profile
+
+
+async def finish(profile: UpdateProfile) -> None:
+    global _running
+    profile.profiler.disable()
+    wall = time.perf_counter() - profile.started_at
+    cpu = time.process_time() - profile.cpu_started_at
+    current_profile.reset(profile.token)
+    _running = None
+    if wall >= settings.PROFILING.THRESHOLD:
+        await asyncio.to_thread(_save, profile, wall, cpu)
+
+
+def _save(profile: UpdateProfile, wall: float, cpu: float) -> None:
+    directory = settings.PROFILING.DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{profile.update_id}'
+    profile.profiler.dump_stats(directory / f'{name}.prof')
+    report = {
+        'update_id': profile.update_id,
+        'user_id': profile.user_id,
+        'kind': profile.kind,
+        'concurrent_updates': settings.CONCURRENT_UPDATES,
+        'wall': wall,
+        'cpu': cpu,
+        'db': sum(seconds for _, _, seconds in profile.queries),
+        'api': sum(seconds for _, seconds in profile.api_calls),
+        'api_wait': profile.api_wait,
+        'queries': [
+            {'database': database, 'statement': statement, 'seconds': seconds}
+            for database, statement, seconds in profile.queries
+        ],
+        'api_calls': [{'endpoint': endpoint, 'seconds': seconds} for endpoint, seconds in profile.api_calls],
+    }
+    (directory / f'{name}.json').write_text(json.dumps(report, ensure_ascii=False, indent=1))
+
+    # кольцевой буфер: имена начинаются с времени, так что сортировка по имени хронологическая
+    for old_report in sorted(directory.glob('*.json'))[:-settings.PROFILING.KEEP]:
+        old_report.with_suffix('.prof').unlink(missing_ok=True)
+        old_report.unlink(missing_ok=True)
+
+
+def summarize(directory: Path, top: int, last: Optional[int]) -> None:
+    reports = sorted(directory.glob('*.json'))
+    if last:
+        reports = reports[-last:]
+    if not reports:
+        print(f'No reports in {directory}')
+        return
+
+    print(f'{"report":<34} {"update":<16} {"wall":>8} {"cpu":>8} {"db":>8} {"api":>8} {"wait":>8}  ms')
+    queries: Dict[str, List[float]] = {}
+    for path in reports:
+        report = json.loads(path.read_text())
+        print(
+            f'{path.stem:<34} {report["kind"][:16]:<16} '
+            + ' '.join(f'{report[key] * 1000:8.1f}' for key in ('wall', 'cpu', 'db', 'api', 'api_wait'))
+        )
+        for query in report['queries']:
+            statement = re.sub(r'\s+', ' ', query['statement']).strip()
+            queries.setdefault(statement, []).append(query['seconds'])
+    if any(json.loads(path.read_text())['concurrent_updates'] for path in reports):
+        print('Some reports were taken with CONCURRENT_UPDATES, their profiles include other updates')
+
+    print(f'\nTop {top} queries by total time:')
+    print(f'{"total ms":>10} {"count":>6} {"max ms":>8}  statement')
+    for statement, durations in sorted(queries.items(), key=lambda item: sum(item[1]), reverse=True)[:top]:
+        print(f'{sum(durations) * 1000:10.1f} {len(durations):6} {max(durations) * 1000:8.1f}  {statement[:200]}')
+
+    profiles = [str(path.with_suffix('.prof')) for path in reports if path.with_suffix('.prof').exists()]
+    if profiles:
+        stats = pstats.Stats(*profiles)
+        stats.strip_dirs()
+        # иначе print_stats перечисляет все файлы профилей
+        stats.files = []
+        print(f'\nTop {top} functions by own time:')
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+        print(f'Top {top} functions by cumulative time:')
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Сводка по отчётам профилирования обновлений')
+    parser.add_argument('--dir', type=Path, default=settings.PROFILING.DIR, help='каталог с отчётами')
+    parser.add_argument('--top', type=int, default=20, help='сколько функций и запросов показывать')
+    parser.add_argument('--last', type=int, default=None, help='учитывать только последние N отчётов')
+    args = parser.parse_args()
+    summarize(args.dir, args.top, args.last)
+
+
+if __name__ == '__main__':
+    main()
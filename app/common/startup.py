@@ -0,0 +1,132 @@
+"""
+Замеры холодного старта
+
+Модуль намеренно зависит только от стандартной библиотеки: start_bot импортирует его первым, чтобы
+профилировщик импортов успел встать в sys.meta_path раньше тяжёлых зависимостей.
+Отчёт похож на python -X importtime: собственное и накопленное время импорта каждого модуля
+плюс длительность этапов инициализации
+"""
+import importlib.abc
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STARTED_AT = time.perf_counter()
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Обёртка над загрузчиком модуля, замеряющая exec_module"""
+
+    def __init__(self, loader, profiler: 'ImportProfiler'):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler.enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.exit(module.__name__)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+
+    def __init__(self):
+        # (модуль, собственное время, накопленное время, глубина вложенности)
+        self.records: List[Tuple[str, float, float, int]] = []
+        # (начало, время вложенных импортов)
+        self._stack: List[List[float]] = []
+        self._resolving = False
+
+    @property
+    def installed(self) -> bool:
+        return self in sys.meta_path
+
+    def install(self) -> None:
+        if not self.installed:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self.installed:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        if self._resolving:
+            return None
+        # спрашиваем остальные искатели и подменяем загрузчик найденного модуля
+        self._resolving = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._resolving = False
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def enter(self) -> None:
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def exit(self, name: str) -> None:
+        started_at, nested = self._stack.pop()
+        cumulative = time.perf_counter() - started_at
+        if self._stack:
+            self._stack[-1][1] += cumulative
+        self.records.append((name, cumulative - nested, cumulative, len(self._stack)))
+
+    def top(self, limit: int = 25) -> List[Tuple[str, float, float, int]]:
+        return sorted(self.records, key=lambda record: record[2], reverse=True)[:limit]
+
+
+import_profiler = ImportProfiler()
+
+# (этап, длительность)
+phases: List[Tuple[str, float]] = []
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases.append((name, time.perf_counter() - started_at))
+
+
+def report(limit: int = 25) -> None:
+    if import_profiler.records:
+        logger.info('Slowest imports (self / cumulative, ms):')
+        for name, self_time, cumulative, depth in import_profiler.top(limit):
+            logger.info('%9.1f | %9.1f | %s%s', self_time * 1000, cumulative * 1000, '  ' * depth, name)
+        logger.info('%s modules imported', len(import_profiler.records))
+    for name, duration in phases:
+        logger.info('Startup phase %-20s %8.1f ms', name, duration * 1000)
+
+
+def mark_ready(ready_file: Optional[Path]) -> None:
+    """Сообщает о готовности принимать обновления: пишет в лог и создаёт файл для проверки здоровья"""
+    if ready_file is not None:
+        ready_file.touch()
+    logger.info('Ready in %.2f s', time.perf_counter() - STARTED_AT)
+
+
+def mark_not_ready(ready_file: Optional[Path]) -> None:
+    if ready_file is not None and ready_file.exists():
+        ready_file.unlink()
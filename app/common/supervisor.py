@@ -0,0 +1,282 @@
+"""
+Несколько процессов-обработчиков на одном сервере
+
+Супервизор получает обновления (опросом getUpdates или вебхуком) и раздаёт их процессам-обработчикам
+по hash(user_id) % N: все обновления пользователя попадают в один процесс, и состояние его диалогов
+остаётся в памяти этого процесса. Обновление передаётся обработчику строкой JSON в stdin, обработчик
+после фиксации транзакции отвечает строкой JSON в stdout.
+
+Упавший обработчик перезапускается, и неподтверждённые им обновления отправляются ему заново: если
+изменения первой попытки всё же были зафиксированы, вторую отбросит журнал обработанных обновлений
+(см. db.ledger). Общий лимит Telegram на бота делится между обработчиками поровну, периодические
+задачи выполняет только обработчик 0.
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from telegram import Update
+from telegram.ext import Updater
+
+from common.application import Application
+from common.metrics import WORKER_RESTARTS
+from config import settings
+from db.uow import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+# пауза перед перезапуском обработчика, упавшего сразу после запуска; удваивается до MAX_RESTART_DELAY
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+# сколько ждать подтверждения уже отправленных обработчикам обновлений при остановке
+SHUTDOWN_TIMEOUT = 30
+# обновление, при котором обработчик падает столько раз подряд, отбрасывается
+MAX_DELIVERIES = 3
+# обновление с документом или длинным текстом может быть больше 64 КиБ по умолчанию
+LINE_LIMIT = 2 ** 24
+
+Message = Dict[str, Any]
+
+
+def shard(update: Update, workers: int) -> int:
+    """Номер обработчика для обновления: по пользователю, для обновлений без пользователя - по чату"""
+    if update.effective_user is not None:
+        key = update.effective_user.id
+    elif update.effective_chat is not None:
+        key = update.effective_chat.id
+    else:
+        key = update.update_id
+    return hash(key) % workers
+
+
+def _send(message: Message) -> None:
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+class WorkerApplication(Application):
+    """Подтверждает супервизору каждое обработанное обновление"""
+
+    def update_processed(self, update: object, uow: UnitOfWork) -> None:
+        if isinstance(update, Update):
+            _send({'update_id': update.update_id, 'statements': uow.stats.statements, 'failed': uow.failed})
+
+
+async def serve_worker(application: Application) -> None:
+    """
+    Обрабатывает обновления из stdin, пока супервизор не закроет его
+
+    Приложение собирается без Updater и с application_class=WorkerApplication
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=LINE_LIMIT)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async with application:
+        if application.post_init is not None:
+            await application.post_init(application)
+        await application.start()
+        _send({'ready': True})
+        try:
+            async for line in reader:
+                await application.update_queue.put(Update.de_json(json.loads(line), application.bot))
+        finally:
+            # уже полученные обновления обрабатываются до конца
+            await application.stop()
+            if application.post_shutdown is not None:
+                await application.post_shutdown(application)
+
+
+class WorkerProcess:
+    """Процесс-обработчик: запуск, перезапуск после падения и обмен строками JSON"""
+
+    def __init__(self, index: int, command: List[str], on_message: Callable[['WorkerProcess', Message], None]):
+        """
+        :param command: команда запуска процесса, который вызывает serve_worker
+        :param on_message: вызывается на каждое сообщение обработчика (готовность, подтверждение)
+        """
+        self.index = index
+        self.command = command
+        self.on_message = on_message
+        self.ready = False
+        self.restarts = 0
+        self._queue: 'asyncio.Queue[Tuple[int, bytes]]' = asyncio.Queue()
+        # отправленные, но не подтверждённые обновления в порядке отправки
+        self._in_flight: Dict[int, bytes] = {}
+        self._deliveries: Dict[int, int] = {}
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def idle(self) -> bool:
+        return self._queue.empty() and not self._in_flight
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def send(self, update_id: int, line: bytes) -> None:
+        self._queue.put_nowait((update_id, line))
+
+    async def _run(self) -> None:
+        delay = RESTART_DELAY
+        while not self._stopping:
+            started_at = time.monotonic()
+            self._process = await asyncio.create_subprocess_exec(
+                *self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, limit=LINE_LIMIT,
+            )
+            writer = asyncio.create_task(self._write())
+            # подтверждения читаются до конца, иначе обновления, обработанные перед падением, ушли бы повторно
+            await self._read()
+            code = await self._process.wait()
+            writer.cancel()
+            self.ready = False
+            if self._stopping:
+                return
+
+            self.restarts += 1
+            WORKER_RESTARTS.inc()
+            logger.error(
+                'Worker %s exited with code %s, restarting; %s updates will be redelivered',
+                self.index, code, len(self._in_flight),
+            )
+            self._drop_poison()
+            if time.monotonic() - started_at < MAX_RESTART_DELAY:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RESTART_DELAY)
+            else:
+                delay = RESTART_DELAY
+
+    def _drop_poison(self) -> None:
+        for update_id in list(self._in_flight):
+            deliveries = self._deliveries[update_id] = self._deliveries.get(update_id, 1) + 1
+            if deliveries > MAX_DELIVERIES:
+                logger.error('Update %s dropped after %s worker crashes', update_id, MAX_DELIVERIES)
+                del self._in_flight[update_id]
+                del self._deliveries[update_id]
+
+    async def _write(self) -> None:
+        stdin = self._process.stdin
+        try:
+            for line in self._in_flight.values():
+                stdin.write(line)
+            while True:
+                update_id, line = await self._queue.get()
+                self._in_flight[update_id] = line
+                stdin.write(line)
+                await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # процесс упал, недоставленное останется в _in_flight до перезапуска
+            pass
+
+    async def _read(self) -> None:
+        async for line in self._process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.warning('Worker %s wrote to stdout: %r', self.index, line[:200])
+                continue
+            if message.get('ready'):
+                self.ready = True
+            else:
+                self._in_flight.pop(message['update_id'], None)
+                self._deliveries.pop(message['update_id'], None)
+            self.on_message(self, message)
+
+    async def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Дожидается обработки отправленных обновлений и закрывает stdin, обработчик завершается сам"""
+        deadline = time.monotonic() + timeout
+        while not self.idle and self._process is not None and self._process.returncode is None \
+                and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._stopping = True
+        if self._process is not None and self._process.returncode is None:
+            self._process.stdin.close()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), max(deadline - time.monotonic(), 1))
+        except asyncio.TimeoutError:
+            logger.error('Worker %s did not stop in time, killing it', self.index)
+            self._process.kill()
+            await self._task
+
+
+class Supervisor:
+
+    def __init__(
+        self,
+        workers: int,
+        command: Callable[[int], List[str]],
+        on_ready: Optional[Callable[[], None]] = None,
+        on_processed: Optional[Callable[[Message], None]] = None,
+    ):
+        """
+        :param command: команда запуска обработчика по его номеру
+        :param on_ready: вызывается, когда все обработчики впервые готовы
+        :param on_processed: вызывается на каждое подтверждение обработчика
+        """
+        self.workers = [WorkerProcess(index, command(index), self._on_message) for index in range(workers)]
+        self.on_ready = on_ready
+        self.on_processed = on_processed
+        self.dispatched = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._was_ready = False
+
+    def start(self, update_queue: 'asyncio.Queue[object]') -> None:
+        for worker in self.workers:
+            worker.start()
+        self._dispatcher = asyncio.create_task(self._dispatch(update_queue))
+
+    async def _dispatch(self, update_queue: 'asyncio.Queue[object]') -> None:
+        while True:
+            update = await update_queue.get()
+            if not isinstance(update, Update):
+                continue
+            worker = self.workers[shard(update, len(self.workers))]
+            worker.send(update.update_id, update.to_json().encode() + b'\n')
+            self.dispatched += 1
+
+    def _on_message(self, worker: WorkerProcess, message: Message) -> None:
+        if message.get('ready'):
+            if not self._was_ready and all(worker.ready for worker in self.workers):
+                self._was_ready = True
+                if self.on_ready is not None:
+                    self.on_ready()
+        elif self.on_processed is not None:
+            self.on_processed(message)
+
+    async def stop(self, update_queue: 'asyncio.Queue[object]') -> None:
+        """Раздаёт оставшиеся в очереди обновления и останавливает обработчики"""
+        while not update_queue.empty():
+            await asyncio.sleep(0.01)
+        self._dispatcher.cancel()
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+
+async def run_supervisor(updater: Updater, supervisor: Supervisor, stop: asyncio.Event) -> None:
+    """
+    Получает обновления до события stop: вебхуком, если задан WEBHOOK__URL, иначе опросом getUpdates
+
+    Обработчики запускаются до начала приёма обновлений, обновления до их готовности ждут в очереди
+    """
+    supervisor.start(updater.update_queue)
+    async with updater:
+        webhook = settings.WEBHOOK
+        if webhook.URL:
+            await updater.start_webhook(
+                listen=webhook.LISTEN,
+                port=webhook.PORT,
+                url_path=urlparse(webhook.URL).path.lstrip('/'),
+                webhook_url=webhook.URL,
+                secret_token=webhook.SECRET_TOKEN,
+            )
+        else:
+            await updater.start_polling()
+        try:
+            await stop.wait()
+        finally:
+            await updater.stop()
+            await supervisor.stop(updater.update_queue)
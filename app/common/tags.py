@@ -0,0 +1,38 @@
+"""
+Метки записей: слова с решёткой в заметке (#отпуск, #работа)
+
+Метки хранятся отдельно от заметки, в нижнем регистре, без повторов и по алфавиту.
+Запрос к записям по меткам - группы через | или «или»: внутри группы нужны все метки (И),
+запись подходит, если подходит хотя бы одна группа (ИЛИ). Например, «#отпуск #море | #работа»
+"""
+import re
+from typing import List, Optional
+
+TAG_RE = re.compile(r'#(\w+)')
+# метка вместе с пробелами перед ней, чтобы из «350 кофе #работа» осталось «350 кофе»
+TAG_WITH_SPACES_RE = re.compile(r'[ \t]*#\w+')
+QUERY_WORD_RE = re.compile(r'#?(\w+)')
+QUERY_OR_RE = re.compile(r'\||\b(?:или|or)\b', re.IGNORECASE)
+
+TAG_MAX_LENGTH = 64
+
+
+def _normalize(tags: List[str]) -> List[str]:
+    return sorted({tag.lower() for tag in tags if len(tag) <= TAG_MAX_LENGTH})
+
+
+def extract_tags(text: Optional[str]) -> Optional[List[str]]:
+    """:return: None, если меток нет"""
+    if not text:
+        return None
+    return _normalize(TAG_RE.findall(text)) or None
+
+
+def strip_tags(text: str) -> str:
+    return TAG_WITH_SPACES_RE.sub('', text).strip()
+
+
+def parse_tag_query(text: str) -> List[List[str]]:
+    """Группы меток из запроса, решётка необязательна: «отпуск море или работа» -> [[море, отпуск], [работа]]"""
+    groups = (_normalize(QUERY_WORD_RE.findall(part)) for part in QUERY_OR_RE.split(text))
+    return [group for group in groups if group]
@@ -0,0 +1,72 @@
+"""
+Шаблоны ответов бота
+
+Все шаблоны компилируются один раз при старте (compile_templates), байткод сохраняется между
+перезапусками в FileSystemBytecodeCache. Шаблоны без переменных рендерятся один раз и дальше
+отдаются готовой строкой
+"""
+import asyncio
+from typing import Dict, List
+
+from jinja2 import Template, meta
+
+from common import constants
+from config import settings
+
+environment = settings.JINJA_ENVIRONMENT
+environment.globals.update({name: value for name, value in vars(constants).items() if name.startswith('COMMAND_')})
+
+_templates: Dict[str, Template] = {}
+_static: Dict[str, str] = {}
+
+
+def _is_static(template_name: str) -> bool:
+    source, _, _ = environment.loader.get_source(environment, template_name)
+    return meta.find_undeclared_variables(environment.parse(source)) <= environment.globals.keys()
+
+
+def _compile(template_name: str) -> None:
+    template = _templates[template_name] = environment.get_template(template_name)
+    if _is_static(template_name):
+        _static[template_name] = template.render()
+
+
+def compile_templates() -> int:
+    """Компилирует все шаблоны и рендерит статические, возвращает количество шаблонов"""
+    for template_name in environment.list_templates(extensions=['html']):
+        _compile(template_name)
+    return len(_templates)
+
+
+async def compile_templates_async() -> int:
+    """
+    То же, что compile_templates, но между шаблонами отдаёт управление циклу событий,
+    чтобы параллельно шёл ввод-вывод (например, прогрев пула соединений). В отдельном потоке
+    компиляция не ускоряется: она упирается в GIL и только тормозит цикл событий
+    """
+    for template_name in environment.list_templates(extensions=['html']):
+        _compile(template_name)
+        await asyncio.sleep(0)
+    return len(_templates)
+
+
+def static_template_names() -> List[str]:
+    """Шаблоны, отрендеренные при компиляции"""
+    return sorted(_static)
+
+
+def get_template(template_name: str) -> Template:
+    if settings.DEBUG:
+        return environment.get_template(template_name)
+    template = _templates.get(template_name)
+    if template is None:
+        template = _templates[template_name] = environment.get_template(template_name)
+    return template
+
+
+def render_template(template_name: str, **context) -> str:
+    if not settings.DEBUG:
+        text = _static.get(template_name)
+        if text is not None:
+            return text
+    return get_template(template_name).render(**context)
@@ -1,6 +1,4 @@
-import re
-from decimal import Decimal, InvalidOperation
-from typing import Any, Optional, cast, Union, List
+from typing import Any, Optional, cast, List
 
 import telegram
 from sqlalchemy import select
@@ -15,26 +13,20 @@ from telegram import (
 from telegram._utils.types import ReplyMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 
-from common.constants import COMMAND_HELP
-from config import settings
+from common.templates import render_template
 from db import UserModel
-from db.base import async_session
-
-
-def render_template(template_name: str, **context) -> str:
-    return settings.JINJA_ENVIRONMENT.get_template(template_name).render(**context)
+from db.uow import commit_before_reply, get_session
 
 
 async def get_or_create_user(update: Update) -> UserModel:
     tg_user = update.effective_user
-    async with async_session() as session:
-        try:
-            user = (await session.execute(select(UserModel).filter_by(id=tg_user.id))).scalars().one()
-        except NoResultFound:
-            user = UserModel(id=tg_user.id)
-            session.add(user)
-
-            await session.commit()
+    session = get_session()
+    try:
+        user = (await session.execute(select(UserModel).filter_by(id=tg_user.id))).scalars().one()
+    except NoResultFound:
+        user = UserModel(id=tg_user.id)
+        session.add(user)
+        await session.flush()
     return user
 
 
@@ -58,30 +50,6 @@ def force_int(num: Any, default=0) -> int:
         return default
 
 
-def force_decimal(value, default_value: Any = Decimal('0')) -> Union[Decimal, Any]:
-    """
-    Изменение типа данных для value на Decimal
-    - Если в ходе вычислений произошла ошибка, то вернется дефолтное значение
-
-    :param value: Значение для каста
-    :param default_value: Дефолтное значение
-    :return: Decimal
-    """
-    if isinstance(value, Decimal):
-        return value
-
-    try:
-        if isinstance(value, (int, float)):
-            return Decimal(str(value))
-
-        value = re.sub(r'[^0-9.,]+', '', str(value))
-        value = value.replace(',', '.')
-        value = Decimal(value)
-    except (ValueError, TypeError, InvalidOperation):
-        value = default_value
-    return value
-
-
 async def delete_last_message(update: Update):
     if update.callback_query:
         await update.callback_query.delete_message()
@@ -90,6 +58,8 @@ async def delete_last_message(update: Update):
 
 
 async def edit_last_message(update: Update, text: str, reply_markup: Optional[ReplyMarkup] = None):
+    # ответ может сообщать об успешной записи, поэтому сначала фиксация (см. db.uow)
+    await commit_before_reply()
     if update.callback_query:
         return await update.callback_query.edit_message_text(
             text=text, parse_mode=telegram.constants.ParseMode.HTML, reply_markup=reply_markup,
@@ -106,6 +76,7 @@ async def send_response(
     response: str,
     reply_markup: Optional[ReplyMarkup] = None,
 ) -> Message:
+    await commit_before_reply()
 
     if update.message:
         return await update.message.reply_text(
@@ -124,11 +95,17 @@ async def send_response(
     return await context.bot.send_message(**args)
 
 
+def remember_message(context: ContextTypes.DEFAULT_TYPE, msg: Message) -> None:
+    """Запоминает сообщение с клавиатурой диалога, close его удалит; в user_data - только id, не объект"""
+    context.user_data['msg'] = (msg.chat_id, msg.message_id)
+
+
 async def close(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if 'msg' in context.user_data:
-        msg: Message = context.user_data['msg']
-        await msg.delete()
-        del context.user_data['msg']
+        chat_id, message_id = context.user_data['msg']
+        await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+    # иначе счета и категории с загруженными записями остаются в user_data до следующего диалога
+    await flush_user_data(update, context)
     return ConversationHandler.END
 
 
@@ -141,11 +118,16 @@ async def flush_user_data(update: Update, context: ContextTypes.DEFAULT_TYPE, ex
     context.user_data.update(new_data)
 
 
-def user_amount_to_db_amount(user_amount: str) -> Decimal:
-    thousands_factor = user_amount.count('k') + user_amount.count('к')
-    amount_to_dec = force_decimal(user_amount.replace('k', '').replace('к', ''))
-    amount = amount_to_dec * 10 ** (3 * thousands_factor)
-    return amount
+async def expire(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Диалог брошен и завершён по conversation_timeout: состояние из user_data больше не нужно
+
+    Вызывается из JobQueue вне единицы работы, поэтому в базу не обращается
+    """
+    user_id = context.user_data.get('user_id')
+    context.user_data.clear()
+    if user_id:
+        context.user_data['user_id'] = user_id
 
 
 def sep_titles(message: str) -> list:
@@ -164,7 +146,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await send_response(
         update=update,
         context=context,
-        response=f'Отмена операции.\nСправка тут: /{COMMAND_HELP}',
+        response=render_template('common/cancel.html'),
         reply_markup=ReplyKeyboardRemove(),
     )
     return ConversationHandler.END
@@ -1,33 +1,93 @@
-import json
-from contextlib import suppress
+import asyncio
 
-from sqlalchemy import insert
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from typing import List
+
+from sqlalchemy import BigInteger, ColumnElement, Integer, Select, any_, literal
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, Session
 
 from config import settings
+from db import routing, sqlite
+from db.metrics import TimedPool, instrument_engine
 
-engine = create_async_engine(settings.DSN.DATABASE_ASYNC, echo=False)
-async_session = async_sessionmaker(bind=engine, expire_on_commit=False)
+SQLITE = sqlite.is_sqlite(settings.DSN.DATABASE_ASYNC)
+# временная база, схему для неё создаёт warm_up
+MEMORY = SQLITE and sqlite.is_memory(settings.DSN.DATABASE_ASYNC)
 
-Base = declarative_base()
 
-cascade = 'all, delete-orphan'
+def _create_engine(url: str, name: str) -> AsyncEngine:
+    _engine = create_async_engine(url, echo=False, poolclass=TimedPool, pool_logging_name=name)
+    if SQLITE:
+        sqlite.install(_engine)
+    instrument_engine(_engine, name)
+    return _engine
+
+
+engine = _create_engine(sqlite.temporary_url() if MEMORY else settings.DSN.DATABASE_ASYNC, 'primary')
+if settings.DSN.DATABASE_REPLICA_ASYNC:
+    replica_engine = _create_engine(settings.DSN.DATABASE_REPLICA_ASYNC, 'replica')
+else:
+    replica_engine = engine
+
+
+def is_read_only(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """
+    Чтения идут в реплику, запись, чтения сессии после её записи и чтения сразу после записи
+    пользователя - в основную базу
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # сессия уже писала в основную базу, её чтения не должны видеть отстающую реплику
+        self.wrote = False
 
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or not is_read_only(clause):
+            self.wrote = True
+            routing.mark_write()
+            return engine.sync_engine
+        if self.wrote or routing.is_sticky():
+            return engine.sync_engine
+        return replica_engine.sync_engine
 
-async def load_test_fixtures():
-    fixtures = settings.PATHS.FIXTURES_DIR.rglob('*.json')
-    models = Base.__subclasses__()
 
-    for fixture in fixtures:
-        content = json.loads(fixture.read_bytes())
-        for data_pack in content:
-            model = next(filter(lambda m: data_pack['table'] == m.__tablename__, models))
-            rows = data_pack['rows']
+async def create_schema() -> None:
+    """Схема по моделям, без миграций: для базы в памяти, которую мигрировать некому"""
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def warm_up() -> None:
+    """Заранее открывает соединения пула, чтобы первые обновления не ждали подключения к базе"""
+    if MEMORY:
+        await create_schema()
+    for _engine in {engine, replica_engine}:
+        # первое соединение инициализирует диалект под блокировкой, параллельные подключения на нём зависают
+        first = await _engine.connect()
+        connections = [first, *await asyncio.gather(*(_engine.connect() for _ in range(_engine.pool.size() - 1)))]
+        # возвращённые соединения остаются открытыми в пуле
+        await asyncio.gather(*(connection.close() for connection in connections))
+
+
+async_session = async_sessionmaker(sync_session_class=RoutingSession, expire_on_commit=False)
+
+Base = declarative_base()
+
+# связи не загружаются неявно (lazy='raise', при необходимости - selectinload в запросе),
+# дочерние строки при удалении удаляет база по ON DELETE CASCADE (passive_deletes)
+cascade = 'all, delete-orphan'
+# в SQLite автоинкремент есть только у INTEGER PRIMARY KEY, он и так 64-битный
+IdType = BigInteger().with_variant(Integer(), 'sqlite')
+
 
-            for row in rows:
-                with suppress(IntegrityError):
-                    async with engine.connect() as connection:
-                        await connection.execute(insert(model).values(**row))
-                await engine.dispose()
+def in_ids(column, ids: List[int]) -> ColumnElement[bool]:
+    # один параметр-массив вместо списка параметров: текст запроса не зависит от числа ключей,
+    # в SQLite массивов нет - там IN (...)
+    if SQLITE:
+        return column.in_(ids)
+    return column == any_(literal(ids, ARRAY(BigInteger)))
@@ -0,0 +1,161 @@
+"""
+Дерево категорий: parent_id у категории и таблица замыкания category_closure
+
+В замыкании есть строка на каждую пару предок - потомок с расстоянием между ними, в том числе
+сама категория с depth = 0. Итог по категории со всеми подкатегориями - одно соединение замыкания
+с entry по индексу ix_entry_category_id, без рекурсивного обхода дерева на каждый отчёт.
+
+Замыкание меняется вместе с деревом: при создании категорий (add_to_tree), перемещении (move_category)
+и удалении (lift_children перед DELETE). Каждое изменение - несколько запросов INSERT ... SELECT,
+UPDATE или DELETE, число запросов не зависит от размера поддерева. Удаление категории не удаляет
+подкатегории: они переходят к её родителю.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select, true, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from common.money import Money
+from db import AccountModel, CategoryClosureModel, CategoryModel, EntryModel
+from db.base import in_ids
+from db.snapshots import CategorySnapshot
+
+PATH_SEPARATOR = ' > '
+
+
+async def add_to_tree(session: AsyncSession, category_ids: List[int]) -> None:
+    """Добавляет в замыкание новые категории, их родители уже должны быть в нём"""
+    closure = CategoryClosureModel
+    selves = select(
+        CategoryModel.id.label('ancestor_id'), CategoryModel.id.label('descendant_id'), literal(0).label('depth'),
+    ).where(in_ids(CategoryModel.id, category_ids))
+    ancestors = (
+        select(closure.ancestor_id, CategoryModel.id, closure.depth + 1)
+        .join(CategoryModel, CategoryModel.parent_id == closure.descendant_id)
+        .where(in_ids(CategoryModel.id, category_ids))
+    )
+    await session.execute(
+        insert(closure).from_select(['ancestor_id', 'descendant_id', 'depth'], union_all(selves, ancestors))
+    )
+
+
+async def move_category(session: AsyncSession, user_id: int, category_id: int, parent_id: Optional[int]) -> None:
+    """
+    Переносит категорию вместе с подкатегориями под parent_id, None - на верхний уровень
+
+    :raises ValueError: категории нет, parent_id не принадлежит пользователю или это она сама или её подкатегория
+    """
+    closure = CategoryClosureModel
+    if parent_id is not None:
+        parent = (await session.execute(
+            select(CategoryModel.id).where(CategoryModel.id == parent_id, CategoryModel.user_id == user_id)
+        )).first()
+        if parent is None:
+            raise ValueError(f'Category {parent_id} not found')
+        inside = (await session.execute(
+            select(closure.depth).where(closure.ancestor_id == category_id, closure.descendant_id == parent_id)
+        )).first()
+        if inside is not None:
+            raise ValueError(f'Category {category_id} cannot be moved into its own subtree')
+    result = await session.execute(
+        update(CategoryModel)
+        .where(CategoryModel.id == category_id, CategoryModel.user_id == user_id)
+        .values(parent_id=parent_id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise ValueError(f'Category {category_id} not found')
+
+    # поддерево теряет связи с прежними предками и получает связи с каждым предком нового родителя;
+    # подзапросы по той же таблице через псевдоним, иначе SQLAlchemy связал бы их с изменяемой таблицей
+    inner = aliased(closure)
+    subtree = select(inner.descendant_id).where(inner.ancestor_id == category_id)
+    await session.execute(
+        delete(closure)
+        .where(closure.descendant_id.in_(subtree), closure.ancestor_id.not_in(subtree))
+        .execution_options(synchronize_session=False)
+    )
+    if parent_id is not None:
+        above, below = aliased(closure), aliased(closure)
+        await session.execute(
+            insert(closure).from_select(
+                ['ancestor_id', 'descendant_id', 'depth'],
+                select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1)
+                # декартово произведение предков родителя и поддерева намеренное
+                .select_from(above).join(below, true())
+                .where(above.descendant_id == parent_id, below.ancestor_id == category_id),
+            )
+        )
+
+
+async def lift_children(session: AsyncSession, user_id: int, category_ids: List[int]) -> None:
+    """
+    Перед удалением категорий переносит их подкатегории к их родителям
+
+    Строки замыкания самих категорий удалит ON DELETE CASCADE, пути через них укорачиваются на один
+    """
+    closure, inner = CategoryClosureModel, aliased(CategoryClosureModel)
+    # по одной категории: если удаляются и родитель, и подкатегория, внуки поднимаются на два уровня
+    for category_id in category_ids:
+        parent_id = (await session.execute(
+            select(CategoryModel.parent_id).where(CategoryModel.id == category_id, CategoryModel.user_id == user_id)
+        )).scalar_one_or_none()
+        await session.execute(
+            update(CategoryModel)
+            .where(CategoryModel.parent_id == category_id, CategoryModel.user_id == user_id)
+            .values(parent_id=parent_id)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            update(closure)
+            .where(
+                closure.ancestor_id.in_(
+                    select(inner.ancestor_id).where(inner.descendant_id == category_id, inner.depth > 0)
+                ),
+                closure.descendant_id.in_(
+                    select(inner.descendant_id).where(inner.ancestor_id == category_id, inner.depth > 0)
+                ),
+            )
+            .values(depth=closure.depth - 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def subtree_totals(session: AsyncSession, user_id: int, category_id: int) -> List[Tuple[Money, str]]:
+    """Суммы записей категории со всеми подкатегориями по валютам счетов"""
+    closure = CategoryClosureModel
+    result = await session.execute(
+        select(AccountModel.currency, AccountModel.exponent, func.sum(EntryModel.amount))
+        .select_from(closure)
+        .join(EntryModel, EntryModel.category_id == closure.descendant_id)
+        .join(AccountModel, AccountModel.id == EntryModel.account_id)
+        .where(closure.ancestor_id == category_id, EntryModel.user_id == user_id)
+        .group_by(AccountModel.currency, AccountModel.exponent)
+        .order_by(AccountModel.currency)
+    )
+    # sum() по BIGINT в PostgreSQL - NUMERIC
+    return [(Money(int(total), exponent), currency) for currency, exponent, total in result]
+
+
+def children_of(categories: Iterable[CategorySnapshot], parent_id: Optional[int]) -> List[CategorySnapshot]:
+    return [category for category in categories if category.parent_id == parent_id]
+
+
+def subtree_ids(categories: Dict[int, CategorySnapshot], category_id: int) -> Set[int]:
+    """Категория и все её подкатегории среди уже загруженных категорий пользователя"""
+    subtree = {category_id}
+    level = {category_id}
+    while level:
+        level = {category.id for category in categories.values() if category.parent_id in level} - subtree
+        subtree |= level
+    return subtree
+
+
+def category_path(categories: Dict[int, CategorySnapshot], category_id: int) -> str:
+    titles = []
+    category = categories.get(category_id)
+    while category is not None:
+        titles.append(category.title)
+        category = categories.get(category.parent_id)
+    return PATH_SEPARATOR.join(reversed(titles))
@@ -0,0 +1,97 @@
+"""
+Удаление счетов и категорий одним DELETE по первичному ключу и объединение категорий
+
+Записи и переводы удаляет сама база по ON DELETE CASCADE, ORM их не загружает (passive_deletes).
+Переводы удалённого счёта меняли балансы других счетов, поэтому перед удалением эти балансы
+исправляются одним UPDATE по суммам переводов (в режиме проводок - одной вставкой проводок, см. db.postings).
+
+При объединении категорий записи переносятся одним UPDATE, а исходные категории удаляются одним DELETE,
+число запросов не зависит от числа записей. Подкатегории удаляемой категории переходят к её родителю
+(см. db.categories).
+"""
+from typing import List
+
+from sqlalchemy import delete, func, insert, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db import AccountModel, CategoryModel, EntryModel, PostingModel, TransferModel
+from db.base import in_ids
+from db.categories import lift_children
+
+
+async def delete_account(session: AsyncSession, user_id: int, account_id: int) -> None:
+    outgoing = (
+        select(TransferModel.account_to_id.label('account_id'), (-TransferModel.amount_to).label('amount'))
+        .where(TransferModel.account_from_id == account_id)
+    )
+    incoming = (
+        select(TransferModel.account_from_id.label('account_id'), TransferModel.amount_from.label('amount'))
+        .where(TransferModel.account_to_id == account_id)
+    )
+    transfers = union_all(outgoing, incoming).subquery()
+    # несколько переводов с одним счётом: UPDATE ... FROM по несгруппированным строкам применил бы только один
+    balance_changes = (
+        select(transfers.c.account_id, func.sum(transfers.c.amount).label('amount'))
+        .group_by(transfers.c.account_id)
+        .subquery()
+    )
+    if settings.POSTINGS.ENABLED:
+        await session.execute(
+            insert(PostingModel).from_select(
+                ['account_id', 'amount'],
+                select(balance_changes.c.account_id, balance_changes.c.amount)
+                .join(AccountModel, AccountModel.id == balance_changes.c.account_id)
+                .where(AccountModel.user_id == user_id),
+            )
+        )
+    else:
+        await session.execute(
+            update(AccountModel)
+            .where(AccountModel.id == balance_changes.c.account_id, AccountModel.user_id == user_id)
+            .values(amount=AccountModel.amount + balance_changes.c.amount)
+            .execution_options(synchronize_session=False)
+        )
+    await session.execute(
+        delete(AccountModel)
+        .where(AccountModel.id == account_id, AccountModel.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def delete_category(session: AsyncSession, user_id: int, category_id: int) -> None:
+    await lift_children(session, user_id, [category_id])
+    await session.execute(
+        delete(CategoryModel)
+        .where(CategoryModel.id == category_id, CategoryModel.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def merge_categories(session: AsyncSession, user_id: int, source_ids: List[int], target_id: int) -> int:
+    """
+    Переносит записи исходных категорий в целевую и удаляет исходные
+
+    :return: сколько записей перенесено
+    :raises ValueError: целевая категория - одна из исходных или не принадлежит пользователю
+    """
+    if target_id in source_ids:
+        raise ValueError(f'Category {target_id} cannot be merged into itself')
+    target = (await session.execute(
+        select(CategoryModel.id).where(CategoryModel.id == target_id, CategoryModel.user_id == user_id)
+    )).first()
+    if target is None:
+        raise ValueError(f'Category {target_id} not found')
+    result = await session.execute(
+        update(EntryModel)
+        .where(in_ids(EntryModel.category_id, source_ids), EntryModel.user_id == user_id)
+        .values(category_id=target_id)
+        .execution_options(synchronize_session=False)
+    )
+    await lift_children(session, user_id, source_ids)
+    await session.execute(
+        delete(CategoryModel)
+        .where(in_ids(CategoryModel.id, source_ids), CategoryModel.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
@@ -0,0 +1,272 @@
+"""
+Загрузка фикстур и генерация синтетических данных для бенчмарков
+
+    python -m db.fixtures load [fixture.json ...]
+    python -m db.fixtures seed --users 10000 --entries 500
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Table, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import settings
+from db import Base
+from db.base import SQLITE, engine
+
+insert = sqlite.insert if SQLITE else postgresql.insert
+
+# синтетические пользователи не должны пересекаться с настоящими id из Telegram
+SYNTHETIC_USER_ID_BASE = 10 ** 12
+
+
+def read_fixtures(paths: Iterable[Path]) -> Dict[str, List[dict]]:
+    rows_by_table = defaultdict(list)
+    for path in paths:
+        for data_pack in json.loads(path.read_bytes()):
+            rows_by_table[data_pack['table']].extend(data_pack['rows'])
+
+    unknown_tables = set(rows_by_table) - set(Base.metadata.tables)
+    if unknown_tables:
+        raise ValueError(f'Unknown tables in fixtures: {", ".join(sorted(unknown_tables))}')
+    return rows_by_table
+
+
+def _columns_key(row: dict) -> Tuple[str, ...]:
+    return tuple(sorted(row))
+
+
+async def _reset_sequence(connection: AsyncConnection, table: Table) -> None:
+    """После вставки явных id последовательность нужно сдвинуть за максимальный id"""
+    if SQLITE or 'id' not in table.c:
+        # в SQLite следующий id и так берётся после максимального
+        return
+    table_name = connection.dialect.identifier_preparer.format_table(table)
+    await connection.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence(:table_name, 'id'), max(id)) "
+            f"FROM {table_name} HAVING count(*) > 0"
+        ),
+        {'table_name': table_name},
+    )
+
+
+async def _reserve_ids(connection: AsyncConnection, table_name: str, count: int) -> int:
+    """Резервирует в последовательности блок из count идентификаторов и возвращает первый"""
+    first_id = (await connection.execute(
+        text('SELECT nextval(pg_get_serial_sequence(:table_name, :column))'),
+        {'table_name': table_name, 'column': 'id'},
+    )).scalar_one()
+    await connection.execute(
+        text('SELECT setval(pg_get_serial_sequence(:table_name, :column), :last_id)'),
+        {'table_name': table_name, 'column': 'id', 'last_id': first_id + count - 1},
+    )
+    return first_id
+
+
+async def load_fixtures(paths: Iterable[Path]) -> Dict[str, int]:
+    """
+    Загрузка фикстур одной транзакцией
+
+    Таблицы заполняются в порядке зависимостей по внешним ключам, каждая одним executemany,
+    уже существующие строки пропускаются (ON CONFLICT DO NOTHING)
+
+    :param paths: пути к json-файлам фикстур
+    :return: количество строк по таблицам
+    """
+    rows_by_table = read_fixtures(paths)
+    loaded = {}
+
+    async with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            rows = rows_by_table.get(table.name)
+            if not rows:
+                continue
+            # executemany требует одинаковый набор колонок во всех строках
+            rows_by_columns = defaultdict(list)
+            for row in rows:
+                rows_by_columns[_columns_key(row)].append(row)
+            for rows_pack in rows_by_columns.values():
+                await connection.execute(insert(table).on_conflict_do_nothing(), rows_pack)
+            await _reset_sequence(connection, table)
+            loaded[table.name] = len(rows)
+
+    return loaded
+
+
+async def load_test_fixtures() -> Dict[str, int]:
+    return await load_fixtures(sorted(settings.PATHS.FIXTURES_DIR.rglob('*.json')))
+
+
+async def seed_synthetic(
+    users: int,
+    accounts: int = 3,
+    categories: int = 20,
+    entries: int = 1000,
+    transfers: int = 50,
+    days: int = 365,
+    tags: int = 50,
+    tagged: float = 0.2,
+    seed: int = 0,
+) -> Dict[str, int]:
+    """
+    Генерация синтетического журнала через COPY
+
+    Идентификаторы счетов и категорий резервируются блоком в последовательностях,
+    записи и переводы генерируются лениво и не держатся в памяти целиком,
+    балансы счетов выставляются одним UPDATE в конце
+
+    :param users: количество пользователей
+    :param accounts: счетов на пользователя
+    :param categories: категорий на пользователя
+    :param entries: записей на пользователя
+    :param transfers: переводов на пользователя
+    :param days: глубина истории в днях
+    :param tags: сколько разных меток, частота метки убывает с номером (закон Ципфа)
+    :param tagged: доля записей с метками, у такой записи от одной до трёх меток
+    :param seed: зерно генератора случайных чисел
+    :return: количество строк по таблицам
+    """
+    if SQLITE:
+        raise ValueError('Synthetic data is generated with COPY, use PostgreSQL')
+    rnd = random.Random(seed)
+    now = datetime.now(tz=timezone.utc)
+    balances = defaultdict(int)
+
+    def random_date() -> datetime:
+        return now - timedelta(seconds=rnd.randrange(days * 24 * 60 * 60))
+
+    def random_amount() -> int:
+        return rnd.randrange(100, 5000000)
+
+    tag_pool = [f'метка{n + 1}' for n in range(tags)]
+    tag_weights = [1 / (n + 1) for n in range(tags)]
+
+    def random_tags() -> Optional[List[str]]:
+        if not tag_pool or rnd.random() >= tagged:
+            return None
+        return sorted(set(rnd.choices(tag_pool, tag_weights, k=rnd.randint(1, 3))))
+
+    def iter_entries(user_ids: range, first_account_id: int, first_category_id: int) -> Iterator[tuple]:
+        for i, user_id in enumerate(user_ids):
+            for _ in range(entries):
+                account_id = first_account_id + i * accounts + rnd.randrange(accounts)
+                category_id = first_category_id + i * categories + rnd.randrange(categories)
+                amount = random_amount() if rnd.random() < 0.1 else -random_amount()
+                balances[account_id] += amount
+                yield amount, None, random_tags(), user_id, category_id, account_id, random_date()
+
+    def iter_transfers(user_ids: range, first_account_id: int) -> Iterator[tuple]:
+        for i, user_id in enumerate(user_ids):
+            for _ in range(transfers):
+                account_from_id, account_to_id = (
+                    first_account_id + i * accounts + n for n in rnd.sample(range(accounts), 2)
+                )
+                amount = random_amount()
+                balances[account_from_id] -= amount
+                balances[account_to_id] += amount
+                yield amount, amount, account_from_id, account_to_id, user_id, random_date()
+
+    async with engine.begin() as connection:
+        first_user_id = (await connection.execute(
+            text('SELECT greatest(coalesce(max(id), 0), :base) + 1 FROM "user"'), {'base': SYNTHETIC_USER_ID_BASE},
+        )).scalar_one()
+        user_ids = range(first_user_id, first_user_id + users)
+        first_account_id = await _reserve_ids(connection, 'account', users * accounts)
+        first_category_id = await _reserve_ids(connection, 'category', users * categories)
+
+        copy = (await connection.get_raw_connection()).driver_connection.copy_records_to_table
+        await copy('user', records=((user_id,) for user_id in user_ids), columns=['id'])
+        await copy(
+            'account',
+            records=(
+                (first_account_id + i * accounts + n, f'Счёт {n + 1}', 0, user_id, 'руб')
+                for i, user_id in enumerate(user_ids) for n in range(accounts)
+            ),
+            columns=['id', 'title', 'amount', 'user_id', 'currency'],
+        )
+        await copy(
+            'category',
+            records=(
+                (first_category_id + i * categories + n, f'Категория {n + 1}', False, user_id)
+                for i, user_id in enumerate(user_ids) for n in range(categories)
+            ),
+            columns=['id', 'title', 'disabled', 'user_id'],
+        )
+        await copy(
+            'category_closure',
+            records=((n, n, 0) for n in range(first_category_id, first_category_id + users * categories)),
+            columns=['ancestor_id', 'descendant_id', 'depth'],
+        )
+        await copy(
+            'entry',
+            records=iter_entries(user_ids, first_account_id, first_category_id),
+            columns=['amount', 'title', 'tags', 'user_id', 'category_id', 'account_id', 'date_created'],
+        )
+        if accounts > 1:
+            await copy(
+                'transfer',
+                records=iter_transfers(user_ids, first_account_id),
+                columns=['amount_from', 'amount_to', 'account_from_id', 'account_to_id', 'user_id', 'date_created'],
+            )
+
+        await connection.execute(
+            text(
+                'UPDATE account SET amount = balance.amount '
+                'FROM unnest(CAST(:ids AS BIGINT[]), CAST(:amounts AS BIGINT[])) AS balance (id, amount) '
+                'WHERE account.id = balance.id'
+            ),
+            {'ids': list(balances), 'amounts': list(balances.values())},
+        )
+
+    return {
+        'user': users,
+        'account': users * accounts,
+        'category': users * categories,
+        'category_closure': users * categories,
+        'entry': users * entries,
+        'transfer': users * transfers if accounts > 1 else 0,
+    }
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, int]:
+    try:
+        if args.command == 'load':
+            return await load_fixtures(args.paths) if args.paths else await load_test_fixtures()
+        kwargs = {k: v for k, v in vars(args).items() if k != 'command'}
+        return await seed_synthetic(**kwargs)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    load_parser = subparsers.add_parser('load', help='загрузить фикстуры')
+    load_parser.add_argument('paths', nargs='*', type=Path)
+
+    seed_parser = subparsers.add_parser('seed', help='сгенерировать синтетические данные')
+    seed_parser.add_argument('--users', type=int, default=1000)
+    seed_parser.add_argument('--accounts', type=int, default=3)
+    seed_parser.add_argument('--categories', type=int, default=20)
+    seed_parser.add_argument('--entries', type=int, default=1000)
+    seed_parser.add_argument('--transfers', type=int, default=50)
+    seed_parser.add_argument('--days', type=int, default=365)
+    seed_parser.add_argument('--tags', type=int, default=50)
+    seed_parser.add_argument('--tagged', type=float, default=0.2)
+    seed_parser.add_argument('--seed', type=int, default=0)
+
+    for table_name, count in asyncio.run(_run(parser.parse_args())).items():
+        print(f'{table_name}: {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+import codecs
+import csv
+import io
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import IO, Iterator, List, Optional, Tuple
+
+from itertools import islice
+
+from sqlalchemy import BigInteger, Column, DateTime, MetaData, String, Table, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from common.money import Money
+from config import settings
+from db.base import SQLITE
+from db.postings import get_balance
+
+IMPORT_TABLE = 'entry_import'
+IMPORT_COLUMNS = ['date_created', 'amount', 'category', 'title']
+IMPORT_DEFAULT_CATEGORY = 'Импорт'
+
+DATE_FORMATS = (
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d %H:%M:%S',
+    '%d.%m.%Y',
+    '%d.%m.%Y %H:%M',
+    '%d.%m.%Y %H:%M:%S',
+)
+
+SQL__CREATE_IMPORT_TABLE = f'''
+    CREATE TEMPORARY TABLE {IMPORT_TABLE} (
+        date_created TIMESTAMP WITH TIME ZONE NOT NULL,
+        amount BIGINT NOT NULL,
+        category VARCHAR(255) NOT NULL,
+        title VARCHAR(255)
+    ) ON COMMIT DROP
+'''
+
+SQL__ACCOUNT_EXPONENT = '''
+    SELECT exponent FROM account WHERE id = :account_id AND user_id = :user_id
+'''
+
+SQL__CREATE_CATEGORIES = f'''
+    INSERT INTO category (title, user_id, disabled)
+    SELECT DISTINCT s.category, CAST(:user_id AS BIGINT), false FROM {IMPORT_TABLE} s
+    ON CONFLICT (title, user_id) DO NOTHING
+'''
+
+# новые категории импорта - корни дерева (см. db.categories), запрос общий для PostgreSQL и SQLite
+SQL__ADD_CATEGORIES_TO_TREE = f'''
+    INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+    SELECT c.id, c.id, 0 FROM category c
+    WHERE c.user_id = :user_id AND c.title IN (SELECT s.category FROM {IMPORT_TABLE} s)
+    ON CONFLICT DO NOTHING
+'''
+
+# дубликаты (в т.ч. внутри самого файла) определяются по (счёт, дата, сумма, хэш заметки),
+# поиск идёт по индексу ix_entry_dedup, баланс счёта обновляется один раз на весь импорт
+SQL__INSERT_ENTRIES = f'''
+    WITH inserted AS (
+        INSERT INTO entry (amount, title, user_id, category_id, account_id, date_created)
+        SELECT DISTINCT ON (s.date_created, s.amount, md5(coalesce(s.title, '')))
+            s.amount, s.title, CAST(:user_id AS BIGINT), c.id, CAST(:account_id AS BIGINT), s.date_created
+        FROM {IMPORT_TABLE} s
+        JOIN category c ON c.user_id = :user_id AND c.title = s.category
+        WHERE NOT EXISTS (
+            SELECT 1 FROM entry e
+            WHERE e.account_id = :account_id
+              AND e.date_created = s.date_created
+              AND e.amount = s.amount
+              AND md5(coalesce(e.title, '')) = md5(coalesce(s.title, ''))
+        )
+        RETURNING amount
+    ),
+    totals AS (SELECT count(*) AS inserted, coalesce(sum(amount), 0) AS amount FROM inserted)
+'''
+
+SQL__MERGE_ENTRIES = SQL__INSERT_ENTRIES + '''
+    UPDATE account SET amount = account.amount + totals.amount
+    FROM totals
+    WHERE account.id = :account_id AND account.user_id = :user_id
+    RETURNING totals.inserted, account.amount
+'''
+
+# в режиме проводок (см. db.postings) вместо обновления баланса - одна проводка на сумму импорта
+SQL__MERGE_ENTRIES__POSTINGS = SQL__INSERT_ENTRIES + ''',
+    posted AS (
+        INSERT INTO posting (account_id, amount)
+        SELECT account.id, totals.amount FROM account, totals
+        WHERE account.id = :account_id AND account.user_id = :user_id AND totals.inserted > 0
+    )
+    SELECT inserted FROM totals
+'''
+
+# в SQLite нет COPY, DISTINCT ON и UPDATE с CTE: строки вставляются пачками через типизированную
+# временную таблицу (даты и суммы хранятся в том же виде, что и у ORM), дубликаты внутри файла
+# отбрасывает GROUP BY, а баланс обновляется отдельным запросом по суммам вставленных записей
+SQLITE__BATCH_SIZE = 1000
+SQLITE__IMPORT_TABLE = Table(
+    IMPORT_TABLE,
+    MetaData(),
+    Column('date_created', DateTime(timezone=True), nullable=False),
+    Column('amount', BigInteger, nullable=False),
+    Column('category', String(255), nullable=False),
+    Column('title', String(255)),
+    prefixes=['TEMPORARY'],
+)
+
+SQLITE__CREATE_CATEGORIES = f'''
+    INSERT OR IGNORE INTO category (title, user_id, disabled)
+    SELECT DISTINCT s.category, :user_id, 0 FROM {IMPORT_TABLE} s
+'''
+
+SQLITE__INSERT_ENTRIES = f'''
+    INSERT INTO entry (amount, title, user_id, category_id, account_id, date_created)
+    SELECT s.amount, s.title, :user_id, c.id, :account_id, s.date_created
+    FROM {IMPORT_TABLE} s
+    JOIN category c ON c.user_id = :user_id AND c.title = s.category
+    WHERE NOT EXISTS (
+        SELECT 1 FROM entry e
+        WHERE e.account_id = :account_id
+          AND e.date_created = s.date_created
+          AND e.amount = s.amount
+          AND md5(coalesce(e.title, '')) = md5(coalesce(s.title, ''))
+    )
+    GROUP BY s.date_created, s.amount, md5(coalesce(s.title, ''))
+    RETURNING amount
+'''
+
+SQLITE__UPDATE_BALANCE = '''
+    UPDATE account SET amount = amount + :amount
+    WHERE id = :account_id AND user_id = :user_id
+    RETURNING amount
+'''
+
+SQLITE__INSERT_POSTING = '''
+    INSERT INTO posting (account_id, amount)
+    SELECT id, :amount FROM account
+    WHERE id = :account_id AND user_id = :user_id
+'''
+
+
+@dataclass
+class ImportStats:
+    parsed: int = 0
+    invalid: int = 0
+    inserted: int = 0
+    balance: Optional[Money] = None
+
+    @property
+    def duplicates(self) -> int:
+        return self.parsed - self.inserted
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Выписки выгружаются либо в utf-8, либо в cp1251"""
+    try:
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return 'cp1251'
+    return 'utf-8-sig'
+
+
+def detect_delimiter(sample: str) -> str:
+    """Запятая часто встречается в суммах, поэтому точка с запятой и табуляция в приоритете"""
+    first_line = next(iter(sample.splitlines()), '')
+    for delimiter in (';', '\t'):
+        if delimiter in first_line:
+            return delimiter
+    return ','
+
+
+def parse_date(value: str) -> Optional[datetime]:
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_amount(value: str, exponent: int) -> Optional[int]:
+    """Сумма со знаком в минорных единицах: расходы в выписках отрицательные, общий парсер знак отбрасывает"""
+    value = value.strip().replace(' ', '').replace('\xa0', '')
+    negative = value.startswith(('-', '−'))
+    amount = Money.parse(value.lower(), exponent)
+    if not amount:
+        return None
+    return -amount.minor if negative else amount.minor
+
+
+def parse_row(row: List[str], exponent: int) -> Optional[Tuple[datetime, int, str, Optional[str]]]:
+    """Строка выписки: дата, сумма, категория (необязательно), заметка (необязательно)"""
+    if len(row) < 2:
+        return None
+    date_created, amount = parse_date(row[0]), parse_amount(row[1], exponent)
+    if date_created is None or amount is None:
+        return None
+    category = (row[2].strip() if len(row) > 2 else '') or IMPORT_DEFAULT_CATEGORY
+    title = (row[3].strip() if len(row) > 3 else '') or None
+    return date_created, amount, category[:255], title[:255] if title else None
+
+
+def iter_records(
+    stream: IO[str], stats: ImportStats, exponent: int,
+) -> Iterator[Tuple[datetime, int, str, Optional[str]]]:
+    """Построчный разбор CSV, файл целиком в список записей не материализуется"""
+    delimiter = detect_delimiter(stream.read(4096))
+    stream.seek(0)
+
+    reader = csv.reader(stream, delimiter=delimiter)
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        record = parse_row(row, exponent)
+        if record is None:
+            # первая строка может оказаться заголовком
+            if reader.line_num > 1:
+                stats.invalid += 1
+            continue
+        stats.parsed += 1
+        yield record
+
+
+async def _merge_postgresql(connection: AsyncConnection, records: Iterator[tuple], stats: ImportStats,
+                            params: dict) -> None:
+    await connection.execute(text(SQL__CREATE_IMPORT_TABLE))
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        IMPORT_TABLE, records=records, columns=IMPORT_COLUMNS,
+    )
+    if not stats.parsed:
+        return
+
+    await connection.execute(text(SQL__CREATE_CATEGORIES), params)
+    await connection.execute(text(SQL__ADD_CATEGORIES_TO_TREE), params)
+    if settings.POSTINGS.ENABLED:
+        stats.inserted = (await connection.execute(text(SQL__MERGE_ENTRIES__POSTINGS), params)).scalar_one()
+        stats.balance = await get_balance(connection, params['account_id'])
+    else:
+        stats.inserted, stats.balance = (await connection.execute(text(SQL__MERGE_ENTRIES), params)).one()
+
+
+async def _merge_sqlite(connection: AsyncConnection, records: Iterator[tuple], stats: ImportStats,
+                        params: dict) -> None:
+    await connection.run_sync(SQLITE__IMPORT_TABLE.create)
+    while batch := [dict(zip(IMPORT_COLUMNS, record)) for record in islice(records, SQLITE__BATCH_SIZE)]:
+        await connection.execute(SQLITE__IMPORT_TABLE.insert(), batch)
+
+    if stats.parsed:
+        await connection.execute(text(SQLITE__CREATE_CATEGORIES), params)
+        await connection.execute(text(SQL__ADD_CATEGORIES_TO_TREE), params)
+        amounts = (await connection.execute(text(SQLITE__INSERT_ENTRIES), params)).scalars().all()
+        stats.inserted = len(amounts)
+        total = {**params, 'amount': sum(amounts)}
+        if settings.POSTINGS.ENABLED:
+            if amounts:
+                await connection.execute(text(SQLITE__INSERT_POSTING), total)
+            stats.balance = await get_balance(connection, params['account_id'])
+        else:
+            stats.balance = (await connection.execute(text(SQLITE__UPDATE_BALANCE), total)).scalar_one()
+    # временная таблица живёт до закрытия соединения, а соединение вернётся в пул
+    await connection.run_sync(SQLITE__IMPORT_TABLE.drop)
+
+
+async def import_entries(session: AsyncSession, user_id: int, account_id: int, content: bytes) -> Optional[ImportStats]:
+    """
+    Загрузка выписки через COPY во временную таблицу и слияние с entry одним запросом
+
+    Выполняется в транзакции сессии единицы работы (db.uow): повторно доставленное обновление
+    откатывается по журналу обработанных обновлений, а не только отбрасывается проверкой дубликатов
+
+    :return: None, если счёта нет или он не принадлежит пользователю
+    """
+    stats = ImportStats()
+    stream = io.TextIOWrapper(io.BytesIO(content), encoding=detect_encoding(content[:4096]), newline='')
+    params = {'user_id': user_id, 'account_id': account_id}
+
+    connection = await session.connection()
+    # суммы выписки - в валюте счёта
+    exponent = (await connection.execute(text(SQL__ACCOUNT_EXPONENT), params)).scalar_one_or_none()
+    if exponent is None:
+        return None
+    merge = _merge_sqlite if SQLITE else _merge_postgresql
+    await merge(connection, iter_records(stream, stats, exponent), stats, params)
+
+    if stats.balance is not None:
+        stats.balance = Money(stats.balance, exponent)
+    return stats
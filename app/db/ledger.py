@@ -0,0 +1,69 @@
+"""
+Журнал обработанных обновлений: повторно доставленное обновление не записывает изменения второй раз
+
+Telegram доставляет обновление снова, если бот не подтвердил его (упал после фиксации транзакции,
+но до следующего getUpdates, или вебхук ответил ошибкой), а при нескольких обработчиках одно обновление
+может обрабатываться одновременно. Ключ обновления записывается в той же транзакции, что и его изменения,
+непосредственно перед фиксацией и только если изменения есть: INSERT ... ON CONFLICT DO NOTHING.
+Если ключ уже есть, транзакция откатывается; одновременная вставка того же ключа ждёт фиксации
+или отката первой. Обновления без записи в базу в журнал не попадают и ничего не стоят.
+
+Изменения фиксируются перед ответом пользователю (db.uow.commit_before_reply), поэтому при повторной
+обработке ответ об успешной записи не отправляется; ответы обновлений без записи отправляются снова.
+Записи старше PROCESSED_UPDATES_TTL удаляются периодической задачей: Telegram хранит
+неподтверждённые обновления не дольше суток.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.ext import ContextTypes
+
+from config import settings
+from db import ProcessedUpdateModel
+from db.base import SQLITE, async_session
+
+logger = logging.getLogger(__name__)
+
+insert = sqlite.insert if SQLITE else postgresql.insert
+
+UpdateKey = Tuple[int, int]
+
+
+async def record(session: AsyncSession, key: UpdateKey) -> bool:
+    """
+    Отмечает обновление обработанным в текущей транзакции
+
+    :return: False, если обновление уже было обработано
+    """
+    update_id, message_id = key
+    result = await session.execute(
+        insert(ProcessedUpdateModel)
+        .values(update_id=update_id, message_id=message_id)
+        .on_conflict_do_nothing()
+    )
+    return result.rowcount == 1
+
+
+async def purge(ttl: Optional[float] = None) -> int:
+    """
+    Удаляет записи старше ttl секунд
+
+    :return: сколько записей удалено
+    """
+    ttl = settings.PROCESSED_UPDATES_TTL if ttl is None else ttl
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl)
+    async with async_session() as session, session.begin():
+        result = await session.execute(
+            delete(ProcessedUpdateModel).where(ProcessedUpdateModel.date_created < cutoff)
+        )
+    return result.rowcount
+
+
+async def purge_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    deleted = await purge()
+    if deleted:
+        logger.info('Purged %s processed updates', deleted)
@@ -0,0 +1,148 @@
+"""
+Объединение одинаковых запросов от одновременно обрабатываемых обновлений (по образцу DataLoader)
+
+Ключи, запрошенные в пределах одного тика, загружаются одним запросом WHERE user_id = ANY(:ids)
+(в SQLite массивов нет - WHERE user_id IN (...)), результат раздаётся всем ожидающим корутинам.
+Если других обновлений сейчас не обрабатывается, объединять не с чем: запрос сразу выполняется
+в сессии единицы работы, без ожидания тика и без второго соединения из пула
+"""
+import asyncio
+import contextvars
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Sequence, TypeVar
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import AccountModel, CategoryModel, routing
+from db.base import async_session, in_ids
+from db.postings import accounts_with_balances, select_accounts
+from db.uow import active_units_of_work, current_unit_of_work, get_session
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class BatchLoader(Generic[K, V]):
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[K]], Awaitable[Dict[K, V]]],
+        default: Callable[[], V],
+        tick: float = 0.002,
+        max_batch_size: int = 500,
+    ):
+        """
+        :param batch_fn: загрузка значений по списку ключей
+        :param default: значение для ключей, которых нет в результате batch_fn
+        :param tick: сколько секунд собирать ключи перед запросом
+        :param max_batch_size: при таком количестве ключей запрос выполняется не дожидаясь конца тика
+        """
+        self.batch_fn = batch_fn
+        self.default = default
+        self.tick = tick
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self._pending: Dict[K, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def load(self, key: K) -> V:
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = loop.create_future()
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                # пустой контекст: запрос не должен попасть в единицу работы первого из ожидающих
+                self._timer = loop.call_later(self.tick, self._dispatch, context=contextvars.Context())
+        # отмена одного из ожидающих не должна отменять загрузку для остальных
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        self.batches += 1
+        contextvars.Context().run(asyncio.get_running_loop().create_task, self._run(pending))
+
+    async def _run(self, pending: Dict[K, asyncio.Future]) -> None:
+        try:
+            results = await self.batch_fn(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(results.get(key) if key in results else self.default())
+
+
+def _group_by_user(objects: Sequence) -> Dict[int, list]:
+    grouped = defaultdict(list)
+    for obj in objects:
+        grouped[obj.user_id].append(obj)
+    return grouped
+
+
+async def _load_accounts(user_ids: List[int]) -> Dict[int, List[AccountModel]]:
+    async with async_session() as session:
+        accounts = accounts_with_balances(await session.execute(
+            select_accounts()
+            .where(in_ids(AccountModel.user_id, user_ids))
+            .order_by(AccountModel.id)
+        ))
+    return _group_by_user(accounts)
+
+
+async def _load_categories(user_ids: List[int]) -> Dict[int, List[CategoryModel]]:
+    async with async_session() as session:
+        categories = (await session.execute(
+            select(CategoryModel)
+            .where(in_ids(CategoryModel.user_id, user_ids))
+            .order_by(CategoryModel.id)
+        )).scalars().all()
+    return _group_by_user(categories)
+
+
+accounts_loader: BatchLoader[int, List[AccountModel]] = BatchLoader(_load_accounts, default=list)
+categories_loader: BatchLoader[int, List[CategoryModel]] = BatchLoader(_load_categories, default=list)
+
+
+def _can_batch() -> bool:
+    """
+    Общий запрос выполняется в отдельной сессии и не видит незафиксированных изменений текущего обновления,
+    а после записи сессии или пользователя читать нужно из основной базы, а не из реплики
+    """
+    uow = current_unit_of_work()
+    if uow is not None and (uow.has_writes or uow.wrote or active_units_of_work() == 1):
+        return False
+    return not routing.is_sticky()
+
+
+async def load_user_accounts(session: AsyncSession, user_id: int) -> List[AccountModel]:
+    """Счета одного пользователя без объединения запросов"""
+    return accounts_with_balances(await session.execute(
+        select_accounts().where(AccountModel.user_id == user_id).order_by(AccountModel.id)
+    ))
+
+
+async def load_user_categories(session: AsyncSession, user_id: int) -> List[CategoryModel]:
+    """Категории одного пользователя без объединения запросов"""
+    return (await session.execute(
+        select(CategoryModel).filter_by(user_id=user_id).order_by(CategoryModel.id)
+    )).scalars().all()
+
+
+async def get_accounts(user_id: int) -> List[AccountModel]:
+    if _can_batch():
+        return await accounts_loader.load(user_id)
+    return await load_user_accounts(get_session(), user_id)
+
+
+async def get_categories(user_id: int) -> List[CategoryModel]:
+    if _can_batch():
+        return await categories_loader.load(user_id)
+    return await load_user_categories(get_session(), user_id)
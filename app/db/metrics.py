@@ -0,0 +1,48 @@
+"""
+Метрики базы: длительность SQL-запросов и ожидание соединения из пула
+"""
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from common.metrics import DB_POOL_CHECKOUT, DB_QUERY_DURATION
+from common.profiling import current_profile
+
+_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def _operation(statement: str) -> str:
+    """Первое слово запроса: SELECT, INSERT и т.д., для пустого запроса - OTHER"""
+    words = statement.lstrip()[:7].split(None, 1)
+    return words[0].upper() if words else 'OTHER'
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий ожидание соединения; метка базы берётся из pool_logging_name движка"""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT.labels(self._orig_logging_name).observe(time.perf_counter() - started_at)
+
+
+def instrument_engine(engine: AsyncEngine, database: str) -> None:
+    histograms = {operation: DB_QUERY_DURATION.labels(database, operation) for operation in _OPERATIONS}
+    other = DB_QUERY_DURATION.labels(database, 'OTHER')
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_started_at = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.metrics_started_at
+        histograms.get(_operation(statement), other).observe(duration)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.queries.append((database, statement, duration))
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', after_cursor_execute)
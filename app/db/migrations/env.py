@@ -7,7 +7,9 @@ from sqlalchemy import pool
 from sqlalchemy.ext.asyncio import AsyncEngine
 
 from config import settings
-from db.base import Base
+from db import sqlite
+from db.base import SQLITE, Base
+from db.partitions import PARTITION_NAME_RE
 
 context.config.set_main_option("sqlalchemy.url", settings.DSN.DATABASE_ASYNC)
 
@@ -17,11 +19,21 @@ if context.config.config_file_name is not None:
 target_metadata = Base.metadata
 
 
+def include_object(object_, name, type_, reflected, compare_to):
+    # секции создаются миграцией и периодической задачей, в моделях их нет
+    if type_ == 'table' and reflected and compare_to is None and PARTITION_NAME_RE.match(name):
+        return False
+    return True
+
+
 def run_migrations_offline():
     url = context.config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite почти не умеет ALTER TABLE, изменения таблиц выполняются через их пересоздание
+        render_as_batch=SQLITE,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -31,7 +43,12 @@ def run_migrations_offline():
 
 
 def do_run_migrations(connection):
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        render_as_batch=SQLITE,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
@@ -46,6 +63,8 @@ async def run_migrations_online():
             future=True,
         )
     )
+    if SQLITE:
+        sqlite.install(connectable)
 
     async with connectable.connect() as connection:
         await connection.run_sync(do_run_migrations)
@@ -15,15 +15,18 @@ down_revision = None
 branch_labels = None
 depends_on = None
 
+# в SQLite автоинкремент есть только у INTEGER PRIMARY KEY
+ID_TYPE = sa.BigInteger().with_variant(sa.Integer(), 'sqlite')
+
 
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
     op.create_table('user',
-    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('id', ID_TYPE, autoincrement=True, nullable=False),
     sa.PrimaryKeyConstraint('id')
     )
     op.create_table('account',
-    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('id', ID_TYPE, autoincrement=True, nullable=False),
     sa.Column('title', sa.String(length=255), nullable=False),
     sa.Column('amount', sa.DECIMAL(precision=20, scale=2), nullable=False),
     sa.Column('user_id', sa.BigInteger(), nullable=False),
@@ -33,7 +36,7 @@ def upgrade():
     sa.UniqueConstraint('title', 'user_id')
     )
     op.create_table('category',
-    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('id', ID_TYPE, autoincrement=True, nullable=False),
     sa.Column('title', sa.String(length=255), nullable=False),
     sa.Column('disabled', sa.Boolean(), nullable=False),
     sa.Column('user_id', sa.BigInteger(), nullable=False),
@@ -42,13 +45,13 @@ def upgrade():
     sa.UniqueConstraint('title', 'user_id')
     )
     op.create_table('entry',
-    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('id', ID_TYPE, autoincrement=True, nullable=False),
     sa.Column('amount', sa.DECIMAL(scale=2), nullable=False),
     sa.Column('title', sa.String(length=255), nullable=True),
     sa.Column('user_id', sa.BigInteger(), nullable=False),
     sa.Column('category_id', sa.BigInteger(), nullable=False),
     sa.Column('account_id', sa.BigInteger(), nullable=False),
-    sa.Column('date_created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('date_created', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
     sa.Column('date_updated', sa.DateTime(timezone=True), nullable=True),
     sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
     sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
@@ -56,13 +59,13 @@ def upgrade():
     sa.PrimaryKeyConstraint('id')
     )
     op.create_table('transfer',
-    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('id', ID_TYPE, autoincrement=True, nullable=False),
     sa.Column('amount_from', sa.DECIMAL(scale=2), nullable=False),
     sa.Column('amount_to', sa.DECIMAL(scale=2), nullable=False),
     sa.Column('account_from_id', sa.BigInteger(), nullable=False),
     sa.Column('account_to_id', sa.BigInteger(), nullable=False),
     sa.Column('user_id', sa.BigInteger(), nullable=False),
-    sa.Column('date_created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('date_created', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
     sa.Column('date_updated', sa.DateTime(timezone=True), nullable=True),
     sa.ForeignKeyConstraint(['account_from_id'], ['account.id'], ondelete='CASCADE'),
     sa.ForeignKeyConstraint(['account_to_id'], ['account.id'], ondelete='CASCADE'),
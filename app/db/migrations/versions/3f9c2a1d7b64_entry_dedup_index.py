@@ -0,0 +1,29 @@
+"""entry dedup index
+
+Revision ID: 3f9c2a1d7b64
+Revises: 008ef97f6997
+Create Date: 2023-03-04 13:12:41.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a1d7b64'
+down_revision = '008ef97f6997'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_entry_dedup',
+        'entry',
+        ['account_id', 'date_created', 'amount', sa.text("md5(coalesce(title, ''))")],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_entry_dedup', table_name='entry')
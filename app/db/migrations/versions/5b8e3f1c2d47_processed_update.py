@@ -0,0 +1,34 @@
+"""processed update ledger
+
+Revision ID: 5b8e3f1c2d47
+Revises: c7d21e5f8a90
+Create Date: 2023-03-19 10:41:27.630254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e3f1c2d47'
+down_revision = 'c7d21e5f8a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'processed_update',
+        sa.Column('update_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('message_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('date_created', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('update_id', 'message_id'),
+    )
+    op.create_index(
+        op.f('ix_processed_update_date_created'), 'processed_update', ['date_created'], unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_processed_update_date_created'), table_name='processed_update')
+    op.drop_table('processed_update')
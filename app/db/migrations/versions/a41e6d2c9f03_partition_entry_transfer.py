@@ -0,0 +1,188 @@
+"""partition entry and transfer by month
+
+Revision ID: a41e6d2c9f03
+Revises: 3f9c2a1d7b64
+Create Date: 2023-03-11 18:40:07.213355
+
+"""
+from datetime import date
+from typing import Iterator
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41e6d2c9f03'
+down_revision = '3f9c2a1d7b64'
+branch_labels = None
+depends_on = None
+
+ENTRY_COLUMNS = 'id, amount, title, user_id, category_id, account_id, date_created, date_updated'
+TRANSFER_COLUMNS = 'id, amount_from, amount_to, account_from_id, account_to_id, user_id, date_created, date_updated'
+
+# секции и их DDL - копия db.partitions на момент миграции: миграция не зависит от модулей приложения,
+# которые могут измениться позже (и тянут за собой настройки, движок и telegram)
+PARTITIONS_AHEAD = 3
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def iter_months(first: date, last: date) -> Iterator[date]:
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+
+def add_months(month: date, months: int) -> date:
+    for _ in range(months):
+        month = next_month(month)
+    return month
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    return (
+        f'CREATE TABLE IF NOT EXISTS {table}_y{month:%Y}m{month:%m} PARTITION OF {table} '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    )
+
+
+def create_default_partition_sql(table: str) -> str:
+    return f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT'
+
+
+def _entry_columns(id_column: sa.Column, date_created_column: sa.Column) -> list:
+    return [
+        id_column,
+        sa.Column('amount', sa.DECIMAL(scale=2), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=True),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('category_id', sa.BigInteger(), nullable=False),
+        sa.Column('account_id', sa.BigInteger(), nullable=False),
+        date_created_column,
+        sa.Column('date_updated', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    ]
+
+
+def _transfer_columns(id_column: sa.Column, date_created_column: sa.Column) -> list:
+    return [
+        id_column,
+        sa.Column('amount_from', sa.DECIMAL(scale=2), nullable=False),
+        sa.Column('amount_to', sa.DECIMAL(scale=2), nullable=False),
+        sa.Column('account_from_id', sa.BigInteger(), nullable=False),
+        sa.Column('account_to_id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        date_created_column,
+        sa.Column('date_updated', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['account_from_id'], ['account.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['account_to_id'], ['account.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    ]
+
+
+def _rename_old_table(table: str) -> None:
+    op.rename_table(table, f'{table}_old')
+    op.execute(f'ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey')
+
+
+def _move_rows_and_drop_old_table(table: str, columns: str) -> None:
+    # последовательность id переходит новой таблице, иначе удалится вместе со старой
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    op.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_old')
+    op.drop_table(f'{table}_old')
+
+
+def _create_partitions(table: str) -> None:
+    first_date = op.get_bind().execute(sa.text(f'SELECT min(date_created) FROM {table}_old')).scalar()
+    this_month = month_start(date.today())
+    first_month = month_start(first_date.date()) if first_date else this_month
+    for month in iter_months(min(first_month, this_month), add_months(this_month, PARTITIONS_AHEAD)):
+        op.execute(create_partition_sql(table, month))
+    op.execute(create_default_partition_sql(table))
+
+
+def _is_postgresql() -> bool:
+    # секционирование есть только в PostgreSQL, в SQLite таблицы остаются как есть
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if not _is_postgresql():
+        return
+    for table in ('entry', 'transfer'):
+        _rename_old_table(table)
+        # строки без даты не могут попасть ни в одну секцию
+        op.execute(f'UPDATE {table}_old SET date_created = now() WHERE date_created IS NULL')
+    op.drop_index('ix_entry_dedup', table_name='entry_old')
+
+    id_column = sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('entry_id_seq')"), nullable=False)
+    date_created_column = sa.Column(
+        'date_created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False,
+    )
+    op.create_table(
+        'entry',
+        *_entry_columns(id_column, date_created_column),
+        sa.PrimaryKeyConstraint('id', 'date_created'),
+        postgresql_partition_by='RANGE (date_created)',
+    )
+    op.create_index(
+        'ix_entry_dedup',
+        'entry',
+        ['account_id', 'date_created', 'amount', sa.text("md5(coalesce(title, ''))")],
+        unique=False,
+    )
+
+    id_column = sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('transfer_id_seq')"), nullable=False)
+    date_created_column = sa.Column(
+        'date_created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False,
+    )
+    op.create_table(
+        'transfer',
+        *_transfer_columns(id_column, date_created_column),
+        sa.PrimaryKeyConstraint('id', 'date_created'),
+        postgresql_partition_by='RANGE (date_created)',
+    )
+
+    for table, columns in (('entry', ENTRY_COLUMNS), ('transfer', TRANSFER_COLUMNS)):
+        _create_partitions(table)
+        _move_rows_and_drop_old_table(table, columns)
+
+
+def downgrade():
+    if not _is_postgresql():
+        return
+    for table in ('entry', 'transfer'):
+        _rename_old_table(table)
+    op.drop_index('ix_entry_dedup', table_name='entry_old')
+
+    id_column = sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('entry_id_seq')"), nullable=False)
+    date_created_column = sa.Column(
+        'date_created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True,
+    )
+    op.create_table('entry', *_entry_columns(id_column, date_created_column), sa.PrimaryKeyConstraint('id'))
+    op.create_index(
+        'ix_entry_dedup',
+        'entry',
+        ['account_id', 'date_created', 'amount', sa.text("md5(coalesce(title, ''))")],
+        unique=False,
+    )
+
+    id_column = sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('transfer_id_seq')"), nullable=False)
+    date_created_column = sa.Column(
+        'date_created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True,
+    )
+    op.create_table('transfer', *_transfer_columns(id_column, date_created_column), sa.PrimaryKeyConstraint('id'))
+
+    for table, columns in (('entry', ENTRY_COLUMNS), ('transfer', TRANSFER_COLUMNS)):
+        _move_rows_and_drop_old_table(table, columns)
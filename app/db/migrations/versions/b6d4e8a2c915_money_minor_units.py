@@ -0,0 +1,104 @@
+"""money in integer minor units
+
+Revision ID: b6d4e8a2c915
+Revises: e4a9c3b7d1f2
+Create Date: 2023-03-21 19:05:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from common.money import DEFAULT_EXPONENT, currency_exponent
+from db.base import SQLITE
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d4e8a2c915'
+down_revision = 'e4a9c3b7d1f2'
+branch_labels = None
+depends_on = None
+
+# таблица, колонка суммы, колонка счёта, в валюте которого сумма, прежний тип
+AMOUNTS = (
+    ('entry', 'amount', 'account_id', sa.DECIMAL(scale=2)),
+    ('transfer', 'amount_from', 'account_from_id', sa.DECIMAL(scale=2)),
+    ('transfer', 'amount_to', 'account_to_id', sa.DECIMAL(scale=2)),
+    ('posting', 'amount', 'account_id', sa.DECIMAL(precision=20, scale=2)),
+    ('account_checkpoint', 'amount', 'account_id', sa.DECIMAL(precision=20, scale=2)),
+)
+
+
+def _set_exponents() -> None:
+    connection = op.get_bind()
+    currencies = connection.execute(sa.text('SELECT DISTINCT currency FROM account')).scalars().all()
+    for currency in currencies:
+        exponent = currency_exponent(currency)
+        if exponent != DEFAULT_EXPONENT:
+            connection.execute(
+                sa.text('UPDATE account SET exponent = :exponent WHERE currency = :currency'),
+                {'exponent': exponent, 'currency': currency},
+            )
+
+
+def _rescale_sqlite(multiply: bool) -> None:
+    # в SQLite нет power(), поэтому по запросу на каждый показатель; тип колонки в SQLite не ограничивает
+    # хранимые значения, а пересоздание таблиц ради него потеряло бы индекс ix_entry_dedup по выражению
+    connection = op.get_bind()
+    exponents = connection.execute(sa.text('SELECT DISTINCT exponent FROM account')).scalars().all()
+    for exponent in exponents:
+        factor = 10 ** exponent
+        params = {'exponent': exponent, 'factor': factor}
+        value = 'CAST(round({column} * :factor) AS INTEGER)' if multiply else '{column} * 1.0 / :factor'
+        connection.execute(
+            sa.text(f'UPDATE account SET amount = {value.format(column="amount")} WHERE exponent = :exponent'),
+            params,
+        )
+        for table, column, account_column, _ in AMOUNTS:
+            connection.execute(
+                sa.text(
+                    f'UPDATE {table} SET {column} = {value.format(column=column)} '
+                    f'WHERE {account_column} IN (SELECT id FROM account WHERE exponent = :exponent)'
+                ),
+                params,
+            )
+
+
+def upgrade():
+    op.add_column(
+        'account',
+        sa.Column('exponent', sa.SmallInteger(), server_default=str(DEFAULT_EXPONENT), nullable=False),
+    )
+    _set_exponents()
+
+    if SQLITE:
+        _rescale_sqlite(multiply=True)
+        return
+
+    op.alter_column(
+        'account', 'amount', type_=sa.BigInteger(), postgresql_using='round(amount * power(10.0, exponent))',
+    )
+    for table, column, account_column, _ in AMOUNTS:
+        # ALTER TABLE переписывает таблицу (и все секции) один раз, выражение не может ссылаться на account,
+        # поэтому сначала все суммы в сотых, а затем редкие счета с другим показателем отдельным UPDATE
+        op.alter_column(table, column, type_=sa.BigInteger(), postgresql_using=f'round({column} * 100)')
+        op.execute(
+            f'UPDATE {table} SET {column} = round({table}.{column} * power(10.0, account.exponent - 2)) '
+            f'FROM account WHERE account.id = {table}.{account_column} AND account.exponent <> 2'
+        )
+
+
+def downgrade():
+    if SQLITE:
+        _rescale_sqlite(multiply=False)
+    else:
+        for table, column, account_column, decimal_type in AMOUNTS:
+            op.execute(
+                f'UPDATE {table} SET {column} = round({table}.{column} * power(10.0, 2 - account.exponent)) '
+                f'FROM account WHERE account.id = {table}.{account_column} AND account.exponent <> 2'
+            )
+            op.alter_column(table, column, type_=decimal_type, postgresql_using=f'round({column} / 100.0, 2)')
+        op.alter_column(
+            'account', 'amount', type_=sa.DECIMAL(precision=20, scale=2),
+            postgresql_using='amount / power(10.0, exponent)',
+        )
+    op.drop_column('account', 'exponent')
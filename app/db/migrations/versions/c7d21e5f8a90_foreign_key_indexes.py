@@ -0,0 +1,28 @@
+"""foreign key indexes for cascading deletes
+
+Revision ID: c7d21e5f8a90
+Revises: a41e6d2c9f03
+Create Date: 2023-03-18 12:04:51.305117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d21e5f8a90'
+down_revision = 'a41e6d2c9f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # без индексов ON DELETE CASCADE и исправление балансов при удалении счёта просматривают таблицы целиком
+    op.create_index(op.f('ix_entry_category_id'), 'entry', ['category_id'], unique=False)
+    op.create_index(op.f('ix_transfer_account_from_id'), 'transfer', ['account_from_id'], unique=False)
+    op.create_index(op.f('ix_transfer_account_to_id'), 'transfer', ['account_to_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_transfer_account_to_id'), table_name='transfer')
+    op.drop_index(op.f('ix_transfer_account_from_id'), table_name='transfer')
+    op.drop_index(op.f('ix_entry_category_id'), table_name='entry')
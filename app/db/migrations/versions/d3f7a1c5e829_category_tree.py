@@ -0,0 +1,59 @@
+"""category tree with closure table
+
+Revision ID: d3f7a1c5e829
+Revises: b6d4e8a2c915
+Create Date: 2023-03-22 10:41:07.226514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from db.base import SQLITE
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f7a1c5e829'
+down_revision = 'b6d4e8a2c915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if SQLITE:
+        # пересоздание таблицы при включённых внешних ключах удалило бы каскадом все записи,
+        # а столбец со ссылкой и значением NULL по умолчанию SQLite добавляет и без него;
+        # удалить такой столбец SQLite не может, после отката он остаётся
+        columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('category')}
+        if 'parent_id' not in columns:
+            op.execute('ALTER TABLE category ADD COLUMN parent_id INTEGER REFERENCES category (id) ON DELETE SET NULL')
+    else:
+        op.add_column('category', sa.Column('parent_id', sa.BigInteger(), nullable=True))
+        op.create_foreign_key(
+            'category_parent_id_fkey', 'category', 'category', ['parent_id'], ['id'], ondelete='SET NULL',
+        )
+    op.create_index(op.f('ix_category_parent_id'), 'category', ['parent_id'], unique=False)
+    op.create_table(
+        'category_closure',
+        sa.Column('ancestor_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('descendant_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['category.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['category.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+    )
+    op.create_index(
+        op.f('ix_category_closure_descendant_id'), 'category_closure', ['descendant_id'], unique=False,
+    )
+    # все существующие категории - корни
+    op.execute('INSERT INTO category_closure (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM category')
+
+
+def downgrade():
+    op.drop_index(op.f('ix_category_closure_descendant_id'), table_name='category_closure')
+    op.drop_table('category_closure')
+    op.drop_index(op.f('ix_category_parent_id'), table_name='category')
+    if SQLITE:
+        op.execute('UPDATE category SET parent_id = NULL')
+    else:
+        op.drop_constraint('category_parent_id_fkey', 'category', type_='foreignkey')
+        op.drop_column('category', 'parent_id')
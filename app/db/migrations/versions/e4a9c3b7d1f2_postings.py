@@ -0,0 +1,43 @@
+"""account postings and checkpoints
+
+Revision ID: e4a9c3b7d1f2
+Revises: 5b8e3f1c2d47
+Create Date: 2023-03-20 09:12:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c3b7d1f2'
+down_revision = '5b8e3f1c2d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'posting',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('account_id', sa.BigInteger(), nullable=False),
+        sa.Column('amount', sa.DECIMAL(precision=20, scale=2), nullable=False),
+        sa.Column('date_created', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_posting_account_id'), 'posting', ['account_id'], unique=False)
+    op.create_table(
+        'account_checkpoint',
+        sa.Column('account_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('amount', sa.DECIMAL(precision=20, scale=2), nullable=False),
+        sa.Column('date_updated', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('account_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('account_checkpoint')
+    op.drop_index(op.f('ix_posting_account_id'), table_name='posting')
+    op.drop_table('posting')
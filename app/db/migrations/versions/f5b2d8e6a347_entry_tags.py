@@ -0,0 +1,116 @@
+"""entry tags
+
+Revision ID: f5b2d8e6a347
+Revises: d3f7a1c5e829
+Create Date: 2023-03-25 16:20:43.918305
+
+"""
+from typing import Callable, List, Optional, Tuple
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from common.tags import extract_tags, strip_tags
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b2d8e6a347'
+down_revision = 'd3f7a1c5e829'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+entry = sa.table(
+    'entry',
+    sa.column('id'),
+    # без типа: значение из SELECT возвращается в UPDATE как есть, без преобразований
+    sa.column('date_created'),
+    sa.column('title'),
+    sa.column('tags', postgresql.ARRAY(sa.String()).with_variant(sa.JSON(none_as_null=True), 'sqlite')),
+)
+
+Titles = Tuple[Optional[str], Optional[List[str]]]
+
+
+def _is_postgresql() -> bool:
+    # функция и GIN-индекс по меткам есть только в PostgreSQL
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def _rewrite_titles(condition: sa.ColumnElement[bool], convert: Callable[[Optional[str], Optional[List[str]]], Titles]):
+    """
+    Переписывает заметки и метки записей, подходящих под condition
+
+    Записи читаются пачками по id (keyset), а не все сразу; date_created в условии UPDATE
+    отсекает остальные секции entry
+
+    :param convert: (заметка, метки) -> новые заметка и метки
+    """
+    update = (
+        entry.update()
+        .where(entry.c.id == sa.bindparam('entry_id'), entry.c.date_created == sa.bindparam('entry_date_created'))
+        .values(title=sa.bindparam('entry_title'), tags=sa.bindparam('entry_tags'))
+    )
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(entry.c.id, entry.c.date_created, entry.c.title, entry.c.tags)
+            .where(entry.c.id > last_id, condition)
+            .order_by(entry.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for entry_id, date_created, title, tags in rows:
+            new_title, new_tags = convert(title, tags)
+            if (new_title, new_tags) != (title, tags):
+                updates.append({
+                    'entry_id': entry_id, 'entry_date_created': date_created,
+                    'entry_title': new_title, 'entry_tags': new_tags,
+                })
+        if updates:
+            connection.execute(update, updates)
+
+
+def _strip_tags(title: Optional[str], tags: Optional[List[str]]) -> Titles:
+    return strip_tags(title) or None, extract_tags(title)
+
+
+def _append_tags(title: Optional[str], tags: Optional[List[str]]) -> Titles:
+    # исходные регистр и место меток в заметке не сохранялись, метки возвращаются в конец заметки
+    return ' '.join(filter(None, [title, *(f'#{tag}' for tag in tags)])), None
+
+
+def upgrade():
+    op.add_column(
+        'entry', sa.Column('tags', postgresql.ARRAY(sa.String()).with_variant(sa.JSON(), 'sqlite'), nullable=True),
+    )
+    op.create_index('ix_entry_user_id_date_created', 'entry', ['user_id', 'date_created'], unique=False)
+    if _is_postgresql():
+        # ключи GIN-индекса по меткам - «пользователь:метка», см. db.tags
+        op.execute(
+            'CREATE FUNCTION entry_tag_keys(user_id BIGINT, tags VARCHAR[]) RETURNS TEXT[] '
+            "LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ SELECT array_agg(user_id || ':' || tag) FROM unnest(tags) AS tag $$"
+        )
+        op.create_index(
+            'ix_entry_tags', 'entry', [sa.text('entry_tag_keys(user_id, tags)')], unique=False, postgresql_using='gin',
+        )
+
+    # метки из заметок уже добавленных записей, и сами метки убираются из заметок, как у новых записей;
+    # регулярные выражения PostgreSQL зависят от локали базы, поэтому разбор тот же - common.tags
+    _rewrite_titles(entry.c.title.contains('#'), _strip_tags)
+
+
+def downgrade():
+    # без столбца метки остались бы только в заметках, как до миграции
+    _rewrite_titles(entry.c.tags.isnot(None), _append_tags)
+    if _is_postgresql():
+        op.drop_index('ix_entry_tags', table_name='entry')
+        op.execute('DROP FUNCTION entry_tag_keys')
+    op.drop_index('ix_entry_user_id_date_created', table_name='entry')
+    op.drop_column('entry', 'tags')
@@ -1,5 +1,9 @@
 from .account import AccountModel
 from .user import UserModel
 from .category import CategoryModel
+from .category_closure import CategoryClosureModel
 from .entry import EntryModel
 from .transfer import TransferModel
+from .processed_update import ProcessedUpdateModel
+from .posting import PostingModel
+from .account_checkpoint import AccountCheckpointModel
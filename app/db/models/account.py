@@ -1,9 +1,8 @@
-from decimal import Decimal
-
-from sqlalchemy import BigInteger, Column, String, UniqueConstraint, ForeignKey, DECIMAL
+from sqlalchemy import Column, String, UniqueConstraint, ForeignKey, BigInteger, SmallInteger
 from sqlalchemy.orm import relationship
 
-from db.base import Base, cascade
+from common.money import DEFAULT_EXPONENT, Money
+from db.base import Base, IdType, cascade
 
 
 class AccountModel(Base):
@@ -12,25 +11,34 @@ class AccountModel(Base):
         UniqueConstraint('title', 'user_id'),
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(IdType, primary_key=True, autoincrement=True)
     title = Column(String(length=255), nullable=False)
-    amount = Column(DECIMAL(precision=20, scale=2), default=Decimal('0'), nullable=False)
+    # в минорных единицах валюты, см. common.money
+    amount = Column(BigInteger, default=0, nullable=False)
     user_id = Column(ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     currency = Column(String(length=100), nullable=False)
+    # сколько знаков после запятой у валюты, суммы записей и переводов счёта - в тех же единицах
+    exponent = Column(SmallInteger, default=DEFAULT_EXPONENT, server_default=str(DEFAULT_EXPONENT), nullable=False)
 
-    user = relationship('UserModel', lazy='subquery', back_populates='accounts')
+    user = relationship('UserModel', lazy='raise', back_populates='accounts')
     transfers_from = relationship(
         'TransferModel',
         primaryjoin="TransferModel.account_from_id == AccountModel.id",
         back_populates='account_from',
-        lazy='subquery',
+        lazy='raise',
         cascade=cascade,
+        passive_deletes=True,
     )
     transfers_to = relationship(
         'TransferModel',
         primaryjoin="TransferModel.account_to_id == AccountModel.id",
         back_populates='account_to',
-        lazy='subquery',
+        lazy='raise',
         cascade=cascade,
+        passive_deletes=True,
     )
-    entries = relationship('EntryModel', lazy='subquery', back_populates='account', cascade=cascade)
+    entries = relationship('EntryModel', lazy='raise', back_populates='account', cascade=cascade, passive_deletes=True)
+
+    @property
+    def balance(self) -> Money:
+        return Money(self.amount, self.exponent)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, ForeignKey, BigInteger, DateTime, func
+
+from db.base import Base
+
+
+class AccountCheckpointModel(Base):
+    """Баланс счёта со всеми свёрнутыми проводками (см. db.postings)"""
+    __tablename__ = 'account_checkpoint'
+
+    account_id = Column(ForeignKey('account.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    amount = Column(BigInteger, nullable=False)
+    date_updated = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -1,7 +1,7 @@
-from sqlalchemy import BigInteger, Column, String, UniqueConstraint, ForeignKey, Boolean
+from sqlalchemy import Column, String, UniqueConstraint, ForeignKey, Boolean
 from sqlalchemy.orm import relationship
 
-from db.base import Base, cascade
+from db.base import Base, IdType, cascade
 
 
 class CategoryModel(Base):
@@ -10,10 +10,12 @@ class CategoryModel(Base):
         UniqueConstraint('title', 'user_id'),
     )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(IdType, primary_key=True, autoincrement=True)
     title = Column(String(length=255), nullable=False)
     disabled = Column(Boolean, default=False, nullable=False)
     user_id = Column(ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    # дерево дублируется в category_closure, менять parent_id можно только через db.categories
+    parent_id = Column(ForeignKey('category.id', ondelete='SET NULL'), nullable=True, index=True)
 
-    user = relationship('UserModel', lazy='subquery', back_populates='categories')
-    entries = relationship('EntryModel', lazy='subquery', back_populates='category', cascade=cascade)
+    user = relationship('UserModel', lazy='raise', back_populates='categories')
+    entries = relationship('EntryModel', lazy='raise', back_populates='category', cascade=cascade, passive_deletes=True)
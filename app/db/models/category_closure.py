@@ -0,0 +1,17 @@
+from sqlalchemy import Column, ForeignKey, Integer
+
+from db.base import Base
+
+
+class CategoryClosureModel(Base):
+    """
+    Таблица замыкания дерева категорий (см. db.categories): строка на каждую пару предок - потомок,
+    включая саму категорию с depth = 0
+    """
+    __tablename__ = 'category_closure'
+
+    ancestor_id = Column(ForeignKey('category.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    descendant_id = Column(
+        ForeignKey('category.id', ondelete='CASCADE'), primary_key=True, autoincrement=False, index=True,
+    )
+    depth = Column(Integer, nullable=False)
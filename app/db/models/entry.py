@@ -1,21 +1,40 @@
-from sqlalchemy import BigInteger, Column, String, ForeignKey, DECIMAL, DateTime, func
+from sqlalchemy import JSON, Column, String, ForeignKey, BigInteger, DateTime, func, Index, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 
-from db.base import Base
+from db.base import SQLITE, Base, IdType
 
 
 class EntryModel(Base):
     __tablename__ = 'entry'
+    __table_args__ = (
+        # поиск дубликатов при импорте выписок
+        Index('ix_entry_dedup', 'account_id', 'date_created', 'amount', text("md5(coalesce(title, ''))")),
+        # записи пользователя от новых к старым (/entries)
+        Index('ix_entry_user_id_date_created', 'user_id', 'date_created'),
+        # фильтр по меткам (db.tags): ключи индекса - «пользователь:метка», GIN по самим меткам
+        # отдавал бы частую метку сразу всех пользователей; функция создаётся миграцией f5b2d8e6a347
+        Index('ix_entry_tags', text('entry_tag_keys(user_id, tags)'), postgresql_using='gin').ddl_if(
+            dialect='postgresql',
+        ),
+        {'postgresql_partition_by': 'RANGE (date_created)'},
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    amount = Column(DECIMAL(scale=2), nullable=False)
+    id = Column(IdType, primary_key=True, autoincrement=True)
+    # в минорных единицах валюты счёта
+    amount = Column(BigInteger, nullable=False)
     title = Column(String(length=255), nullable=True)
+    # метки из заметки (common.tags), NULL - меток нет; в SQLite массивов нет - там JSON,
+    # и None в нём тоже NULL, а не JSON-значение 'null'
+    tags = Column(ARRAY(String).with_variant(JSON(none_as_null=True), 'sqlite'), nullable=True)
     user_id = Column(ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
-    category_id = Column(ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    category_id = Column(ForeignKey('category.id', ondelete='CASCADE'), nullable=False, index=True)
     account_id = Column(ForeignKey('account.id', ondelete='CASCADE'), nullable=False)
-    date_created = Column(DateTime(timezone=True), server_default=func.now())
+    # ключ секционирования обязан входить в первичный ключ, в SQLite секций нет,
+    # а автоинкремент работает только у первичного ключа из одной колонки
+    date_created = Column(DateTime(timezone=True), primary_key=not SQLITE, server_default=func.now())
     date_updated = Column(DateTime(timezone=True), onupdate=func.now())
 
-    user = relationship('UserModel', lazy='subquery', back_populates='entries')
-    category = relationship('CategoryModel', lazy='subquery', back_populates='entries')
-    account = relationship('AccountModel', lazy='subquery', back_populates='entries')
+    user = relationship('UserModel', lazy='raise', back_populates='entries')
+    category = relationship('CategoryModel', lazy='raise', back_populates='entries')
+    account = relationship('AccountModel', lazy='raise', back_populates='entries')
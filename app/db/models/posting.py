@@ -0,0 +1,13 @@
+from sqlalchemy import Column, ForeignKey, BigInteger, DateTime, func
+
+from db.base import Base, IdType
+
+
+class PostingModel(Base):
+    """Ещё не свёрнутое в контрольную точку изменение баланса счёта (см. db.postings)"""
+    __tablename__ = 'posting'
+
+    id = Column(IdType, primary_key=True, autoincrement=True)
+    account_id = Column(ForeignKey('account.id', ondelete='CASCADE'), nullable=False, index=True)
+    amount = Column(BigInteger, default=0, nullable=False)
+    date_created = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, BigInteger, DateTime, func
+
+from db.base import Base
+
+
+class ProcessedUpdateModel(Base):
+    """Обновления, изменения которых уже зафиксированы (см. db.ledger)"""
+    __tablename__ = 'processed_update'
+
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    # у обновлений без сообщения 0
+    message_id = Column(BigInteger, primary_key=True, autoincrement=False, default=0)
+    date_created = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
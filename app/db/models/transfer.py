@@ -1,31 +1,35 @@
-from sqlalchemy import BigInteger, Column, ForeignKey, DECIMAL, DateTime, func
+from sqlalchemy import Column, ForeignKey, BigInteger, DateTime, func
 from sqlalchemy.orm import relationship
 
-from db.base import Base
+from db.base import SQLITE, Base, IdType
 
 
 class TransferModel(Base):
     __tablename__ = 'transfer'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (date_created)'}
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    amount_from = Column(DECIMAL(scale=2), nullable=False)
-    amount_to = Column(DECIMAL(scale=2), nullable=False)
-    account_from_id = Column(ForeignKey('account.id', ondelete='CASCADE'), nullable=False)
-    account_to_id = Column(ForeignKey('account.id', ondelete='CASCADE'), nullable=False)
+    id = Column(IdType, primary_key=True, autoincrement=True)
+    # в минорных единицах валют счетов списания и зачисления
+    amount_from = Column(BigInteger, nullable=False)
+    amount_to = Column(BigInteger, nullable=False)
+    account_from_id = Column(ForeignKey('account.id', ondelete='CASCADE'), nullable=False, index=True)
+    account_to_id = Column(ForeignKey('account.id', ondelete='CASCADE'), nullable=False, index=True)
     user_id = Column(ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
-    date_created = Column(DateTime(timezone=True), server_default=func.now())
+    # ключ секционирования обязан входить в первичный ключ, в SQLite секций нет,
+    # а автоинкремент работает только у первичного ключа из одной колонки
+    date_created = Column(DateTime(timezone=True), primary_key=not SQLITE, server_default=func.now())
     date_updated = Column(DateTime(timezone=True), onupdate=func.now())
 
     account_from = relationship(
         'AccountModel',
         foreign_keys=[account_from_id],
-        lazy='subquery',
+        lazy='raise',
         back_populates='transfers_from',
     )
     account_to = relationship(
         'AccountModel',
         foreign_keys=[account_to_id],
-        lazy='subquery',
+        lazy='raise',
         back_populates='transfers_to',
     )
-    user = relationship('UserModel', lazy='subquery', back_populates='transfers')
+    user = relationship('UserModel', lazy='raise', back_populates='transfers')
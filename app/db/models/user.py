@@ -1,15 +1,23 @@
-from sqlalchemy import BigInteger, Column, String
+from sqlalchemy import Column, String
 from sqlalchemy.orm import relationship
 
-from db.base import Base, cascade
+from db.base import Base, IdType, cascade
 
 
 class UserModel(Base):
     __tablename__ = 'user'
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(IdType, primary_key=True, autoincrement=True)
 
-    accounts = relationship('AccountModel', lazy='subquery', back_populates='user', cascade=cascade)
-    categories = relationship('CategoryModel', lazy='subquery', back_populates='user', cascade=cascade)
-    transfers = relationship('TransferModel', lazy='subquery', back_populates='user', cascade=cascade)
-    entries = relationship('EntryModel', lazy='subquery', back_populates='user', cascade=cascade)
+    accounts = relationship(
+        'AccountModel', lazy='raise', back_populates='user', cascade=cascade, passive_deletes=True,
+    )
+    categories = relationship(
+        'CategoryModel', lazy='raise', back_populates='user', cascade=cascade, passive_deletes=True,
+    )
+    transfers = relationship(
+        'TransferModel', lazy='raise', back_populates='user', cascade=cascade, passive_deletes=True,
+    )
+    entries = relationship(
+        'EntryModel', lazy='raise', back_populates='user', cascade=cascade, passive_deletes=True,
+    )
@@ -0,0 +1,133 @@
+"""
+Помесячное секционирование таблиц entry и transfer по date_created
+
+Секции создаются заранее на PARTITIONS_AHEAD месяцев вперёд периодической задачей,
+строки вне созданных секций (например, импорт старых выписок) попадают в секцию по умолчанию
+"""
+import logging
+import re
+from datetime import date
+from typing import Iterator, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from telegram.ext import ContextTypes
+
+from db.base import engine
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ('entry', 'transfer')
+PARTITIONS_AHEAD = 3
+PARTITION_NAME_RE = re.compile(rf'^({"|".join(PARTITIONED_TABLES)})_(y\d{{4}}m\d{{2}}|default)$')
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def iter_months(first: date, last: date) -> Iterator[date]:
+    """Первые числа месяцев с first по last включительно"""
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+
+def add_months(month: date, months: int) -> date:
+    for _ in range(months):
+        month = next_month(month)
+    return month
+
+
+def partition_name(table: str, month: date) -> str:
+    return f'{table}_y{month:%Y}m{month:%m}'
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    return (
+        f'CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    )
+
+
+def create_default_partition_sql(table: str) -> str:
+    return f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT'
+
+
+async def _existing_partitions(connection: AsyncConnection, table: str) -> List[str]:
+    return (await connection.execute(
+        text(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.relname = :table'
+        ),
+        {'table': table},
+    )).scalars().all()
+
+
+async def _create_partition(connection: AsyncConnection, table: str, month: date) -> None:
+    """
+    Секция не создаётся, если в секции по умолчанию уже есть строки из её диапазона,
+    в этом случае секция по умолчанию на время отсоединяется и строки переносятся
+    """
+    bounds = {'start': month, 'end': next_month(month)}
+    default_has_rows = (await connection.execute(
+        text(
+            f'SELECT EXISTS (SELECT 1 FROM {table}_default '
+            'WHERE date_created >= :start AND date_created < :end)'
+        ),
+        bounds,
+    )).scalar_one()
+
+    if not default_has_rows:
+        await connection.execute(text(create_partition_sql(table, month)))
+        return
+
+    await connection.execute(text(f'ALTER TABLE {table} DETACH PARTITION {table}_default'))
+    await connection.execute(text(create_partition_sql(table, month)))
+    await connection.execute(
+        text(
+            f'WITH moved AS ('
+            f'DELETE FROM {table}_default WHERE date_created >= :start AND date_created < :end RETURNING *'
+            f') INSERT INTO {table} SELECT * FROM moved'
+        ),
+        bounds,
+    )
+    await connection.execute(text(f'ALTER TABLE {table} ATTACH PARTITION {table}_default DEFAULT'))
+
+
+async def ensure_partitions(months_ahead: int = PARTITIONS_AHEAD) -> List[str]:
+    """
+    Создание недостающих секций с текущего месяца на months_ahead месяцев вперёд
+
+    :return: имена созданных секций
+    """
+    if engine.dialect.name != 'postgresql':
+        return []
+    this_month = month_start(date.today())
+    created = []
+    async with engine.begin() as connection:
+        for table in PARTITIONED_TABLES:
+            existing = set(await _existing_partitions(connection, table))
+            if not existing:
+                # таблица ещё не секционирована (миграция не применена)
+                continue
+            await connection.execute(text(create_default_partition_sql(table)))
+            for month in iter_months(this_month, add_months(this_month, months_ahead)):
+                name = partition_name(table, month)
+                if name not in existing:
+                    await _create_partition(connection, table, month)
+                    created.append(name)
+    return created
+
+
+async def ensure_partitions_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    created = await ensure_partitions()
+    if created:
+        logger.info('Created partitions: %s', ', '.join(created))
@@ -0,0 +1,235 @@
+"""
+Балансы счетов по проводкам вместо обновления строки счёта (POSTINGS__ENABLED)
+
+Обычно запись и перевод прибавляют сумму к amount строки account, и все записи по одному счёту ждут
+друг друга на блокировке этой строки до фиксации транзакции - в том числе пока бот отправляет ответ.
+В режиме проводок запись добавляет проводку (счёт, сумма, время), перевод - две, по одной на каждый
+счёт, а строку счёта никто не трогает: вставки проводок друг друга не блокируют.
+
+Баланс - это контрольная точка счёта (пока её нет - amount счёта) плюс сумма ещё не свёрнутых проводок.
+Периодическая задача compact_job сворачивает проводки в точки: одной транзакцией удаляет пачку проводок
+и прибавляет их суммы к точкам их счетов. Удаление видит только зафиксированные проводки, так что
+проводка ещё не зафиксированной транзакции не теряется, а сворачивается в следующий раз. История
+по-прежнему в записях и переводах, в проводках только её часть, ещё не учтённая в точках.
+
+amount счёта в этом режиме - баланс на момент включения режима или начальная сумма нового счёта.
+Перед выключением режима остановите бота и перенесите балансы в amount: python -m db.postings settle
+"""
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import ColumnElement, Result, Select, cast, delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from telegram.ext import ContextTypes
+
+from config import settings
+from db import AccountCheckpointModel, AccountModel, PostingModel
+from db.base import SQLITE, async_session, engine
+from db.snapshots import AccountSnapshot
+
+logger = logging.getLogger(__name__)
+
+insert = sqlite.insert if SQLITE else postgresql.insert
+
+
+async def change_balances(
+    session: AsyncSession, changes: Sequence[Tuple[AccountSnapshot, int]],
+) -> Dict[int, AccountSnapshot]:
+    """
+    Прибавляет суммы к балансам счетов в текущей транзакции
+
+    Без проводок строки счетов обновляются в порядке id (два встречных перевода не ждут друг друга
+    по кругу) и сумма прибавляется в самом UPDATE, а не к прочитанному раньше значению. В режиме
+    проводок новый баланс - прочитанный при загрузке счёта плюс сумма, без чужих проводок после загрузки
+
+    :return: снимки счетов с новыми балансами по id, для ответа пользователю
+    """
+    if settings.POSTINGS.ENABLED:
+        await session.execute(
+            insert(PostingModel),
+            [{'account_id': account.id, 'amount': amount} for account, amount in changes],
+        )
+        return {account.id: account._replace(amount=account.amount + amount) for account, amount in changes}
+
+    balances = {}
+    for account, amount in sorted(changes, key=lambda change: change[0].id):
+        balance = (await session.execute(
+            update(AccountModel)
+            .where(AccountModel.id == account.id)
+            .values(amount=AccountModel.amount + amount)
+            .returning(AccountModel.amount)
+            .execution_options(synchronize_session=False)
+        )).scalar_one()
+        balances[account.id] = account._replace(amount=balance)
+    return balances
+
+
+def balance() -> ColumnElement[int]:
+    """Текущий баланс счёта AccountModel из внешнего запроса в режиме проводок"""
+    checkpoint = (
+        select(AccountCheckpointModel.amount)
+        .where(AccountCheckpointModel.account_id == AccountModel.id)
+        .scalar_subquery()
+    )
+    pending = select(func.sum(PostingModel.amount)).where(PostingModel.account_id == AccountModel.id).scalar_subquery()
+    # sum() по BIGINT в PostgreSQL - NUMERIC, баланс приводится обратно к типу суммы счёта
+    return cast(func.coalesce(checkpoint, AccountModel.amount) + func.coalesce(pending, 0), AccountModel.amount.type)
+
+
+def select_accounts() -> Select:
+    """Запрос счетов, результат которого превращает в счета с балансами accounts_with_balances"""
+    if settings.POSTINGS.ENABLED:
+        return select(AccountModel, balance().label('balance'))
+    return select(AccountModel)
+
+
+def accounts_with_balances(result: Result) -> List[AccountModel]:
+    if not settings.POSTINGS.ENABLED:
+        return result.scalars().all()
+    accounts = []
+    for account, amount in result:
+        set_committed_value(account, 'amount', amount)
+        accounts.append(account)
+    return accounts
+
+
+async def get_balance(connection: AsyncConnection, account_id: int) -> int:
+    return (await connection.execute(select(balance()).where(AccountModel.id == account_id))).scalar_one()
+
+
+async def compact(limit: Optional[int] = None) -> int:
+    """
+    Сворачивает не больше limit проводок в контрольные точки
+
+    :return: сколько проводок свёрнуто
+    """
+    limit = limit or settings.POSTINGS.COMPACT_BATCH
+    async with async_session() as session, session.begin():
+        # точка нового счёта начинается с его amount
+        await session.execute(
+            insert(AccountCheckpointModel)
+            .from_select(
+                ['account_id', 'amount'],
+                select(AccountModel.id, AccountModel.amount)
+                .where(AccountModel.id.in_(select(PostingModel.account_id).distinct())),
+            )
+            .on_conflict_do_nothing()
+        )
+        if SQLITE:
+            return await _fold_sqlite(session, limit)
+        return await _fold_postgresql(session, limit)
+
+
+async def _fold_postgresql(session: AsyncSession, limit: int) -> int:
+    # изменяющий CTE и RETURNING столбцов подзапроса ORM не поддерживает, поэтому запрос по таблицам
+    posting, checkpoint = PostingModel.__table__, AccountCheckpointModel.__table__
+    # проводки счетов, точка которых создана уже после запроса выше, ждут следующего раза;
+    # проводки, которые сворачивает одновременная задача, пропускаются
+    batch = (
+        select(posting.c.id)
+        .join(checkpoint, checkpoint.c.account_id == posting.c.account_id)
+        .order_by(posting.c.id)
+        .limit(limit)
+        .with_for_update(of=posting, skip_locked=True)
+    )
+    folded = (
+        delete(posting)
+        .where(posting.c.id.in_(batch))
+        .returning(posting.c.account_id, posting.c.amount)
+        .cte('folded')
+    )
+    totals = (
+        select(folded.c.account_id, func.sum(folded.c.amount).label('amount'), func.count().label('postings'))
+        .group_by(folded.c.account_id)
+        .subquery()
+    )
+    result = await session.execute(
+        update(checkpoint)
+        .where(checkpoint.c.account_id == totals.c.account_id)
+        .values(amount=checkpoint.c.amount + totals.c.amount, date_updated=func.now())
+        .returning(totals.c.postings)
+    )
+    return sum(result.scalars())
+
+
+async def _fold_sqlite(session: AsyncSession, limit: int) -> int:
+    # в SQLite нет изменяющих CTE, зато писатель один и уже держит блокировку после вставки точек:
+    # все прочитанные проводки зафиксированы, и новых до конца транзакции не появится
+    postings = (await session.execute(
+        select(PostingModel.id, PostingModel.account_id, PostingModel.amount).order_by(PostingModel.id).limit(limit)
+    )).all()
+    if not postings:
+        return 0
+    totals: Dict[int, int] = defaultdict(int)
+    for _, account_id, amount in postings:
+        totals[account_id] += amount
+    for account_id, amount in totals.items():
+        await session.execute(
+            update(AccountCheckpointModel)
+            .where(AccountCheckpointModel.account_id == account_id)
+            .values(amount=AccountCheckpointModel.amount + amount, date_updated=func.now())
+            .execution_options(synchronize_session=False)
+        )
+    await session.execute(delete(PostingModel).where(PostingModel.id <= postings[-1].id))
+    return len(postings)
+
+
+async def compact_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    folded = 0
+    while True:
+        batch = await compact()
+        folded += batch
+        if batch < settings.POSTINGS.COMPACT_BATCH:
+            break
+    if folded:
+        logger.info('Compacted %s postings', folded)
+
+
+async def settle() -> int:
+    """
+    Переносит балансы в amount счетов и удаляет проводки и точки, после этого режим можно выключить
+
+    Проводки, записанные во время переноса, потерялись бы, поэтому бот должен быть остановлен
+
+    :return: у скольких счетов был изменён баланс
+    """
+    async with async_session() as session, session.begin():
+        changed = select(PostingModel.account_id).union(select(AccountCheckpointModel.account_id))
+        result = await session.execute(
+            update(AccountModel)
+            .where(AccountModel.id.in_(changed))
+            .values(amount=balance())
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(delete(PostingModel))
+        await session.execute(delete(AccountCheckpointModel))
+    return result.rowcount
+
+
+async def _run(command: str) -> int:
+    try:
+        if command == 'compact':
+            folded = 0
+            while batch := await compact():
+                folded += batch
+            return folded
+        return await settle()
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['compact', 'settle'], help='свернуть все проводки или перенести балансы')
+    command = parser.parse_args().command
+    count = asyncio.run(_run(command))
+    print(f'{"postings" if command == "compact" else "accounts"}: {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Маршрутизация чтений между основной базой и репликой
+
+Сессия, которая уже писала, читает только из основной базы (RoutingSession в db.base), это работает
+и без пользователя. Кроме того, чтения пользователя, который только что что-то записал, в течение
+REPLICA_STICKINESS секунд идут в основную базу и в следующих обновлениях, чтобы он не увидел
+устаревшие из-за отставания реплики данные. Пользователя обновления выставляет process_update
+(см. common.application)
+"""
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from config import settings
+
+# чистка устаревших отметок о записи, чтобы словарь не рос бесконечно
+_SWEEP_THRESHOLD = 10000
+
+current_user_id: ContextVar[Optional[int]] = ContextVar('current_user_id', default=None)
+_last_writes: Dict[int, float] = {}
+
+
+def _sweep(now: float) -> None:
+    for user_id, written_at in list(_last_writes.items()):
+        if now - written_at > settings.DSN.REPLICA_STICKINESS:
+            del _last_writes[user_id]
+
+
+def mark_write() -> None:
+    user_id = current_user_id.get()
+    if user_id is None:
+        return
+    now = time.monotonic()
+    _last_writes[user_id] = now
+    if len(_last_writes) > _SWEEP_THRESHOLD:
+        _sweep(now)
+
+
+def is_sticky() -> bool:
+    user_id = current_user_id.get()
+    if user_id is None:
+        return False
+    written_at = _last_writes.get(user_id)
+    if written_at is None:
+        return False
+    if time.monotonic() - written_at > settings.DSN.REPLICA_STICKINESS:
+        _last_writes.pop(user_id, None)
+        return False
+    return True
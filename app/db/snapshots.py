@@ -0,0 +1,45 @@
+"""
+Снимки счетов и категорий для user_data
+
+Между шагами диалога в user_data лежат кортежи со значениями, а не объекты ORM: объект держит
+состояние сессии, в которой загружен, и остаётся в памяти вместе с ним, пока пользователь не вернётся
+к боту. Изменения идут запросами по id с проверкой пользователя, снимок в базу не пишется
+"""
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from common.money import Money
+from db import AccountModel, CategoryModel
+
+
+class AccountSnapshot(NamedTuple):
+    id: int
+    title: str
+    # баланс на момент загрузки, только для кнопок и сообщений
+    amount: int
+    currency: str
+    exponent: int
+
+    @property
+    def balance(self) -> Money:
+        return Money(self.amount, self.exponent)
+
+
+class CategorySnapshot(NamedTuple):
+    id: int
+    title: str
+    disabled: bool
+    parent_id: Optional[int]
+
+
+def snapshot_accounts(accounts: Iterable[AccountModel]) -> Dict[int, AccountSnapshot]:
+    return {
+        account.id: AccountSnapshot(account.id, account.title, account.amount, account.currency, account.exponent)
+        for account in accounts
+    }
+
+
+def snapshot_categories(categories: Iterable[CategoryModel]) -> Dict[int, CategorySnapshot]:
+    return {
+        category.id: CategorySnapshot(category.id, category.title, category.disabled, category.parent_id)
+        for category in categories
+    }
@@ -0,0 +1,82 @@
+"""
+SQLite для установок на одном сервере и быстрых прогонов без сервера баз данных
+
+Файл базы открывается в режиме WAL: читатели не блокируют писателя, а фиксация транзакции
+не требует fsync при synchronous=NORMAL. Функция md5 регистрируется на каждом соединении,
+на ней построен индекс поиска дубликатов записей (см. EntryModel), поэтому писать в базу
+можно только через соединения бота или миграций.
+
+Секционирования в SQLite нет: миграция секционирования пропускается, а первичный ключ записей
+и переводов - только id (автоинкремент в SQLite есть лишь у единственного INTEGER PRIMARY KEY).
+"""
+import atexit
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+PRAGMAS = (
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    # без этого SQLite не проверяет внешние ключи и не выполняет ON DELETE CASCADE
+    'foreign_keys=ON',
+    # ожидание блокировки писателя вместо немедленной ошибки database is locked
+    'busy_timeout=5000',
+    # размер страничного кэша в КиБ (отрицательное значение), по умолчанию всего 2 МиБ
+    'cache_size=-65536',
+    'temp_store=MEMORY',
+    'mmap_size=268435456',
+)
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def is_memory(url: str) -> bool:
+    database: Optional[str] = make_url(url).database
+    return database in (None, '', ':memory:')
+
+
+def temporary_url() -> str:
+    """
+    Адрес новой временной базы вместо sqlite:// (база в памяти)
+
+    Настоящая база в памяти есть только у одного соединения, а общая для нескольких соединений
+    работает с блокировками на уровне таблиц. Поэтому это файл в /dev/shm (то есть тоже в памяти),
+    с тем же WAL и пулом соединений, что и у обычного файла, удаляемый при выходе
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    descriptor, path = tempfile.mkstemp(prefix='expensegram-', suffix='.db', dir=directory)
+    os.close(descriptor)
+    atexit.register(_remove_database, path)
+    return f'sqlite+aiosqlite:///{path}'
+
+
+def _remove_database(path: str) -> None:
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(f'{path}{suffix}')
+        except FileNotFoundError:
+            pass
+
+
+def _md5(value: Optional[str]) -> Optional[str]:
+    return None if value is None else hashlib.md5(value.encode()).hexdigest()
+
+
+def _on_connect(dbapi_connection, connection_record) -> None:
+    dbapi_connection.create_function('md5', 1, _md5, deterministic=True)
+    cursor = dbapi_connection.cursor()
+    for pragma in PRAGMAS:
+        cursor.execute(f'PRAGMA {pragma}')
+    cursor.close()
+
+
+def install(engine: AsyncEngine) -> None:
+    """Прагмы и функции на каждом новом соединении движка"""
+    event.listen(engine.sync_engine, 'connect', _on_connect)
@@ -0,0 +1,93 @@
+"""
+Выборка записей по меткам (см. common.tags)
+
+В PostgreSQL метки - массив, GIN-индекс ix_entry_tags построен не по нему, а по ключам
+«пользователь:метка» (функция entry_tag_keys из миграции): записи бот всегда ищет у одного
+пользователя, а частая метка вроде #работа есть у многих, и GIN по самим меткам отдавал бы
+записи всех пользователей. Группа меток - keys @> ARRAY[...], группы из одной метки - одно
+keys && ARRAY[...], оба оператора обслуживает индекс. В SQLite метки - JSON-массив, каждая
+метка проверяется подзапросом к json_each
+"""
+from typing import List, Tuple
+
+from sqlalchemy import ColumnElement, Text, and_, exists, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common.money import Money
+from db import AccountModel, CategoryModel, EntryModel
+from db.base import SQLITE
+
+ENTRIES_LIMIT = 20
+
+
+def _has_tag(tag: str) -> ColumnElement[bool]:
+    values = func.json_each(EntryModel.tags).table_valued('value')
+    return exists(select(values.c.value).where(values.c.value == tag))
+
+
+def _tag_keys(user_id: int, tags: List[str]) -> ColumnElement:
+    # тот же формат, что у entry_tag_keys
+    return literal([f'{user_id}:{tag}' for tag in tags], ARRAY(Text))
+
+
+def tag_filter(user_id: int, groups: List[List[str]]) -> ColumnElement[bool]:
+    """
+    Условие на метки записей пользователя: хотя бы одна группа, в которой есть все метки
+
+    Условие на сам user_id не включает, его добавляет запрос
+    """
+    if SQLITE:
+        return or_(*(and_(*(_has_tag(tag) for tag in group)) for group in groups))
+    keys = func.entry_tag_keys(EntryModel.user_id, EntryModel.tags, type_=ARRAY(Text))
+    if all(len(group) == 1 for group in groups):
+        return keys.overlap(_tag_keys(user_id, [tag for tag, in groups]))
+    return or_(*(keys.contains(_tag_keys(user_id, group)) for group in groups))
+
+
+def _entries_filter(user_id: int, groups: List[List[str]]) -> List[ColumnElement[bool]]:
+    conditions = [EntryModel.user_id == user_id]
+    if groups:
+        conditions.append(tag_filter(user_id, groups))
+    return conditions
+
+
+async def find_entries(
+    session: AsyncSession, user_id: int, groups: List[List[str]], limit: int = ENTRIES_LIMIT,
+) -> List[Tuple[EntryModel, str, Money, str]]:
+    """
+    Последние записи пользователя, подходящие под группы меток, пустой список групп - все записи
+
+    :return: запись, название категории, сумма и валюта счёта
+    """
+    result = await session.execute(
+        select(EntryModel, CategoryModel.title, AccountModel.currency, AccountModel.exponent)
+        .join(CategoryModel, CategoryModel.id == EntryModel.category_id)
+        .join(AccountModel, AccountModel.id == EntryModel.account_id)
+        .where(*_entries_filter(user_id, groups))
+        .order_by(EntryModel.date_created.desc(), EntryModel.id.desc())
+        .limit(limit)
+    )
+    return [
+        (entry, category, Money(entry.amount, exponent), currency) for entry, category, currency, exponent in result
+    ]
+
+
+async def tag_totals(
+    session: AsyncSession, user_id: int, groups: List[List[str]],
+) -> Tuple[int, List[Tuple[Money, str]]]:
+    """:return: количество подходящих записей и их суммы по валютам счетов"""
+    result = await session.execute(
+        select(AccountModel.currency, AccountModel.exponent, func.count(), func.sum(EntryModel.amount))
+        .select_from(EntryModel)
+        .join(AccountModel, AccountModel.id == EntryModel.account_id)
+        .where(*_entries_filter(user_id, groups))
+        .group_by(AccountModel.currency, AccountModel.exponent)
+        .order_by(AccountModel.currency)
+    )
+    count, totals = 0, []
+    for currency, exponent, entries, total in result:
+        count += entries
+        # sum() по BIGINT в PostgreSQL - NUMERIC
+        totals.append((Money(int(total), exponent), currency))
+    return count, totals
@@ -0,0 +1,189 @@
+"""
+Единица работы: одна сессия и одна транзакция на всё обновление
+
+Сессия создаётся лениво при первом обращении через get_session(), обработчики внутри делают только flush.
+Изменения фиксируются перед первым ответом пользователю (commit_before_reply, вызывается из
+common.utils): сообщение об успехе уходит только после успешной фиксации, а если фиксация не удалась
+или обновление уже обработано, ответа нет. Остальное фиксируется по окончании обработки обновления.
+Если задан ключ обновления, перед первой фиксацией изменений он записывается в журнал обработанных
+обновлений (см. db.ledger)
+"""
+import re
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import ledger
+from db.base import async_session, engine, replica_engine
+
+
+@dataclass
+class UnitOfWorkStats:
+    # SQL-запросы
+    statements: int = 0
+    # из них INSERT/UPDATE/DELETE
+    writes: int = 0
+    # запросы плюс BEGIN/COMMIT/ROLLBACK
+    round_trips: int = 0
+    # изменения отброшены: обновление уже было обработано
+    duplicate: bool = False
+
+
+class DuplicateUpdate(Exception):
+    """Обновление уже обработано: изменения откатены, отвечать пользователю не нужно"""
+
+
+class UnitOfWork:
+
+    def __init__(self, update_key: Optional[Tuple[int, int]] = None):
+        self.update_key = update_key
+        self.stats = UnitOfWorkStats()
+        # выставляется, если обработчик завершился ошибкой, тогда транзакция откатывается
+        self.failed = False
+        # INSERT/UPDATE/DELETE после последней фиксации
+        self.pending_writes = 0
+        self._recorded = False
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def has_writes(self) -> bool:
+        """Есть ли в транзакции изменения, которых ещё не видят другие сессии"""
+        if self.pending_writes:
+            return True
+        session = self._session
+        return session is not None and bool(session.new or session.dirty or session.deleted)
+
+    @property
+    def wrote(self) -> bool:
+        """Писала ли сессия в основную базу, в том числе уже зафиксированные изменения"""
+        return self._session is not None and self._session.sync_session.wrote
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = async_session()
+        return self._session
+
+    async def commit(self) -> None:
+        if self._session is None or not self._session.in_transaction():
+            return
+        if self.update_key is not None and not self._recorded and self.has_writes:
+            if not await ledger.record(self._session, self.update_key):
+                self.stats.duplicate = True
+                await self.rollback()
+                return
+            self._recorded = True
+        await self._session.commit()
+        self.pending_writes = 0
+
+    async def rollback(self) -> None:
+        if self._session is not None and self._session.in_transaction():
+            await self._session.rollback()
+        self.pending_writes = 0
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_CTE_WRITE_RE = re.compile(r'\b(?:INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+_current: ContextVar[Optional[UnitOfWork]] = ContextVar('unit_of_work', default=None)
+_active = 0
+
+# вызываются со статистикой по завершении каждой единицы работы
+stats_listeners: List[Callable[[UnitOfWorkStats], None]] = []
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    return _current.get()
+
+
+def active_units_of_work() -> int:
+    """Сколько единиц работы (обновлений) обрабатывается сейчас"""
+    return _active
+
+
+def get_session() -> AsyncSession:
+    uow = _current.get()
+    if uow is None:
+        raise RuntimeError('get_session() called outside of unit_of_work()')
+    return uow.session
+
+
+async def commit_before_reply() -> None:
+    """
+    Фиксирует изменения текущего обновления до ответа пользователю, без изменений ничего не делает
+
+    :raises DuplicateUpdate: обновление уже обработано, изменения откатены
+    """
+    uow = _current.get()
+    if uow is None or not uow.has_writes:
+        return
+    await uow.commit()
+    if uow.stats.duplicate:
+        raise DuplicateUpdate
+
+
+@asynccontextmanager
+async def unit_of_work(update_key: Optional[Tuple[int, int]] = None) -> AsyncIterator[UnitOfWork]:
+    """
+    :param update_key: (update_id, message_id) обрабатываемого обновления, изменения повторно
+        доставленного обновления откатываются
+    """
+    global _active
+    uow = UnitOfWork(update_key)
+    token = _current.set(uow)
+    _active += 1
+    try:
+        yield uow
+        if uow.failed:
+            await uow.rollback()
+        else:
+            await uow.commit()
+    except BaseException:
+        uow.failed = True
+        await uow.rollback()
+        raise
+    finally:
+        _active -= 1
+        await uow.close()
+        _current.reset(token)
+        for listener in stats_listeners:
+            listener(uow.stats)
+
+
+def _is_write(statement: str) -> bool:
+    head = statement.lstrip()[:6].upper()
+    if head in ('INSERT', 'UPDATE', 'DELETE'):
+        return True
+    # изменяющие CTE (WITH ... INSERT), например слияние импорта в db.importer
+    return head.startswith('WITH') and _CTE_WRITE_RE.search(statement) is not None
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    uow = _current.get()
+    if uow is None:
+        return
+    uow.stats.statements += 1
+    uow.stats.round_trips += 1
+    if _is_write(statement):
+        uow.stats.writes += 1
+        uow.pending_writes += 1
+
+
+def _count_round_trip(conn, *args):
+    uow = _current.get()
+    if uow is not None:
+        uow.stats.round_trips += 1
+
+
+for _engine in {engine, replica_engine}:
+    event.listen(_engine.sync_engine, 'before_cursor_execute', _count_statement)
+    for _event_name in ('begin', 'commit', 'rollback'):
+        event.listen(_engine.sync_engine, _event_name, _count_round_trip)
@@ -1,4 +1,30 @@
-from .start import start, help_
-from .categories import Categories
-from .add import Add
-from .accounts import Accounts
+"""
+Модули обработчиков импортируются при первом обращении к атрибуту пакета (PEP 562),
+так что инструменты, которым нужен один обработчик, не тянут остальные
+"""
+from importlib import import_module
+
+_EXPORTS = {
+    'start': 'start',
+    'help_': 'start',
+    'Categories': 'categories',
+    'Add': 'add',
+    'Accounts': 'accounts',
+    'Import': 'imports',
+    'Entries': 'entries',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
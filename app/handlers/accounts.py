@@ -1,4 +1,4 @@
-from sqlalchemy import select
+from sqlalchemy import update as sql_update
 from sqlalchemy.exc import IntegrityError
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
@@ -8,10 +8,13 @@ from telegram.ext import (
     MessageHandler,
     filters,
     CallbackQueryHandler,
+    TypeHandler,
 )
 
 from common import constants
 from common.constants import COMMAND_CANCEL, COMMAND_ACCOUNTS
+from common.keyboards import account_items, build_keyboard, page_handler
+from common.money import Money, currency_exponent
 from common.utils import (
     get_user_id,
     cancel,
@@ -20,10 +23,17 @@ from common.utils import (
     edit_last_message,
     delete_last_message,
     close,
-    flush_user_data, user_amount_to_db_amount,
+    expire,
+    flush_user_data,
+    remember_message,
+    render_template,
 )
+from config import settings
 from db import AccountModel
-from db.base import async_session
+from db.deletes import delete_account
+from db.loaders import get_accounts
+from db.snapshots import snapshot_accounts
+from db.uow import get_session
 
 
 class Accounts:
@@ -64,59 +74,56 @@ class Accounts:
                     MessageHandler(filters.Regex(rf'^/{COMMAND_CANCEL}$'), close),
                     MessageHandler(filters.TEXT, cls.create),
                 ],
-                cls.STATE__SHOW_ACCOUNT_ACTIONS: [CallbackQueryHandler(cls.show_account_actions)],
+                cls.STATE__SHOW_ACCOUNT_ACTIONS: [
+                    page_handler(cls.accounts_keyboard),
+                    CallbackQueryHandler(cls.show_account_actions),
+                ],
                 cls.STATE__CHOOSE_ACCOUNT_ACTION: [CallbackQueryHandler(cls.choose_account_action)],
                 cls.STATE__DELETE_CONFIRM: [CallbackQueryHandler(cls.delete_confirm)],
                 cls.STATE__EDIT: [
                     MessageHandler(filters.Regex(rf'^/{COMMAND_CANCEL}$'), cancel),
                     MessageHandler(filters.TEXT, cls.edit),
                 ],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, expire)],
             },
             fallbacks=[CommandHandler(constants.COMMAND_CANCEL, cancel)],
             allow_reentry=True,
+            conversation_timeout=settings.CONVERSATION_TIMEOUT or None,
+        )
+
+    @classmethod
+    def accounts_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        accounts = context.user_data['accounts']
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind='accounts',
+            items=lambda: account_items(accounts.values()),
+            header=[
+                [InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)],
+                [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
+            ],
+            page=page,
         )
 
     @classmethod
     async def entrypoint(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = await get_user_id(update, context)
 
-        async with async_session() as session:
-            accounts = (await session.execute(select(AccountModel).filter_by(user_id=user_id))).scalars().all()
+        accounts = await get_accounts(user_id)
 
         if not accounts:
-            text = (
-                'У вас нет счетов, введите название нового, например:\n\n'
-                '    <code>Лучший Банк</code>\n'
-                '    <code>Наличка</code>\n\n'
-                '(/cancel для отмены)'
-            )
+            text = render_template('accounts/empty.html')
             msg = await send_response(update=update, context=context, response=text)
-            context.user_data['msg'] = msg
+            remember_message(context, msg)
             return cls.STATE__CREATE__TITLE
 
-        accounts = {account.id: account for account in accounts}
-        context.user_data['accounts'] = accounts
+        context.user_data['accounts'] = snapshot_accounts(accounts)
 
-        # распределяем кнопки по 2 в ряд
-        keyboard_map = []
-        for i, account in enumerate(accounts.values()):
-            button = InlineKeyboardButton(
-                f'{account.title} ({account.amount} {account.currency})', callback_data=account.id,
-            )
-            if not i % 2:
-                keyboard_map.append([button])
-            else:
-                keyboard_map[-1].append(button)
-
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)],
-            [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
-            *keyboard_map,
-        ])
+        reply_markup = cls.accounts_keyboard(context)
         msg = await send_response(
-            update=update, context=context, response='Выберите счёт', reply_markup=reply_markup,
+            update=update, context=context, response=render_template('accounts/choose.html'), reply_markup=reply_markup,
         )
-        context.user_data['msg'] = msg
+        remember_message(context, msg)
         return cls.STATE__SHOW_ACCOUNT_ACTIONS
 
     @classmethod
@@ -128,24 +135,21 @@ class Accounts:
             existing_titles_lower = [c.title.lower() for c in context.user_data['accounts'].values()]
 
         if title.startswith('/'):
-            await send_response(update=update, context=context, response='Название нельзя начинать с /')
+            await send_response(
+                update=update, context=context, response=render_template('common/title_starts_with_slash.html'),
+            )
             return await cls.entrypoint(update, context)
         elif title.capitalize() in cls.BAD_WORDS:
-            await send_response(update=update, context=context, response='Такое название нельзя использовать')
+            await send_response(update=update, context=context, response=render_template('common/title_forbidden.html'))
             return await cls.entrypoint(update, context)
         elif title.lower() in existing_titles_lower:
-            await send_response(update=update, context=context, response=f'Счёт <b>{title}</b> уже есть')
+            await send_response(
+                update=update, context=context, response=render_template('accounts/exists.html', title=title),
+            )
             return await cls.entrypoint(update, context)
         context.user_data['title'] = title
 
-        text = (
-            f'Введите начальную сумму счёта <b>{title}</b> с обозначением валюты через пробел, например:\n\n'
-            '   <code>0 руб</code>\n'
-            '   <code>300 $</code>\n'
-            '   <code>10к тенге</code>\n'
-            '   <code>3kk сум</code>\n\n'
-            '(/cancel для отмены)'
-        )
+        text = render_template('accounts/enter_amount.html', title=title)
         await send_response(update=update, context=context, response=text)
 
         return cls.STATE__CREATE
@@ -155,35 +159,40 @@ class Accounts:
         user_id = await get_user_id(update, context)
         message = update.message.text
         if message.count(' ') != 1:
-            await send_response(update=update, context=context, response='Неверный формат ввода')
+            await send_response(update=update, context=context, response=render_template('common/invalid_format.html'))
             return await cls.create__title(update, context)
         amount, currency = update.message.text.split(' ')
-        amount = user_amount_to_db_amount(amount)
+        exponent = currency_exponent(currency)
+        amount = Money.parse(amount, exponent)
+        if amount is None:
+            await send_response(update=update, context=context, response=render_template('common/invalid_format.html'))
+            return await cls.create__title(update, context)
         title = context.user_data['title']
 
         account = AccountModel(
             title=title,
             user_id=user_id,
-            amount=amount,
+            amount=amount.minor,
             currency=currency,
+            exponent=exponent,
         )
-        async with async_session() as session:
-            try:
+        session = get_session()
+        try:
+            async with session.begin_nested():
                 session.add(account)
-                await session.commit()
-            except IntegrityError:
-                await send_response(
-                    update=update,
-                    context=context,
-                    response=f'Счёт <b>{title}</b> уже есть',
-                )
-                await flush_user_data(update, context)
-                return await cls.entrypoint(update, context)
+        except IntegrityError:
+            await send_response(
+                update=update,
+                context=context,
+                response=render_template('accounts/exists.html', title=title),
+            )
+            await flush_user_data(update, context)
+            return await cls.entrypoint(update, context)
 
         await send_response(
-            update=update, context=context, response=(
-                f'Счёт <b>{account.title}</b> создан с начальной суммой в <b>{amount} {currency}</b>'
-            ),
+            update=update,
+            context=context,
+            response=render_template('accounts/created.html', title=account.title, amount=amount, currency=currency),
         )
         await flush_user_data(update, context)
         return await cls.entrypoint(update, context)
@@ -197,13 +206,7 @@ class Accounts:
             await close(update, context)
             return ConversationHandler.END
         if query_data == cls.ACTION__ADD:
-            text = (
-                'Введите название нового счёта, например:\n\n'
-                '    <code>Лучший Банк</code>\n'
-                '    <code>Наличка</code>\n\n'
-                '(/cancel для отмены)'
-            )
-            await edit_last_message(update, text)
+            await edit_last_message(update, render_template('accounts/enter_title.html'))
             return cls.STATE__CREATE__TITLE
 
         account_id = force_int(query_data)
@@ -226,7 +229,7 @@ class Accounts:
 
         await edit_last_message(
             update=update,
-            text=f'Выберите действие над счётом <b>{account_title}</b>',
+            text=render_template('accounts/choose_action.html', title=account_title),
             reply_markup=reply_markup,
         )
         return cls.STATE__CHOOSE_ACCOUNT_ACTION
@@ -243,6 +246,7 @@ class Accounts:
 
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
 
         if query_data == cls.ACTION__DELETE:
@@ -256,10 +260,7 @@ class Accounts:
 
             await edit_last_message(
                 update=update,
-                text=(
-                    f'Вы уверены, что хотите удалить счёт <b>{account_title}</b>? '
-                    'Это удалит также и все записи по нему'
-                ),
+                text=render_template('accounts/delete_confirm.html', title=account_title),
                 reply_markup=InlineKeyboardMarkup(keyboard),
             )
             return cls.STATE__DELETE_CONFIRM
@@ -267,7 +268,7 @@ class Accounts:
         if query_data == cls.ACTION__EDIT:
             await edit_last_message(
                 update=update,
-                text=f'Введите новое название для счёта <b>{account_title}</b> (/cancel для отмены):',
+                text=render_template('accounts/enter_new_title.html', title=account_title),
             )
             return cls.STATE__EDIT
 
@@ -284,6 +285,7 @@ class Accounts:
             return await cls.entrypoint(update, context)
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
 
     @classmethod
@@ -291,13 +293,13 @@ class Accounts:
         account_id = context.user_data['account_id']
         account_title = context.user_data['account_title']
 
-        async with async_session() as session:
-            account = (await session.execute(select(AccountModel).filter_by(id=account_id))).scalars().one()
-            await session.delete(account)
-            await session.commit()
+        user_id = await get_user_id(update, context)
+        await delete_account(get_session(), user_id, account_id)
 
         await flush_user_data(update, context)
-        await send_response(update=update, context=context, response=f'Счёт <b>{account_title}</b> удалён')
+        await send_response(
+            update=update, context=context, response=render_template('accounts/deleted.html', title=account_title),
+        )
         return await cls.entrypoint(update, context)
 
     @classmethod
@@ -308,30 +310,33 @@ class Accounts:
         existing_titles_lower = (c.title.lower() for c in context.user_data['accounts'].values())
 
         if new_title.startswith('/'):
-            await send_response(update=update, context=context, response='Название нельзя начинать с /')
+            await send_response(
+                update=update, context=context, response=render_template('common/title_starts_with_slash.html'),
+            )
             return await cls.entrypoint(update, context)
         elif new_title == old_title:
-            await send_response(update=update, context=context, response='Название не отличается от предыдущего')
+            await send_response(update=update, context=context, response=render_template('common/title_unchanged.html'))
             return await cls.entrypoint(update, context)
         elif new_title.capitalize() in cls.BAD_WORDS:
-            await send_response(update=update, context=context, response='Такое название нельзя использовать')
+            await send_response(update=update, context=context, response=render_template('common/title_forbidden.html'))
             return await cls.entrypoint(update, context)
         elif new_title.lower() in existing_titles_lower:
             await send_response(
-                update=update, context=context, response=f'Счёт <b>{new_title}</b> уже есть',
+                update=update, context=context, response=render_template('accounts/exists.html', title=new_title),
             )
             return await cls.entrypoint(update, context)
 
-        async with async_session() as session:
-            account = (await session.execute(select(AccountModel).filter_by(id=account_id))).scalars().one()
-            account.title = new_title
-            session.add(account)
-            await session.commit()
+        user_id = await get_user_id(update, context)
+        await get_session().execute(
+            sql_update(AccountModel)
+            .where(AccountModel.id == account_id, AccountModel.user_id == user_id)
+            .values(title=new_title)
+        )
 
         await flush_user_data(update, context)
         await send_response(
             update=update,
             context=context,
-            response=f'Счёт <b>{old_title}</b> теперь имеет имя <b>{new_title}</b>',
+            response=render_template('accounts/renamed.html', old_title=old_title, new_title=new_title),
         )
         return await cls.entrypoint(update, context)
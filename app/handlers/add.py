@@ -1,7 +1,5 @@
-from decimal import Decimal
 from typing import Tuple, Optional
 
-from sqlalchemy import select, func
 from sqlalchemy.exc import IntegrityError
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Message
 from telegram.ext import (
@@ -10,21 +8,31 @@ from telegram.ext import (
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters,
 )
 
 from common import constants
 from common.constants import COMMAND_CANCEL, COMMAND_ADD
+from common.keyboards import account_items, build_keyboard, category_items, page_handler
+from common.money import Money, currency_exponent
+from common.tags import extract_tags, strip_tags
 from common.utils import (
     cancel,
     send_response,
     delete_last_message,
     get_user_id,
-    user_amount_to_db_amount,
     edit_last_message, flush_user_data,
+    expire,
+    render_template,
 )
+from config import settings
 from db import CategoryModel, AccountModel, EntryModel, TransferModel
-from db.base import async_session
+from db.categories import add_to_tree
+from db.loaders import get_accounts, get_categories
+from db.postings import change_balances
+from db.snapshots import snapshot_accounts, snapshot_categories
+from db.uow import get_session
 
 
 class Add:
@@ -66,8 +74,14 @@ class Add:
                     CallbackQueryHandler(cls.create_transfer__choose_account_from, pattern=cls.ACTION__TRANSFER),
                     CallbackQueryHandler(cls.create_entry__remember_entry_type),
                 ],
-                cls.STATE__CREATE_ENTRY__CHOOSE_ACCOUNT: [CallbackQueryHandler(cls.create_entry__choose_account)],
-                cls.STATE__CREATE_ENTRY__ENTER_AMOUNT: [CallbackQueryHandler(cls.create_entry__enter_amount)],
+                cls.STATE__CREATE_ENTRY__CHOOSE_ACCOUNT: [
+                    page_handler(cls.entry_accounts_keyboard),
+                    CallbackQueryHandler(cls.create_entry__choose_account),
+                ],
+                cls.STATE__CREATE_ENTRY__ENTER_AMOUNT: [
+                    page_handler(cls.entry_categories_keyboard),
+                    CallbackQueryHandler(cls.create_entry__enter_amount),
+                ],
                 cls.STATE__CREATE_ENTRY: [
                     MessageHandler(filters.Regex(rf'^/{COMMAND_CANCEL}$'), cancel),
                     MessageHandler(filters.TEXT, cls.create_entry),
@@ -85,18 +99,73 @@ class Add:
                     MessageHandler(filters.TEXT, cls.create_account),
                 ],
                 cls.STATE__CREATE_TRANSFER__CHOOSE_ACCOUNT_TO: [
+                    page_handler(cls.transfer_accounts_from_keyboard),
                     CallbackQueryHandler(cls.create_transfer__choose_account_to),
                 ],
                 cls.STATE__CREATE_TRANSFER__ENTER_AMOUNT: [
+                    page_handler(cls.transfer_accounts_to_keyboard),
                     CallbackQueryHandler(cls.create_transfer__enter_amount),
                 ],
                 cls.STATE__CREATE_TRANSFER: [
                     MessageHandler(filters.Regex(rf'^/{COMMAND_CANCEL}$'), cancel),
                     MessageHandler(filters.TEXT, cls.create_transfer),
                 ],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, expire)],
             },
             fallbacks=[CommandHandler(constants.COMMAND_CANCEL, cancel)],
             allow_reentry=True,
+            conversation_timeout=settings.CONVERSATION_TIMEOUT or None,
+        )
+
+    @classmethod
+    def entry_accounts_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        accounts = context.user_data['accounts']
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind='add:accounts',
+            items=lambda: account_items(accounts.values()),
+            header=[
+                [InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)],
+                [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
+            ],
+            page=page,
+        )
+
+    @classmethod
+    def entry_categories_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        categories = context.user_data['categories']
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind='add:categories',
+            items=lambda: category_items(categories.values()),
+            header=[
+                [InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)],
+                [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
+            ],
+            page=page,
+        )
+
+    @classmethod
+    def transfer_accounts_from_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        accounts = context.user_data['accounts']
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind='transfer:from',
+            items=lambda: account_items(accounts.values()),
+            header=[[InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)]],
+            page=page,
+        )
+
+    @classmethod
+    def transfer_accounts_to_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        account_id_from = context.user_data['account_id_from']
+        accounts = context.user_data['accounts']
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind=f'transfer:to:{account_id_from}',
+            items=lambda: account_items(a for a in accounts.values() if a.id != account_id_from),
+            header=[[InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)]],
+            page=page,
         )
 
     @classmethod
@@ -104,11 +173,8 @@ class Add:
         user_id = await get_user_id(update, context)
 
         upper_buttons = [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)]
-        async with async_session() as session:
-            accounts_count = (
-                await session.execute(select(func.count()).select_from(AccountModel).filter_by(user_id=user_id))
-            ).scalar_one()
-        if accounts_count >= 2:
+        accounts = await get_accounts(user_id)
+        if len(accounts) >= 2:
             upper_buttons.insert(0, InlineKeyboardButton(cls.ACTION__TRANSFER, callback_data=cls.ACTION__TRANSFER))
 
         reply_markup = InlineKeyboardMarkup([
@@ -119,9 +185,9 @@ class Add:
             ],
         ])
         msg = await send_response(
-            update=update, context=context, response='Выберите тип записи', reply_markup=reply_markup,
+            update=update, context=context, response=render_template('add/choose_type.html'), reply_markup=reply_markup,
         )
-        context.user_data['last_msg'] = msg
+        context.user_data['last_msg'] = msg.message_id
         return cls.STATE__CREATE_ENTRY__CATEGORY_ACCOUNT_CHECK
 
     @classmethod
@@ -131,6 +197,7 @@ class Add:
         query_data = update.callback_query.data
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
         if query_data == cls.ACTION__INCOME:
             context.user_data['entry_type'] = cls.ACTION__INCOME
@@ -143,44 +210,25 @@ class Add:
     async def create_entry__category_account_check(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = await get_user_id(update, context)
 
-        async with async_session() as session:
-            accounts = (await session.execute(select(AccountModel).filter_by(user_id=user_id))).scalars().all()
+        accounts = await get_accounts(user_id)
         if not accounts:
-            text = 'У вас нет ни одного счёта, введите название нового (/cancel для отмены):'
+            text = render_template('add/no_accounts.html')
             await edit_last_message(update=update, text=text)
             return cls.STATE__CREATE_ACCOUNT__TITLE
-        accounts = {account.id: account for account in accounts}
-        context.user_data['accounts'] = accounts
-        # распределяем кнопки по 2 в ряд
-        keyboard_map = []
-        for i, account in enumerate(accounts.values()):
-            button = InlineKeyboardButton(
-                f'{account.title} ({account.amount} {account.currency})', callback_data=account.id,
-            )
-            if not i % 2:
-                keyboard_map.append([button])
-            else:
-                keyboard_map[-1].append(button)
-
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)],
-            [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
-            *keyboard_map,
-        ])
-        if context.user_data['entry_type'] == cls.ACTION__INCOME:
-            entry_type_str = '<b>дохода</b>'
-        else:
-            entry_type_str = '<b>расхода</b>'
-        text = f'Выберите счёт для записи {entry_type_str}'
+        context.user_data['accounts'] = snapshot_accounts(accounts)
+        reply_markup = cls.entry_accounts_keyboard(context)
+        text = render_template(
+            'add/choose_account.html', income=context.user_data['entry_type'] == cls.ACTION__INCOME,
+        )
         if context.user_data.get('last_msg'):
             msg = await edit_last_message(update=update, text=text, reply_markup=reply_markup)
             if isinstance(msg, Message):
-                context.user_data['last_msg'] = msg
+                context.user_data['last_msg'] = msg.message_id
             else:
                 del context.user_data['last_msg']
         else:
             msg = await send_response(update=update, context=context, response=text, reply_markup=reply_markup)
-            context.user_data['last_msg'] = msg
+            context.user_data['last_msg'] = msg.message_id
         return cls.STATE__CREATE_ENTRY__CHOOSE_ACCOUNT
 
     @classmethod
@@ -190,9 +238,10 @@ class Add:
         query_data = update.callback_query.data
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
         if query_data == cls.ACTION__ADD:
-            text = 'Введите название нового счёта (/cancel для отмены):'
+            text = render_template('add/enter_account_title.html')
             if context.user_data.get('last_msg'):
                 await edit_last_message(update=update, text=text)
                 del context.user_data['last_msg']
@@ -211,46 +260,30 @@ class Add:
     async def create_entry__choose_category(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = await get_user_id(update, context)
 
-        async with async_session() as session:
-            categories = (await session.execute(select(CategoryModel).filter_by(user_id=user_id))).scalars().all()
+        categories = await get_categories(user_id)
         if not categories:
-            text = 'У вас нет ни одной категории, введите название новой (/cancel для отмены):'
+            text = render_template('add/no_categories.html')
             await send_response(update=update, context=context, response=text)
             return cls.STAGE__CREATE_CATEGORY
-        categories = {category.id: category for category in categories if not category.disabled}
+        categories = snapshot_categories(category for category in categories if not category.disabled)
         context.user_data['categories'] = categories
 
-        # распределяем кнопки по 2 в ряд
-        keyboard_map = []
-        for i, category in enumerate(categories.values()):
-            button = InlineKeyboardButton(category.title, callback_data=category.id)
-            if not i % 2:
-                keyboard_map.append([button])
-            else:
-                keyboard_map[-1].append(button)
-
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)],
-            [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
-            *keyboard_map,
-        ])
+        reply_markup = cls.entry_categories_keyboard(context)
 
         if 'accounts' not in context.user_data:
-            async with async_session() as session:
-                accounts = (await session.execute(select(AccountModel).filter_by(user_id=user_id))).scalars().all()
+            accounts = await get_accounts(user_id)
             if not accounts:
-                text = 'У вас нет ни одного счёта, введите название нового (/cancel для отмены):'
+                text = render_template('add/no_accounts.html')
                 await edit_last_message(update=update, text=text)
                 return cls.STATE__CREATE_ACCOUNT__TITLE
-            accounts = {account.id: account for account in accounts}
-            context.user_data['accounts'] = accounts
+            context.user_data['accounts'] = snapshot_accounts(accounts)
 
         account_title = context.user_data['accounts'][context.user_data['account_id']].title
-        if context.user_data['entry_type'] == cls.ACTION__INCOME:
-            entry_type_str = '<b>дохода</b> на счёт'
-        else:
-            entry_type_str = '<b>расхода</b> со счёта'
-        text = f'Выберите категорию записи {entry_type_str} <b>{account_title}</b>'
+        text = render_template(
+            'add/choose_category.html',
+            income=context.user_data['entry_type'] == cls.ACTION__INCOME,
+            account_title=account_title,
+        )
         if context.user_data.get('last_msg'):
             await edit_last_message(update=update, text=text, reply_markup=reply_markup)
             del context.user_data['last_msg']
@@ -265,11 +298,12 @@ class Add:
         query_data = update.callback_query.data
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
         if query_data == cls.ACTION__ADD:
             await edit_last_message(
                 update=update,
-                text='Введите название новой категории (/cancel для отмены):',
+                text=render_template('add/enter_category_title.html'),
             )
             return cls.STAGE__CREATE_CATEGORY
 
@@ -277,22 +311,14 @@ class Add:
         context.user_data['category_id'] = category_id
         category_title = context.user_data['categories'][category_id].title
 
-        if context.user_data['entry_type'] == cls.ACTION__INCOME:
-            entry_type_str = 'дохода'
-        else:
-            entry_type_str = 'расхода'
         account_title = context.user_data['accounts'][context.user_data['account_id']].title
         await edit_last_message(
             update=update,
-            text=(
-                f'Введите сумму %s на <b>{category_title}</b> со счёта <b>{account_title}</b> '
-                'с заметкой, если нужно, по следующим примерам:\n\n'
-                '    <code>100</code>\n'
-                '    <code>10k</code>\n'
-                '    <code>1,5к</code>\n'
-                '    <code>100к работа</code>\n'
-                '    <code>100\n  вода</code>\n\n'
-                '/cancel для отмены' % entry_type_str
+            text=render_template(
+                'add/enter_amount.html',
+                income=context.user_data['entry_type'] == cls.ACTION__INCOME,
+                category_title=category_title,
+                account_title=account_title,
             ),
         )
 
@@ -300,35 +326,33 @@ class Add:
 
     @classmethod
     async def create_entry(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        amount, title = cls._prepare_entry_amount(update.message.text)
+        account_id = context.user_data['account_id']
+        account = context.user_data['accounts'][account_id]
+        # метки из заметки хранятся отдельно, иначе цифры в них попали бы в сумму: «350 #поездка2023»
+        tags = extract_tags(update.message.text)
+        amount, title = cls._prepare_entry_amount(strip_tags(update.message.text), account.exponent)
         if amount is None:
-            await send_response(update=update, context=context, response='Неверный формат ввода')
+            await send_response(update=update, context=context, response=render_template('common/invalid_format.html'))
             return await cls.entrypoint(update, context)
         if context.user_data['entry_type'] == cls.ACTION__EXPENSE:
-            amount *= -1
+            amount = -amount
         user_id = await get_user_id(update, context)
-        account_id = context.user_data['account_id']
-        account = context.user_data['accounts'][account_id]
         category_id = context.user_data['category_id']
 
         entry = EntryModel(
-            user_id=user_id, amount=amount, title=title, category_id=category_id, account_id=account_id,
+            user_id=user_id, amount=amount.minor, title=title, tags=tags, category_id=category_id,
+            account_id=account_id,
         )
-        async with async_session() as session:
-            account.amount += amount
-            session.add(account)
-            session.add(entry)
-            await session.commit()
+        session = get_session()
+        session.add(entry)
+        account = (await change_balances(session, [(account, amount.minor)]))[account_id]
 
         await send_response(
             update=update,
             context=context,
-            response=(
-                f'Запись добавлена, теперь баланс счёта <b>{account.title}</b> '
-                f'составляет {account.amount} {account.currency}.\n\n'
-                f'/{COMMAND_ADD} - повторить'
-            ),
+            response=render_template('add/entry_created.html', account=account),
         )
+        await flush_user_data(update, context)
         return ConversationHandler.END
 
     @classmethod
@@ -339,25 +363,22 @@ class Add:
             existing_titles_lower = [c.title.lower() for c in context.user_data['accounts'].values()]
 
         if title.startswith('/'):
-            await send_response(update=update, context=context, response='Название нельзя начинать с /')
+            await send_response(
+                update=update, context=context, response=render_template('common/title_starts_with_slash.html'),
+            )
             return await cls.entrypoint(update, context)
         elif title.capitalize() in cls.BAD_WORDS:
-            await send_response(update=update, context=context, response='Такое название нельзя использовать')
+            await send_response(update=update, context=context, response=render_template('common/title_forbidden.html'))
             return await cls.entrypoint(update, context)
         elif title.lower() in existing_titles_lower:
-            await send_response(update=update, context=context, response=f'Счёт <b>{title}</b> уже есть')
+            await send_response(
+                update=update, context=context, response=render_template('accounts/exists.html', title=title),
+            )
             return await cls.entrypoint(update, context)
 
         context.user_data['account_title'] = title
 
-        text = (
-            f'Введите начальную сумму счёта <b>{title}</b> с обозначением валюты через пробел, например:\n\n'
-            '   <code>0 руб</code>\n'
-            '   <code>300 $</code>\n'
-            '   <code>10к тенге</code>\n'
-            '   <code>3kk сум</code>\n\n'
-            '(/cancel для отмены)'
-        )
+        text = render_template('accounts/enter_amount.html', title=title)
         await send_response(update=update, context=context, response=text)
 
         return cls.STATE__CREATE_ACCOUNT
@@ -367,37 +388,42 @@ class Add:
         user_id = await get_user_id(update, context)
         message = update.message.text
         if message.count(' ') != 1:
-            await send_response(update=update, context=context, response='Неверный формат ввода')
+            await send_response(update=update, context=context, response=render_template('common/invalid_format.html'))
             return await cls.create_account__title(update, context)
         amount, currency = update.message.text.split(' ')
-        amount = user_amount_to_db_amount(amount)
+        exponent = currency_exponent(currency)
+        amount = Money.parse(amount, exponent)
+        if amount is None:
+            await send_response(update=update, context=context, response=render_template('common/invalid_format.html'))
+            return await cls.create_account__title(update, context)
         title = context.user_data['account_title']
 
         account = AccountModel(
             title=title,
             user_id=user_id,
-            amount=amount,
+            amount=amount.minor,
             currency=currency,
+            exponent=exponent,
         )
-        async with async_session() as session:
-            try:
+        session = get_session()
+        try:
+            async with session.begin_nested():
                 session.add(account)
-                await session.commit()
-            except IntegrityError:
-                await send_response(
-                    update=update,
-                    context=context,
-                    response=f'Счёт <b>{title}</b> уже есть',
-                )
-                await flush_user_data(update, context)
-                return await cls.entrypoint(update, context)
+        except IntegrityError:
+            await send_response(
+                update=update,
+                context=context,
+                response=render_template('accounts/exists.html', title=title),
+            )
+            await flush_user_data(update, context)
+            return await cls.entrypoint(update, context)
 
         context.user_data['account_id'] = account.id
         await flush_user_data(update, context, exclude=['account_id', 'entry_type'])
         await send_response(
-            update=update, context=context, response=(
-                f'Счёт <b>{account.title}</b> создан с начальной суммой в <b>{amount} {currency}</b>'
-            ),
+            update=update,
+            context=context,
+            response=render_template('accounts/created.html', title=account.title, amount=amount, currency=currency),
         )
         return await cls.create_entry__choose_category(update, context)
 
@@ -407,20 +433,24 @@ class Add:
         title = update.message.text
 
         category = CategoryModel(title=title, user_id=user_id)
-        async with async_session() as session:
-            try:
+        session = get_session()
+        try:
+            async with session.begin_nested():
                 session.add(category)
-                await session.commit()
-            except IntegrityError:
-                await send_response(
-                    update=update,
-                    context=context,
-                    response=f'Категория <b>{title}</b> уже есть',
-                )
-                await flush_user_data(update, context)
-                return await cls.entrypoint(update, context)
+                await session.flush()
+                await add_to_tree(session, [category.id])
+        except IntegrityError:
+            await send_response(
+                update=update,
+                context=context,
+                response=render_template('categories/exists.html', title=title),
+            )
+            await flush_user_data(update, context)
+            return await cls.entrypoint(update, context)
 
-        await send_response(update=update, context=context, response=f'Категория <b>{category.title}</b> создана')
+        await send_response(
+            update=update, context=context, response=render_template('add/category_created.html', title=category.title),
+        )
         return await cls.create_entry__category_account_check(update, context)
 
     @classmethod
@@ -428,28 +458,12 @@ class Add:
         user_id = await get_user_id(update, context)
         await update.callback_query.answer()
 
-        async with async_session() as session:
-            accounts = (await session.execute(select(AccountModel).filter_by(user_id=user_id))).scalars().all()
-        accounts = {account.id: account for account in accounts}
-        context.user_data['accounts'] = accounts
-        # распределяем кнопки по 2 в ряд
-        keyboard_map = []
-        for i, account in enumerate(accounts.values()):
-            button = InlineKeyboardButton(
-                f'{account.title} ({account.amount} {account.currency})', callback_data=account.id,
-            )
-            if not i % 2:
-                keyboard_map.append([button])
-            else:
-                keyboard_map[-1].append(button)
-
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
-            *keyboard_map,
-        ])
+        accounts = await get_accounts(user_id)
+        context.user_data['accounts'] = snapshot_accounts(accounts)
+        reply_markup = cls.transfer_accounts_from_keyboard(context)
         await edit_last_message(
             update=update,
-            text='Выберите счёт списания',
+            text=render_template('add/choose_account_from.html'),
             reply_markup=reply_markup,
         )
         return cls.STATE__CREATE_TRANSFER__CHOOSE_ACCOUNT_TO
@@ -461,30 +475,16 @@ class Add:
         query_data = update.callback_query.data
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
 
         account_id_from = int(query_data)
         context.user_data['account_id_from'] = account_id_from
-        accounts = {k: v for k, v in context.user_data['accounts'].items() if k != account_id_from}
 
-        # распределяем кнопки по 2 в ряд
-        keyboard_map = []
-        for i, account in enumerate(accounts.values()):
-            button = InlineKeyboardButton(
-                f'{account.title} ({account.amount} {account.currency})', callback_data=account.id,
-            )
-            if not i % 2:
-                keyboard_map.append([button])
-            else:
-                keyboard_map[-1].append(button)
-
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
-            *keyboard_map,
-        ])
+        reply_markup = cls.transfer_accounts_to_keyboard(context)
         await edit_last_message(
             update=update,
-            text='Выберите счёт зачисления',
+            text=render_template('add/choose_account_to.html'),
             reply_markup=reply_markup,
         )
         return cls.STATE__CREATE_TRANSFER__ENTER_AMOUNT
@@ -496,6 +496,7 @@ class Add:
         query_data = update.callback_query.data
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
 
         context.user_data['account_id_to'] = int(query_data)
@@ -503,13 +504,8 @@ class Add:
         account_title_from = context.user_data['accounts'][context.user_data['account_id_from']].title
         account_title_to = context.user_data['accounts'][context.user_data['account_id_to']].title
 
-        text = (
-            f'Введите сумму списания со счёта <b>{account_title_from}</b> '
-            f'(и, если отличается, сумму начисления на счёт <b>{account_title_to}</b>) в следующем формате:\n\n'
-            '    <code>100</code>\n'
-            '    <code>10к 131,55</code>\n'
-            '    <code>200k 29.8kk</code>\n\n'
-            '(/cancel для отмены)'
+        text = render_template(
+            'add/enter_transfer_amount.html', account_title_from=account_title_from, account_title_to=account_title_to,
         )
         await edit_last_message(
             update=update,
@@ -519,45 +515,40 @@ class Add:
 
     @classmethod
     async def create_transfer(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        amount_from, amount_to = cls._prepare_transfer_amount(update.message.text)
-        if amount_from is None or amount_to is None:
-            await send_response(update=update, context=context, response='Неверный формат ввода')
-            return await cls.entrypoint(update, context)
-
-        user_id = await get_user_id(update, context)
         account_id_from = context.user_data['account_id_from']
         account_id_to = context.user_data['account_id_to']
         account_from = context.user_data['accounts'][account_id_from]
         account_to = context.user_data['accounts'][account_id_to]
+        amount_from, amount_to = cls._prepare_transfer_amount(
+            update.message.text, account_from.exponent, account_to.exponent,
+        )
+        if amount_from is None or amount_to is None:
+            await send_response(update=update, context=context, response=render_template('common/invalid_format.html'))
+            return await cls.entrypoint(update, context)
 
+        user_id = await get_user_id(update, context)
         transfer = TransferModel(
-            amount_from=amount_from,
-            amount_to=amount_to,
+            amount_from=amount_from.minor,
+            amount_to=amount_to.minor,
             account_from_id=account_id_from,
             account_to_id=account_id_to,
             user_id=user_id,
         )
-        async with async_session() as session:
-            account_from.amount -= amount_from
-            account_to.amount += amount_to
-            session.add(account_from)
-            session.add(account_to)
-            session.add(transfer)
-            await session.commit()
+        session = get_session()
+        session.add(transfer)
+        balances = await change_balances(session, [(account_from, -amount_from.minor), (account_to, amount_to.minor)])
+        account_from, account_to = balances[account_id_from], balances[account_id_to]
 
         await send_response(
             update=update,
             context=context,
-            response=(
-                'Запись добавлена, теперь баланс составляет\n'
-                f'- <b>{account_from.title}</b> {account_from.amount} {account_from.currency}\n'
-                f'- <b>{account_to.title}</b> {account_to.amount} {account_to.currency}'
-            ),
+            response=render_template('add/transfer_created.html', account_from=account_from, account_to=account_to),
         )
+        await flush_user_data(update, context)
         return ConversationHandler.END
 
     @staticmethod
-    def _prepare_entry_amount(amount_str: str) -> Tuple[Optional[Decimal], Optional[str]]:
+    def _prepare_entry_amount(amount_str: str, exponent: int) -> Tuple[Optional[Money], Optional[str]]:
         title = None
         if amount_str.count(' ') == 1:
             amount, title = amount_str.split(' ', 1)
@@ -565,17 +556,16 @@ class Add:
             amount, title = amount_str.split('\n', 1)
         else:
             amount = amount_str
-        amount = amount.strip().replace('-', '')
-        return user_amount_to_db_amount(amount), title
+        return Money.parse(amount, exponent), title
 
     @staticmethod
-    def _prepare_transfer_amount(amount_str: str) -> Tuple[Optional[Decimal], Optional[Decimal]]:
+    def _prepare_transfer_amount(
+        amount_str: str, exponent_from: int, exponent_to: int,
+    ) -> Tuple[Optional[Money], Optional[Money]]:
         if amount_str.count(' ') == 1:
             amount_from, amount_to = amount_str.split(' ', 1)
         elif amount_str.count('\n') == 1:
             amount_from, amount_to = amount_str.split('\n', 1)
         else:
             amount_from, amount_to = amount_str, amount_str
-        amount_from = amount_from.strip().replace('-', '')
-        amount_to = amount_to.strip().replace('-', '')
-        return user_amount_to_db_amount(amount_from), user_amount_to_db_amount(amount_to)
+        return Money.parse(amount_from, exponent_from), Money.parse(amount_to, exponent_to)
@@ -1,4 +1,6 @@
-from sqlalchemy import select
+from typing import Optional
+
+from sqlalchemy import update as sql_update
 from sqlalchemy.exc import IntegrityError
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Message
 from telegram.ext import (
@@ -8,10 +10,12 @@ from telegram.ext import (
     MessageHandler,
     filters,
     CallbackQueryHandler,
+    TypeHandler,
 )
 
 from common import constants
 from common.constants import COMMAND_CANCEL, COMMAND_CATEGORIES
+from common.keyboards import build_keyboard, category_items, page_handler
 from common.utils import (
     get_user_id,
     cancel,
@@ -20,11 +24,19 @@ from common.utils import (
     edit_last_message,
     delete_last_message,
     close,
+    expire,
     sep_titles,
     flush_user_data,
+    remember_message,
+    render_template,
 )
+from config import settings
 from db import CategoryModel
-from db.base import async_session
+from db.categories import add_to_tree, category_path, children_of, move_category, subtree_ids, subtree_totals
+from db.deletes import delete_category, merge_categories
+from db.loaders import get_categories
+from db.snapshots import snapshot_categories
+from db.uow import get_session
 
 
 class Categories:
@@ -34,6 +46,8 @@ class Categories:
     STATE__CHOOSE_CATEGORY_ACTION = 2
     STATE__EDIT = 3
     STATE__DELETE_CONFIRM = 4
+    STATE__MERGE = 5
+    STATE__MOVE = 6
 
     ACTION__ADD = 'Добавить'
     ACTION__CLOSE = 'Закрыть'
@@ -42,6 +56,12 @@ class Categories:
     ACTION__EDIT = 'Изменить'
     ACTION__HIDE = 'Скрыть'
     ACTION__ACTIVATE = 'Показать'
+    ACTION__MERGE = 'Объединить'
+    ACTION__MOVE = 'Переместить'
+    ACTION__ADD_CHILD = 'Подкатегория'
+    ACTION__UP = 'Вверх'
+    ACTION__OPEN = 'Действия'
+    ACTION__ROOT = 'На верхний уровень'
 
     BAD_WORDS = [
         ACTION__ADD,
@@ -51,9 +71,18 @@ class Categories:
         ACTION__EDIT,
         ACTION__HIDE,
         ACTION__ACTIVATE,
+        ACTION__MERGE,
+        ACTION__MOVE,
+        ACTION__ADD_CHILD,
+        ACTION__UP,
+        ACTION__OPEN,
+        ACTION__ROOT,
         f'/{COMMAND_CANCEL}'
     ]
 
+    # открытый уровень дерева: id родительской категории, None - верхний уровень
+    LEVEL = 'category_parent_id'
+
     @classmethod
     def handler(cls):
 
@@ -64,63 +93,134 @@ class Categories:
                     MessageHandler(filters.Regex(rf'^/{COMMAND_CANCEL}$'), close),
                     MessageHandler(filters.TEXT, cls.create),
                 ],
-                cls.STATE__SHOW_CATEGORY_ACTIONS: [CallbackQueryHandler(cls.show_category_actions)],
+                cls.STATE__SHOW_CATEGORY_ACTIONS: [
+                    page_handler(cls.categories_keyboard),
+                    CallbackQueryHandler(cls.show_category_actions),
+                ],
                 cls.STATE__CHOOSE_CATEGORY_ACTION: [CallbackQueryHandler(cls.choose_category_action)],
                 cls.STATE__DELETE_CONFIRM: [CallbackQueryHandler(cls.delete_confirm)],
+                cls.STATE__MERGE: [
+                    page_handler(cls.merge_keyboard),
+                    CallbackQueryHandler(cls.merge),
+                ],
+                cls.STATE__MOVE: [
+                    page_handler(cls.move_keyboard),
+                    CallbackQueryHandler(cls.move),
+                ],
                 cls.STATE__EDIT: [
                     MessageHandler(filters.Regex(rf'^/{COMMAND_CANCEL}$'), cancel),
                     MessageHandler(filters.TEXT, cls.edit),
                 ],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, expire)],
             },
             fallbacks=[CommandHandler(constants.COMMAND_CANCEL, cancel)],
             allow_reentry=True,
+            conversation_timeout=settings.CONVERSATION_TIMEOUT or None,
+        )
+
+    @classmethod
+    def categories_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        """Категории одного уровня дерева, категория с подкатегориями открывает следующий уровень"""
+        categories = context.user_data['categories']
+        parent_id = context.user_data.get(cls.LEVEL)
+        header = [[InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)]]
+        if parent_id is not None:
+            header.append([
+                InlineKeyboardButton(cls.ACTION__UP, callback_data=cls.ACTION__UP),
+                InlineKeyboardButton(
+                    f'{cls.ACTION__OPEN}: {categories[parent_id].title}', callback_data=cls.ACTION__OPEN,
+                ),
+            ])
+        header.append([InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)])
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind=f'categories:{parent_id}',
+            items=lambda: category_items(
+                children_of(categories.values(), parent_id),
+                mark_disabled=True,
+                parent_ids={category.parent_id for category in categories.values()},
+            ),
+            header=header,
+            page=page,
+        )
+
+    @classmethod
+    def merge_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        category_id = context.user_data['category_id']
+        targets = [category for category in context.user_data['categories'].values() if category.id != category_id]
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind=f'categories:merge:{category_id}',
+            items=lambda: category_items(targets, mark_disabled=True),
+            header=[[InlineKeyboardButton(cls.ACTION__BACK, callback_data=cls.ACTION__BACK)]],
+            page=page,
+        )
+
+    @classmethod
+    def move_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        categories = context.user_data['categories']
+        category = categories[context.user_data['category_id']]
+        # категорию нельзя переместить в неё саму и в её подкатегории
+        subtree = subtree_ids(categories, category.id)
+        targets = sorted(
+            (category_path(categories, target.id), target.id)
+            for target in categories.values() if target.id not in subtree and target.id != category.parent_id
+        )
+        header = []
+        if category.parent_id is not None:
+            header.append([InlineKeyboardButton(cls.ACTION__ROOT, callback_data=cls.ACTION__ROOT)])
+        header.append([InlineKeyboardButton(cls.ACTION__BACK, callback_data=cls.ACTION__BACK)])
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind=f'categories:move:{category.id}',
+            items=lambda: targets,
+            header=header,
+            page=page,
         )
 
     @classmethod
     async def entrypoint(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = await get_user_id(update, context)
 
-        async with async_session() as session:
-            categories = (await session.execute(select(CategoryModel).filter_by(user_id=user_id))).scalars().all()
+        categories = await get_categories(user_id)
 
         if not categories:
-            text = (
-                'У вас нет категорий, '
-                'введите название новой (можно несколько через запятую), '
-                'например:\n\n'
-                '    <code>Продукты</code>\n'
-                '    <code>Счета, Техника, Одежда</code>\n\n'
-                '(/cancel для отмены)'
-            )
+            context.user_data[cls.LEVEL] = None
+            text = render_template('categories/empty.html')
             msg = await send_response(update=update, context=context, response=text)
-            context.user_data['msg'] = msg
+            remember_message(context, msg)
             return cls.STATE__CREATE
 
-        categories = {category.id: category for category in categories}
+        categories = snapshot_categories(categories)
         context.user_data['categories'] = categories
+        # открытый уровень могли удалить
+        if context.user_data.get(cls.LEVEL) not in categories:
+            context.user_data[cls.LEVEL] = None
 
-        # распределяем кнопки по 2 в ряд
-        keyboard_map = []
-        for i, category in enumerate(categories.values()):
-            if category.disabled:
-                title = f'(скрыта) {category.title}'
-            else:
-                title = category.title
-            button = InlineKeyboardButton(title, callback_data=category.id)
-            if not i % 2:
-                keyboard_map.append([button])
-            else:
-                keyboard_map[-1].append(button)
-
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton(cls.ACTION__ADD, callback_data=cls.ACTION__ADD)],
-            [InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)],
-            *keyboard_map,
-        ])
+        reply_markup = cls.categories_keyboard(context)
         msg = await send_response(
-            update=update, context=context, response='Выберите категорию', reply_markup=reply_markup,
+            update=update,
+            context=context,
+            response=cls._level_text(context),
+            reply_markup=reply_markup,
         )
-        context.user_data['msg'] = msg
+        remember_message(context, msg)
+        return cls.STATE__SHOW_CATEGORY_ACTIONS
+
+    @classmethod
+    def _level_text(cls, context: ContextTypes.DEFAULT_TYPE) -> str:
+        parent_id = context.user_data.get(cls.LEVEL)
+        path = category_path(context.user_data['categories'], parent_id) if parent_id is not None else None
+        return render_template('categories/choose.html', path=path)
+
+    @classmethod
+    async def show_level(cls, update: Update, context: ContextTypes.DEFAULT_TYPE, parent_id: Optional[int]) -> int:
+        context.user_data[cls.LEVEL] = parent_id
+        msg = await edit_last_message(
+            update=update, text=cls._level_text(context), reply_markup=cls.categories_keyboard(context),
+        )
+        if isinstance(msg, Message):
+            remember_message(context, msg)
         return cls.STATE__SHOW_CATEGORY_ACTIONS
 
     @classmethod
@@ -134,42 +234,41 @@ class Categories:
 
         titles_in_bad_words = []
         titles_in_existing_titles_lower = []
-        error_text = []
         for title in titles:
             if title.capitalize() in cls.BAD_WORDS:
                 titles_in_bad_words.append(title)
             elif title.lower() in existing_titles_lower:
                 titles_in_existing_titles_lower.append(title)
-        if titles_in_bad_words:
-            error_text.append(f'Следующие названия нельзя использовать: <b>{", ".join(titles_in_bad_words)}</b>')
-        if titles_in_existing_titles_lower:
-            error_text.append(f'Следующие категории уже есть: <b>{", ".join(titles_in_existing_titles_lower)}</b>')
-        if error_text:
-            await send_response(update=update, context=context, response='\n'.join(error_text))
+        if titles_in_bad_words or titles_in_existing_titles_lower:
+            text = render_template(
+                'categories/create_errors.html',
+                forbidden=titles_in_bad_words,
+                existing=titles_in_existing_titles_lower,
+            )
+            await send_response(update=update, context=context, response=text)
             return await cls.entrypoint(update, context)
 
-        categories = [CategoryModel(title=title, user_id=user_id) for title in titles]
+        parent_id = context.user_data.get(cls.LEVEL)
+        categories = [CategoryModel(title=title, user_id=user_id, parent_id=parent_id) for title in titles]
 
-        async with async_session() as session:
-            try:
+        session = get_session()
+        try:
+            async with session.begin_nested():
                 session.add_all(categories)
-                await session.commit()
-            except IntegrityError as e:
-                bad_category = next(iter(title for title in titles if title in str(e.orig)))
-                await send_response(
-                    update=update,
-                    context=context,
-                    response=f'Категория <b>{bad_category}</b> уже есть',
-                )
-                await flush_user_data(update, context)
-                return await cls.entrypoint(update, context)
-
-        await flush_user_data(update, context)
-        if len(categories) == 1:
-            text = f'Категория <b>{titles[0]}</b> добавлена'
-        else:
-            categories_list_str = ', '.join(titles)
-            text = f'Категории <b>{categories_list_str}</b> добавлены'
+                await session.flush()
+                await add_to_tree(session, [category.id for category in categories])
+        except IntegrityError as e:
+            bad_category = next(iter(title for title in titles if title in str(e.orig)))
+            await send_response(
+                update=update,
+                context=context,
+                response=render_template('categories/exists.html', title=bad_category),
+            )
+            await flush_user_data(update, context, exclude=[cls.LEVEL])
+            return await cls.entrypoint(update, context)
+
+        await flush_user_data(update, context, exclude=[cls.LEVEL])
+        text = render_template('categories/created.html', titles=titles)
         await send_response(update=update, context=context, response=text)
         return await cls.entrypoint(update, context)
 
@@ -181,21 +280,26 @@ class Categories:
         if query_data == cls.ACTION__CLOSE:
             await close(update, context)
             return ConversationHandler.END
+        categories = context.user_data['categories']
+        parent_id = context.user_data.get(cls.LEVEL)
         if query_data == cls.ACTION__ADD:
-            text = (
-                'Введите название новой категории (можно несколько через запятую), '
-                'например:\n\n'
-                '    <code>Продукты</code>\n\n'
-                '    <code>Счета, Техника, Одежда</code>\n\n'
-                '/cancel для отмены'
-            )
-            await edit_last_message(update, text)
+            path = category_path(categories, parent_id) if parent_id is not None else None
+            await edit_last_message(update, render_template('categories/enter_title.html', parent=path))
             return cls.STATE__CREATE
+        if query_data == cls.ACTION__UP:
+            return await cls.show_level(update, context, categories[parent_id].parent_id)
+
+        if query_data == cls.ACTION__OPEN:
+            category_id = parent_id
+        else:
+            category_id = force_int(query_data)
+            if any(category.parent_id == category_id for category in categories.values()):
+                return await cls.show_level(update, context, category_id)
 
-        category_id = force_int(query_data)
         context.user_data['category_id'] = category_id
-        category_title = context.user_data['categories'][category_id].title
-        category_disabled = context.user_data['categories'][category_id].disabled
+        category = categories[category_id]
+        category_title = category.title
+        category_disabled = category.disabled
         context.user_data['category_title'] = category_title
         context.user_data['category_disabled'] = category_disabled
 
@@ -204,27 +308,38 @@ class Categories:
         else:
             hide_show_button = InlineKeyboardButton(cls.ACTION__HIDE, callback_data=cls.ACTION__HIDE)
 
-        reply_markup = InlineKeyboardMarkup(
+        keyboard = [
             [
-                [
-                    InlineKeyboardButton(cls.ACTION__DELETE, callback_data=cls.ACTION__DELETE),
-                    hide_show_button,
-                    InlineKeyboardButton(cls.ACTION__BACK, callback_data=cls.ACTION__BACK),
-                ],
-                [
-                    InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE),
-                    InlineKeyboardButton(cls.ACTION__EDIT, callback_data=cls.ACTION__EDIT),
-                ],
+                InlineKeyboardButton(cls.ACTION__DELETE, callback_data=cls.ACTION__DELETE),
+                hide_show_button,
+                InlineKeyboardButton(cls.ACTION__BACK, callback_data=cls.ACTION__BACK),
             ],
-        )
+            [
+                InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE),
+                InlineKeyboardButton(cls.ACTION__EDIT, callback_data=cls.ACTION__EDIT),
+            ],
+        ]
+        if len(categories) > 1:
+            keyboard[1].append(InlineKeyboardButton(cls.ACTION__MERGE, callback_data=cls.ACTION__MERGE))
+        keyboard.append([InlineKeyboardButton(cls.ACTION__ADD_CHILD, callback_data=cls.ACTION__ADD_CHILD)])
+        if category.parent_id is not None or len(subtree_ids(categories, category_id)) < len(categories):
+            keyboard[2].append(InlineKeyboardButton(cls.ACTION__MOVE, callback_data=cls.ACTION__MOVE))
+        reply_markup = InlineKeyboardMarkup(keyboard)
 
+        user_id = await get_user_id(update, context)
+        totals = await subtree_totals(get_session(), user_id, category_id)
         msg = await edit_last_message(
             update=update,
-            text=f'Выберите действие над категорией <b>{category_title}</b>',
+            text=render_template(
+                'categories/choose_action.html',
+                title=category_path(categories, category_id),
+                totals=totals,
+                has_children=any(child.parent_id == category_id for child in categories.values()),
+            ),
             reply_markup=reply_markup,
         )
         if isinstance(msg, Message):
-            context.user_data['msg'] = msg
+            remember_message(context, msg)
         return cls.STATE__CHOOSE_CATEGORY_ACTION
 
     @classmethod
@@ -240,6 +355,7 @@ class Categories:
 
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
 
         if query_data == cls.ACTION__DELETE:
@@ -250,18 +366,15 @@ class Categories:
                     InlineKeyboardButton(cls.ACTION__BACK, callback_data=cls.ACTION__BACK),
                 ],
             ]
-            if category_disabled:
-                text = (
-                    f'Вы уверены, что хотите удалить категорию <b>{category_title}</b>? '
-                    'В данный момент она скрыта и не отображается при добавлении новых записей'
-                )
-            else:
+            if not category_disabled:
                 keyboard[1].insert(0, InlineKeyboardButton(cls.ACTION__HIDE, callback_data=cls.ACTION__HIDE))
-                text = (
-                    f'Вы уверены, что хотите удалить категорию <b>{category_title}</b>? '
-                    'Это удалит также и все записи по ней. '
-                    'Если вы не хотите отображать её при добавлении новых записей, достаточно её скрыть'
-                )
+            categories = context.user_data['categories']
+            text = render_template(
+                'categories/delete_confirm.html',
+                title=category_title,
+                disabled=category_disabled,
+                has_children=any(child.parent_id == context.user_data['category_id'] for child in categories.values()),
+            )
             reply_markup = InlineKeyboardMarkup(keyboard)
             await edit_last_message(
                 update=update,
@@ -280,10 +393,32 @@ class Categories:
         if query_data == cls.ACTION__EDIT:
             await edit_last_message(
                 update=update,
-                text=f'Введите новое название для категории <b>{category_title}</b> (/cancel для отмены):',
+                text=render_template('categories/enter_new_title.html', title=category_title),
             )
             return cls.STATE__EDIT
 
+        if query_data == cls.ACTION__MERGE:
+            await edit_last_message(
+                update=update,
+                text=render_template('categories/choose_merge_target.html', title=category_title),
+                reply_markup=cls.merge_keyboard(context),
+            )
+            return cls.STATE__MERGE
+
+        if query_data == cls.ACTION__ADD_CHILD:
+            context.user_data[cls.LEVEL] = context.user_data['category_id']
+            path = category_path(context.user_data['categories'], context.user_data['category_id'])
+            await edit_last_message(update, render_template('categories/enter_title.html', parent=path))
+            return cls.STATE__CREATE
+
+        if query_data == cls.ACTION__MOVE:
+            await edit_last_message(
+                update=update,
+                text=render_template('categories/choose_move_target.html', title=category_title),
+                reply_markup=cls.move_keyboard(context),
+            )
+            return cls.STATE__MOVE
+
     @classmethod
     async def delete_confirm(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.callback_query.answer()
@@ -303,6 +438,7 @@ class Categories:
             return await cls.entrypoint(update, context)
         if query_data == cls.ACTION__CLOSE:
             await delete_last_message(update)
+            await flush_user_data(update, context)
             return ConversationHandler.END
 
     @classmethod
@@ -310,28 +446,89 @@ class Categories:
         category_id = context.user_data['category_id']
         category_title = context.user_data['category_title']
 
-        async with async_session() as session:
-            category = (await session.execute(select(CategoryModel).filter_by(id=category_id))).scalars().one()
-            await session.delete(category)
-            await session.commit()
+        user_id = await get_user_id(update, context)
+        await delete_category(get_session(), user_id, category_id)
 
-        await flush_user_data(update, context)
-        await send_response(update=update, context=context, response=f'Категория <b>{category_title}</b> удалена')
+        await flush_user_data(update, context, exclude=[cls.LEVEL])
+        await send_response(
+            update=update, context=context, response=render_template('categories/deleted.html', title=category_title),
+        )
         return await cls.entrypoint(update, context)
 
+    @classmethod
+    async def merge(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        await update.callback_query.answer()
+        await delete_last_message(update)
+        query_data = update.callback_query.data
+        if query_data == cls.ACTION__BACK:
+            return await cls.entrypoint(update, context)
+
+        category_id = context.user_data['category_id']
+        category_title = context.user_data['category_title']
+        target_id = force_int(query_data)
+        target_title = context.user_data['categories'][target_id].title
+
+        user_id = await get_user_id(update, context)
+        moved = await merge_categories(get_session(), user_id, [category_id], target_id)
+
+        await flush_user_data(update, context, exclude=[cls.LEVEL])
+        await send_response(
+            update=update,
+            context=context,
+            response=render_template('categories/merged.html', title=category_title, target=target_title, moved=moved),
+        )
+        return await cls.entrypoint(update, context)
+
+    @classmethod
+    async def move(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        await update.callback_query.answer()
+        await delete_last_message(update)
+        query_data = update.callback_query.data
+        if query_data == cls.ACTION__BACK:
+            return await cls.entrypoint(update, context)
+
+        categories = context.user_data['categories']
+        category_id = context.user_data['category_id']
+        category_title = context.user_data['category_title']
+        parent_id = None if query_data == cls.ACTION__ROOT else force_int(query_data)
+
+        user_id = await get_user_id(update, context)
+        await move_category(get_session(), user_id, category_id, parent_id)
+
+        # дальше открыт уровень, куда перемещена категория
+        context.user_data[cls.LEVEL] = parent_id
+        await flush_user_data(update, context, exclude=[cls.LEVEL])
+        await send_response(
+            update=update,
+            context=context,
+            response=render_template(
+                'categories/moved.html',
+                title=category_title,
+                target=category_path(categories, parent_id) if parent_id is not None else None,
+            ),
+        )
+        return await cls.entrypoint(update, context)
+
+    @classmethod
+    async def _update_category(cls, update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: int, **values):
+        user_id = await get_user_id(update, context)
+        await get_session().execute(
+            sql_update(CategoryModel)
+            .where(CategoryModel.id == category_id, CategoryModel.user_id == user_id)
+            .values(**values)
+        )
+
     @classmethod
     async def activate(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         category_id = context.user_data['category_id']
         category_title = context.user_data['category_title']
 
-        async with async_session() as session:
-            category = (await session.execute(select(CategoryModel).filter_by(id=category_id))).scalars().one()
-            category.disabled = False
-            session.add(category)
-            await session.commit()
+        await cls._update_category(update, context, category_id, disabled=False)
 
-        await flush_user_data(update, context)
-        await send_response(update=update, context=context, response=f'Категория <b>{category_title}</b> активирована')
+        await flush_user_data(update, context, exclude=[cls.LEVEL])
+        await send_response(
+            update=update, context=context, response=render_template('categories/activated.html', title=category_title),
+        )
         return await cls.entrypoint(update, context)
 
     @classmethod
@@ -339,14 +536,12 @@ class Categories:
         category_id = context.user_data['category_id']
         category_title = context.user_data['category_title']
 
-        async with async_session() as session:
-            category = (await session.execute(select(CategoryModel).filter_by(id=category_id))).scalars().one()
-            category.disabled = True
-            session.add(category)
-            await session.commit()
+        await cls._update_category(update, context, category_id, disabled=True)
 
-        await flush_user_data(update, context)
-        await send_response(update=update, context=context, response=f'Категория <b>{category_title}</b> скрыта')
+        await flush_user_data(update, context, exclude=[cls.LEVEL])
+        await send_response(
+            update=update, context=context, response=render_template('categories/hidden.html', title=category_title),
+        )
         return await cls.entrypoint(update, context)
 
     @classmethod
@@ -357,30 +552,28 @@ class Categories:
         existing_titles_lower = (c.title.lower() for c in context.user_data['categories'].values())
 
         if new_title.startswith('/'):
-            await send_response(update=update, context=context, response='Название нельзя начинать с /')
+            await send_response(
+                update=update, context=context, response=render_template('common/title_starts_with_slash.html'),
+            )
             return await cls.entrypoint(update, context)
         elif new_title == old_title:
-            await send_response(update=update, context=context, response='Название не отличается от предыдущего')
+            await send_response(update=update, context=context, response=render_template('common/title_unchanged.html'))
             return await cls.entrypoint(update, context)
         elif new_title.capitalize() in cls.BAD_WORDS:
-            await send_response(update=update, context=context, response='Такое название нельзя использовать')
+            await send_response(update=update, context=context, response=render_template('common/title_forbidden.html'))
             return await cls.entrypoint(update, context)
         elif new_title.lower() in existing_titles_lower:
             await send_response(
-                update=update, context=context, response=f'Категория <b>{new_title}</b> уже есть',
+                update=update, context=context, response=render_template('categories/exists.html', title=new_title),
             )
             return await cls.entrypoint(update, context)
 
-        async with async_session() as session:
-            category = (await session.execute(select(CategoryModel).filter_by(id=category_id))).scalars().one()
-            category.title = new_title
-            session.add(category)
-            await session.commit()
+        await cls._update_category(update, context, category_id, title=new_title)
 
-        await flush_user_data(update, context)
+        await flush_user_data(update, context, exclude=[cls.LEVEL])
         await send_response(
             update=update,
             context=context,
-            response=f'Категория <b>{old_title}</b> теперь имеет имя <b>{new_title}</b>',
+            response=render_template('categories/renamed.html', old_title=old_title, new_title=new_title),
         )
         return await cls.entrypoint(update, context)
@@ -0,0 +1,39 @@
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from common.constants import COMMAND_ENTRIES
+from common.tags import parse_tag_query
+from common.utils import get_user_id, send_response, render_template
+from db.tags import find_entries, tag_totals
+from db.uow import get_session
+
+
+class Entries:
+
+    @classmethod
+    def handler(cls):
+        return CommandHandler(COMMAND_ENTRIES, cls.entrypoint)
+
+    @classmethod
+    async def entrypoint(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """
+        /entries - последние записи, /entries #отпуск #море | #работа - записи с метками и итог по ним
+        """
+        user_id = await get_user_id(update, context)
+        groups = parse_tag_query(' '.join(context.args or ()))
+
+        session = get_session()
+        count, totals = await tag_totals(session, user_id, groups)
+        if not count:
+            await send_response(
+                update=update, context=context, response=render_template('entries/empty.html', groups=groups),
+            )
+            return
+        entries = await find_entries(session, user_id, groups)
+        await send_response(
+            update=update,
+            context=context,
+            response=render_template(
+                'entries/list.html', groups=groups, count=count, totals=totals, entries=entries,
+            ),
+        )
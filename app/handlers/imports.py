@@ -0,0 +1,154 @@
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.ext import (
+    ConversationHandler,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    filters,
+    CallbackQueryHandler,
+    TypeHandler,
+)
+
+from common import constants
+from common.constants import COMMAND_CANCEL, COMMAND_IMPORT
+from common.keyboards import account_items, build_keyboard, page_handler
+from common.utils import (
+    get_user_id,
+    cancel,
+    force_int,
+    send_response,
+    edit_last_message,
+    delete_last_message,
+    expire,
+    flush_user_data,
+    remember_message,
+    render_template,
+)
+from config import settings
+from db.importer import import_entries, IMPORT_DEFAULT_CATEGORY
+from db.loaders import get_accounts
+from db.snapshots import snapshot_accounts
+from db.uow import get_session
+
+
+class Import:
+
+    STATE__CHOOSE_ACCOUNT = 0
+    STATE__UPLOAD = 1
+
+    ACTION__CLOSE = 'Закрыть'
+
+    # ограничение Bot API на скачивание файлов
+    MAX_FILE_SIZE = 20 * 1024 * 1024
+
+    @classmethod
+    def handler(cls):
+
+        return ConversationHandler(
+            entry_points=[CommandHandler(COMMAND_IMPORT, cls.entrypoint)],
+            states={
+                cls.STATE__CHOOSE_ACCOUNT: [
+                    page_handler(cls.accounts_keyboard),
+                    CallbackQueryHandler(cls.choose_account),
+                ],
+                cls.STATE__UPLOAD: [
+                    MessageHandler(filters.Regex(rf'^/{COMMAND_CANCEL}$'), cancel),
+                    MessageHandler(filters.Document.ALL, cls.upload),
+                ],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, expire)],
+            },
+            fallbacks=[CommandHandler(constants.COMMAND_CANCEL, cancel)],
+            allow_reentry=True,
+            conversation_timeout=settings.CONVERSATION_TIMEOUT or None,
+        )
+
+    @classmethod
+    def accounts_keyboard(cls, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> InlineKeyboardMarkup:
+        accounts = context.user_data['accounts']
+        return build_keyboard(
+            user_id=context.user_data['user_id'],
+            kind='import:accounts',
+            items=lambda: account_items(accounts.values()),
+            header=[[InlineKeyboardButton(cls.ACTION__CLOSE, callback_data=cls.ACTION__CLOSE)]],
+            page=page,
+        )
+
+    @classmethod
+    async def entrypoint(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        user_id = await get_user_id(update, context)
+
+        accounts = await get_accounts(user_id)
+
+        if not accounts:
+            text = render_template('imports/no_accounts.html')
+            await send_response(update=update, context=context, response=text)
+            await flush_user_data(update, context)
+            return ConversationHandler.END
+
+        context.user_data['accounts'] = snapshot_accounts(accounts)
+
+        reply_markup = cls.accounts_keyboard(context)
+        msg = await send_response(
+            update=update,
+            context=context,
+            response=render_template('imports/choose_account.html'),
+            reply_markup=reply_markup,
+        )
+        remember_message(context, msg)
+        return cls.STATE__CHOOSE_ACCOUNT
+
+    @classmethod
+    async def choose_account(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        await update.callback_query.answer()
+
+        query_data = update.callback_query.data
+        if query_data == cls.ACTION__CLOSE:
+            await delete_last_message(update)
+            await flush_user_data(update, context)
+            return ConversationHandler.END
+
+        account_id = force_int(query_data)
+        context.user_data['account_id'] = account_id
+        account_title = context.user_data['accounts'][account_id].title
+
+        text = render_template(
+            'imports/upload.html', account_title=account_title, default_category=IMPORT_DEFAULT_CATEGORY,
+        )
+        await edit_last_message(update=update, text=text)
+        return cls.STATE__UPLOAD
+
+    @classmethod
+    async def upload(cls, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        user_id = await get_user_id(update, context)
+        document = update.message.document
+
+        if not (document.file_name or '').lower().endswith('.csv'):
+            await send_response(update=update, context=context, response=render_template('imports/not_csv.html'))
+            return cls.STATE__UPLOAD
+        if document.file_size and document.file_size > cls.MAX_FILE_SIZE:
+            text = render_template('imports/too_large.html', max_size_mb=cls.MAX_FILE_SIZE // (1024 * 1024))
+            await send_response(update=update, context=context, response=text)
+            return cls.STATE__UPLOAD
+
+        account_id = context.user_data['account_id']
+        account = context.user_data['accounts'][account_id]
+
+        file = await document.get_file()
+        content = bytes(await file.download_as_bytearray())
+        stats = await import_entries(get_session(), user_id=user_id, account_id=account_id, content=content)
+
+        await flush_user_data(update, context)
+        if stats is None:
+            text = render_template('imports/no_account.html', title=account.title)
+            await send_response(update=update, context=context, response=text)
+            return ConversationHandler.END
+        if not stats.parsed:
+            await send_response(update=update, context=context, response=render_template('imports/empty.html'))
+            return ConversationHandler.END
+
+        await send_response(
+            update=update,
+            context=context,
+            response=render_template('imports/done.html', stats=stats, account=account),
+        )
+        return ConversationHandler.END
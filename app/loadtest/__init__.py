@@ -0,0 +1,11 @@
+"""
+Нагрузочное тестирование бота с поддельным Bot API и локальной базой
+
+    python -m loadtest run --users 20 --output report.json
+    python -m loadtest run --users 20 --workers 4
+    python -m loadtest compare loadtest/baseline.json report.json
+    python -m loadtest soak --users 2000 --budget 2048
+    python -m loadtest flood --users 10 --budget 40
+    python -m loadtest contention --writers 10 --hold 0.02
+    python -m loadtest aggregate --rows 1000000
+"""
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+from config import settings
+from loadtest.aggregation import aggregation
+from loadtest.contention import contention
+from loadtest.flood import flood
+from loadtest.keyboards import keyboards
+from loadtest.loaders import loaders
+from loadtest.partitions import partition_pruning
+from loadtest.runner import compare, run, serve_loadtest_worker
+from loadtest.scripts import expenses_script, soak_script
+from loadtest.soak import soak
+from loadtest.tags import tag_filter
+from loadtest.templates import templates
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description='Нагрузочный тест бота')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='прогнать сценарий и вывести отчёт')
+    run_parser.add_argument('--users', type=int, default=20, help='сколько пользователей одновременно')
+    run_parser.add_argument('--expenses', type=int, default=50, help='сколько расходов добавляет каждый')
+    run_parser.add_argument('--transfers', type=int, default=5, help='сколько переводов делает каждый')
+    run_parser.add_argument('--concurrency', type=int, default=None, help='вместо CONCURRENT_UPDATES')
+    run_parser.add_argument('--workers', type=int, default=0, help='сколько процессов-обработчиков, 0 - без них')
+    run_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    soak_parser = commands.add_parser('soak', help='проверить, что память не растёт с числом пользователей')
+    soak_parser.add_argument('--users', type=int, default=2000, help='сколько пользователей после разогрева')
+    soak_parser.add_argument('--budget', type=int, default=2048, help='байт на пользователя')
+    soak_parser.add_argument('--warmup', type=int, default=200, help='пользователей до первого снимка')
+    soak_parser.add_argument('--interval', type=int, default=500, help='через сколько пользователей замерять')
+    soak_parser.add_argument('--wave', type=int, default=50, help='сколько пользователей одновременно')
+    soak_parser.add_argument('--frames', type=int, default=1, help='глубина стека в снимках tracemalloc')
+    soak_parser.add_argument('--top', type=int, default=25, help='сколько строк разницы снимков вывести')
+    soak_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    flood_parser = commands.add_parser('flood', help='проверить, что флуд не увеличивает нагрузку на базу')
+    flood_parser.add_argument('--users', type=int, default=10, help='сколько пользователей флудят одновременно')
+    flood_parser.add_argument('--messages', type=int, default=100, help='сколько /add присылает каждый')
+    flood_parser.add_argument('--presses', type=int, default=100, help='сколько раз каждый жмёт одну кнопку')
+    flood_parser.add_argument('--budget', type=float, default=40, help='SQL-запросов на пользователя')
+    flood_parser.add_argument('--rate', type=float, default=settings.FLOOD.RATE, help='0 - без защиты от флуда')
+    flood_parser.add_argument('--burst', type=float, default=settings.FLOOD.BURST)
+    flood_parser.add_argument('--duplicate-window', type=float, default=settings.FLOOD.DUPLICATE_WINDOW)
+    flood_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    contention_parser = commands.add_parser(
+        'contention', help='сравнить запись на общие счета с обновлением строки счёта и с проводками',
+    )
+    contention_parser.add_argument('--writers', type=int, default=10, help='сколько транзакций одновременно')
+    contention_parser.add_argument('--transactions', type=int, default=50, help='сколько транзакций у каждой')
+    contention_parser.add_argument('--hold', type=float, default=0.02, help='секунд от записи до фиксации')
+    contention_parser.add_argument('--accounts', type=int, default=1, help='сколько общих счетов')
+    contention_parser.add_argument('--compact-interval', type=float, default=0.5, help='пауза между свёртками')
+    contention_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    aggregate_parser = commands.add_parser('aggregate', help='сравнить агрегацию сумм в NUMERIC и в BIGINT')
+    aggregate_parser.add_argument('--rows', type=int, default=1_000_000, help='сколько сумм')
+    aggregate_parser.add_argument('--groups', type=int, default=50, help='сколько категорий')
+    aggregate_parser.add_argument('--repeat', type=int, default=5, help='сколько раз повторять замер')
+    aggregate_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    tags_parser = commands.add_parser('tags', help='замерить фильтр записей по меткам с индексами и без')
+    tags_parser.add_argument('--users', type=int, default=20, help='для скольких пользователей')
+    tags_parser.add_argument('--repeat', type=int, default=3, help='сколько раз повторять замер')
+    tags_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    templates_parser = commands.add_parser(
+        'templates', help='сравнить рендеринг шаблонов с компиляцией, скомпилированных и статических из памяти',
+    )
+    templates_parser.add_argument('--renders', type=int, default=2000, help='сколько рендерингов в замере')
+    templates_parser.add_argument('--repeat', type=int, default=5, help='сколько раз повторять замер')
+    templates_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    keyboards_parser = commands.add_parser('keyboards', help='замерить построение клавиатуры категорий с кэшем и без')
+    keyboards_parser.add_argument('--categories', type=int, default=1000, help='сколько категорий у пользователя')
+    keyboards_parser.add_argument('--repeat', type=int, default=100, help='сколько раз повторять замер')
+    keyboards_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    loaders_parser = commands.add_parser(
+        'loaders', help='сравнить запросы счетов и категорий одновременных обновлений с объединением и без',
+    )
+    loaders_parser.add_argument('--users', type=int, default=500, help='сколько пользователей одновременно')
+    loaders_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    partitions_parser = commands.add_parser(
+        'partitions', help='проверить, что запросы за период просматривают только секции этого периода',
+    )
+    partitions_parser.add_argument('--output', type=Path, default=None, help='сохранить отчёт в JSON')
+
+    compare_parser = commands.add_parser('compare', help='сравнить отчёт с эталоном')
+    compare_parser.add_argument('baseline', type=Path)
+    compare_parser.add_argument('report', type=Path)
+    compare_parser.add_argument('--tolerance', type=float, default=0.3, help='допустимое ухудшение скорости (доля)')
+
+    # процесс-обработчик для run --workers, запускается супервизором
+    worker_parser = commands.add_parser('worker')
+    worker_parser.add_argument('--base-url', required=True)
+    worker_parser.add_argument('--concurrency', type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        script = expenses_script(expenses=args.expenses, transfers=args.transfers)
+        report = asyncio.run(run(
+            users=args.users, script=script, concurrency=args.concurrency, workers=args.workers,
+        ))
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 1 if report['errors'] else 0
+
+    if args.command == 'worker':
+        serve_loadtest_worker(args.base_url, args.concurrency)
+        return 0
+
+    if args.command == 'soak':
+        report = asyncio.run(soak(
+            users=args.users,
+            script=soak_script(),
+            budget=args.budget,
+            warmup=args.warmup,
+            interval=args.interval,
+            wave=args.wave,
+            frames=args.frames,
+            top=args.top,
+        ))
+        print('\n'.join(report['top_allocations']))
+        print(f'{report["bytes_per_user"]} B/user retained, budget {report["budget"]} B/user')
+        if args.output is not None:
+            args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'flood':
+        report = asyncio.run(flood(
+            users=args.users,
+            messages=args.messages,
+            presses=args.presses,
+            budget=args.budget,
+            rate=args.rate,
+            burst=args.burst,
+            duplicate_window=args.duplicate_window,
+        ))
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'contention':
+        report = asyncio.run(contention(
+            writers=args.writers,
+            transactions=args.transactions,
+            hold=args.hold,
+            accounts=args.accounts,
+            compact_interval=args.compact_interval,
+        ))
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'aggregate':
+        report = asyncio.run(aggregation(rows=args.rows, groups=args.groups, repeat=args.repeat))
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'tags':
+        report = asyncio.run(tag_filter(users=args.users, repeat=args.repeat))
+        text = json.dumps(report, indent=2, ensure_ascii=False)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'templates':
+        report = templates(renders=args.renders, repeat=args.repeat)
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'keyboards':
+        report = keyboards(categories=args.categories, repeat=args.repeat)
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'loaders':
+        report = asyncio.run(loaders(users=args.users))
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    if args.command == 'partitions':
+        report = asyncio.run(partition_pruning())
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output is not None:
+            args.output.write_text(text + '\n')
+        return 0 if report['passed'] else 1
+
+    baseline = json.loads(args.baseline.read_text())
+    report = json.loads(args.report.read_text())
+    regressions = compare(baseline, report, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION: {regression}')
+    if not regressions:
+        print('No regressions against baseline')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Агрегация сумм: NUMERIC против BIGINT в минорных единицах (см. common.money)
+
+Одни и те же суммы лежат в двух временных таблицах - в NUMERIC(20, 2), как хранились раньше, и в BIGINT.
+Замеряются итог и итоги по категориям в PostgreSQL, выборка сумм в Python и сложение в Python:
+Decimal против int, а если установлен numpy - массив объектов против int64. Итоги сверяются
+"""
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from db.base import SQLITE, engine
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TABLE__NUMERIC = 'bench_numeric'
+TABLE__MINOR = 'bench_minor'
+
+# суммы детерминированы: от -25000.00 до 24999.99
+SQL__CREATE = '''
+    CREATE TEMPORARY TABLE {table} ON COMMIT DROP AS
+    SELECT g % :groups AS category, CAST({amount} AS {type}) AS amount
+    FROM generate_series(1, CAST(:rows AS BIGINT)) AS g
+'''
+MINOR_AMOUNT = '(g * 7919) % 5000000 - 2500000'
+
+
+def _best(repeat: int, func: Callable[[], Any]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+async def _best_async(repeat: int, func: Callable[[], Any]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+async def _measure_sql(connection: AsyncConnection, table: str, repeat: int) -> Dict[str, float]:
+    total = text(f'SELECT sum(amount) FROM {table}')
+    by_category = text(f'SELECT category, sum(amount) FROM {table} GROUP BY category')
+    select_amounts = text(f'SELECT amount FROM {table}')
+    return {
+        'sum_ms': await _best_async(repeat, lambda: connection.execute(total)) * 1000,
+        'group_by_ms': await _best_async(repeat, lambda: connection.execute(by_category)) * 1000,
+        'fetch_ms': await _best_async(repeat, lambda: connection.execute(select_amounts)) * 1000,
+    }
+
+
+def _measure_python(amounts: List[Any], categories: List[int], groups: int, repeat: int,
+                    integer: bool) -> Dict[str, float]:
+    timings = {'python_sum_ms': _best(repeat, lambda: sum(amounts)) * 1000}
+    if numpy is not None:
+        if integer:
+            array = numpy.fromiter(amounts, dtype=numpy.int64, count=len(amounts))
+        else:
+            array = numpy.array(amounts, dtype=object)
+        index = numpy.fromiter(categories, dtype=numpy.int64, count=len(categories))
+
+        def group() -> None:
+            numpy.add.at(numpy.zeros(groups, dtype=array.dtype), index, array)
+
+        timings['numpy_sum_ms'] = _best(repeat, array.sum) * 1000
+        timings['numpy_group_by_ms'] = _best(repeat, group) * 1000
+    return {name: round(value, 2) for name, value in timings.items()}
+
+
+async def aggregation(rows: int, groups: int, repeat: int) -> Dict[str, Any]:
+    """
+    :param rows: сколько сумм в каждой таблице
+    :param groups: сколько категорий
+    :param repeat: сколько раз повторять замер, берётся лучший
+    """
+    if SQLITE:
+        raise ValueError('Aggregation is benchmarked on PostgreSQL')
+    params = {'rows': rows, 'groups': groups}
+    report: Dict[str, Any] = {'rows': rows, 'groups': groups, 'numpy': numpy is not None}
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(SQL__CREATE.format(table=TABLE__MINOR, amount=MINOR_AMOUNT, type='BIGINT')), params,
+        )
+        await connection.execute(
+            text(SQL__CREATE.format(table=TABLE__NUMERIC, amount=f'({MINOR_AMOUNT}) / 100.0', type='NUMERIC(20, 2)')),
+            params,
+        )
+        await connection.execute(text(f'ANALYZE {TABLE__MINOR}, {TABLE__NUMERIC}'))
+
+        totals = {}
+        for name, table, integer in (('numeric', TABLE__NUMERIC, False), ('minor', TABLE__MINOR, True)):
+            timings = await _measure_sql(connection, table, repeat)
+            result = (await connection.execute(text(f'SELECT category, amount FROM {table}'))).all()
+            categories = [category for category, _ in result]
+            amounts = [amount for _, amount in result]
+            timings.update(_measure_python(amounts, categories, groups, repeat, integer))
+            report[name] = {key: round(value, 2) for key, value in timings.items()}
+            totals[name] = (await connection.execute(text(f'SELECT sum(amount) FROM {table}'))).scalar_one()
+
+    report['speedup'] = {
+        key: round(report['numeric'][key] / report['minor'][key], 2)
+        for key in report['minor'] if report['minor'][key]
+    }
+    report['passed'] = totals['numeric'].scaleb(2) == totals['minor']
+    return report
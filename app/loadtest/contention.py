@@ -0,0 +1,141 @@
+"""
+Запись под конкуренцией: много одновременных транзакций добавляют записи на несколько общих счетов
+
+Каждая транзакция повторяет create_entry: запись плюс изменение баланса, затем hold секунд до фиксации -
+столько бот отправляет ответ, держа транзакцию открытой. Сценарий прогоняется с обновлением строки счёта
+и в режиме проводок (см. db.postings, во время прогона работает свёртка), в конце балансы сверяются
+с суммами записей
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import delete
+
+from config import settings
+from db import AccountModel, CategoryModel, EntryModel, UserModel
+from db.base import warm_up
+from db.postings import accounts_with_balances, change_balances, compact, select_accounts
+from db.snapshots import AccountSnapshot, snapshot_accounts
+from db.uow import get_session, unit_of_work
+from loadtest.runner import percentile, new_user_ids
+
+MODE__ACCOUNT = 'account'
+MODE__POSTINGS = 'postings'
+
+# в минорных единицах: 1000.00 и -1.25
+INITIAL_AMOUNT = 100000
+AMOUNT = -125
+
+
+async def _setup(user_id: int, accounts: int) -> Tuple[int, List[AccountSnapshot]]:
+    async with unit_of_work():
+        session = get_session()
+        session.add(UserModel(id=user_id))
+        category = CategoryModel(title='Нагрузка', user_id=user_id)
+        shared = [
+            AccountModel(title=f'Общий {n + 1}', user_id=user_id, amount=INITIAL_AMOUNT, currency='RUB')
+            for n in range(accounts)
+        ]
+        session.add_all([category, *shared])
+        await session.flush()
+    return category.id, list(snapshot_accounts(shared).values())
+
+
+async def _balances(user_id: int) -> Dict[int, int]:
+    async with unit_of_work():
+        accounts = accounts_with_balances(await get_session().execute(
+            select_accounts().where(AccountModel.user_id == user_id)
+        ))
+    return {account.id: account.amount for account in accounts}
+
+
+async def _compact_until(stop: asyncio.Event, interval: float) -> int:
+    folded = 0
+    while not stop.is_set():
+        folded += await compact()
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+    return folded
+
+
+async def _run_mode(mode: str, writers: int, transactions: int, hold: float, accounts: int,
+                    compact_interval: float) -> Dict[str, Any]:
+    user_id = next(new_user_ids())
+    category_id, shared = await _setup(user_id, accounts)
+    latencies: List[float] = []
+    expected = {account.id: INITIAL_AMOUNT for account in shared}
+
+    async def write(writer: int) -> None:
+        for n in range(transactions):
+            account = shared[(writer + n) % len(shared)]
+            started_at = time.perf_counter()
+            async with unit_of_work():
+                session = get_session()
+                session.add(EntryModel(
+                    user_id=user_id, amount=AMOUNT, category_id=category_id, account_id=account.id,
+                ))
+                await change_balances(session, [(account, AMOUNT)])
+                await asyncio.sleep(hold)
+            expected[account.id] += AMOUNT
+            latencies.append(time.perf_counter() - started_at)
+
+    stop = asyncio.Event()
+    compactor = asyncio.create_task(_compact_until(stop, compact_interval)) if mode == MODE__POSTINGS else None
+    started_at = time.perf_counter()
+    await asyncio.gather(*(write(writer) for writer in range(writers)))
+    elapsed = time.perf_counter() - started_at
+    stop.set()
+    folded = await compactor if compactor is not None else 0
+
+    balances = await _balances(user_id)
+    if mode == MODE__POSTINGS:
+        # после свёртки всех проводок балансы не должны измениться
+        while await compact():
+            pass
+        balances_ok = balances == await _balances(user_id) == expected
+    else:
+        balances_ok = balances == expected
+
+    async with unit_of_work():
+        await get_session().execute(delete(UserModel).where(UserModel.id == user_id))
+
+    return {
+        'transactions': len(latencies),
+        'transactions_per_second': round(len(latencies) / elapsed, 1),
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'compacted_during_run': folded,
+        'balances_ok': balances_ok,
+    }
+
+
+async def contention(writers: int, transactions: int, hold: float, accounts: int,
+                     compact_interval: float) -> Dict[str, Any]:
+    """
+    :param writers: сколько транзакций пишут одновременно
+    :param transactions: сколько транзакций выполняет каждый
+    :param hold: сколько секунд транзакция остаётся открытой после записи
+    :param accounts: на сколько общих счетов распределяются записи
+    :param compact_interval: пауза между свёртками проводок, секунд
+    """
+    await warm_up()
+    enabled = settings.POSTINGS.ENABLED
+    modes = {}
+    try:
+        for mode in (MODE__ACCOUNT, MODE__POSTINGS):
+            settings.POSTINGS.ENABLED = mode == MODE__POSTINGS
+            modes[mode] = await _run_mode(mode, writers, transactions, hold, accounts, compact_interval)
+    finally:
+        settings.POSTINGS.ENABLED = enabled
+    speedup = modes[MODE__POSTINGS]['transactions_per_second'] / modes[MODE__ACCOUNT]['transactions_per_second']
+    return {
+        'writers': writers,
+        'accounts': accounts,
+        'hold_ms': hold * 1000,
+        'modes': modes,
+        'speedup': round(speedup, 2),
+        'passed': all(mode['balances_ok'] for mode in modes.values()),
+    }
@@ -0,0 +1,298 @@
+"""
+Поддельный Bot API на asyncio: getUpdates с долгим опросом и ответы на исходящие запросы бота
+
+Ничего не проверяет, только запоминает последнее сообщение с клавиатурой в каждом чате, чтобы
+имитируемые пользователи могли нажимать на кнопки, и текст последнего сообщения бота для проверок в тестах.
+Присланные пользователями документы бот скачивает через getFile с того же сервера
+
+С limits=True запросы к чатам считаются в скользящих окнах, как это делает Telegram: на весь бот,
+на личный чат и на группу. Запрос сверх лимита получает 429 с retry_after - через сколько секунд
+освободится место в окне. Лимиты взяты с небольшим запасом, Telegram тоже допускает короткие всплески
+"""
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+BOT_ID = 1
+# строковые параметры бот отправляет как есть, остальные - в JSON
+_RAW_PARAMETERS = frozenset({'text', 'callback_query_id', 'parse_mode', 'caption'})
+_MESSAGE_ENDPOINTS = frozenset({'sendMessage', 'editMessageText', 'editMessageReplyMarkup'})
+
+# лимиты - (запросов, за сколько секунд)
+OVERALL_LIMIT = (35, 1.0)
+CHAT_LIMIT = (5, 1.0)
+GROUP_LIMIT = (25, 60.0)
+
+Buttons = List[Tuple[str, str]]
+
+
+@dataclass
+class Chat:
+    # последнее сообщение бота с инлайн-клавиатурой
+    message_id: int = 0
+    buttons: Buttons = field(default_factory=list)
+    text: str = ''
+    # последнее сообщение бота, с клавиатурой или без
+    last_text: str = ''
+
+
+class FakeBotApi:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, limits: bool = False):
+        """:param limits: отвечать 429 на запросы сверх лимитов Telegram"""
+        self.host = host
+        self.port = port
+        self.limits = limits
+        self.chats: Dict[int, Chat] = {}
+        # запросы бота, кроме getUpdates
+        self.requests = 0
+        # запросы, получившие 429
+        self.rate_limited = 0
+        self._sent: Deque[float] = deque()
+        self._sent_to_chat: Dict[Any, Deque[float]] = {}
+        self._updates: List[Dict[str, Any]] = []
+        self._new_updates = asyncio.Event()
+        # обработанные обновления бот помнит между прогонами (см. db.ledger), номера не должны повторяться
+        self._update_ids = itertools.count(random.randint(10 ** 9, 2 * 10 ** 9))
+        self._message_ids = itertools.count(1)
+        # содержимое документов по file_path
+        self._files: Dict[str, bytes] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._closing = False
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}/bot'
+
+    @property
+    def base_file_url(self) -> str:
+        return f'http://{self.host}:{self.port}/file/bot'
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        # будим долгие опросы и закрываем соединения, чтобы обработчики завершились сами
+        self._closing = True
+        self._new_updates.set()
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    # обновления от пользователей
+
+    def _push(self, update: Dict[str, Any]) -> int:
+        update_id = update['update_id'] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_updates.set()
+        return update_id
+
+    @staticmethod
+    def _user(user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+    def _user_message(self, user_id: int, **fields: Any) -> Dict[str, Any]:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            **fields,
+        }
+
+    def send_message(self, user_id: int, text: str) -> int:
+        message = self._user_message(user_id, text=text)
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self._push({'message': message})
+
+    def send_document(self, user_id: int, file_name: str, content: bytes) -> int:
+        file_id = f'document{next(self._message_ids)}'
+        self._files[file_id] = content
+        document = {'file_id': file_id, 'file_unique_id': file_id, 'file_name': file_name, 'file_size': len(content)}
+        return self._push({'message': self._user_message(user_id, document=document)})
+
+    def press_button(self, user_id: int, callback_data: str) -> int:
+        chat = self.chats.setdefault(user_id, Chat())
+        return self._push({'callback_query': {
+            'id': str(next(self._message_ids)),
+            'chat_instance': str(user_id),
+            'data': callback_data,
+            'from': self._user(user_id),
+            'message': {
+                'message_id': chat.message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'bot'},
+                'text': chat.text,
+            },
+        }})
+
+    def forget(self, user_id: int) -> None:
+        """Забывает клавиатуру пользователя, закончившего сценарий"""
+        self.chats.pop(user_id, None)
+
+    async def _get_updates(self, offset: int = 0, limit: int = 100, timeout: float = 0, **_) -> List[Dict[str, Any]]:
+        # подтверждённые ботом обновления больше не нужны
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout and not self._closing:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    # лимиты
+
+    @staticmethod
+    def _wait(sent: Deque[float], limit: Tuple[int, float], now: float) -> float:
+        """Сколько ждать места в окне, 0 - место есть"""
+        count, period = limit
+        while sent and sent[0] <= now - period:
+            sent.popleft()
+        return sent[0] + period - now if len(sent) >= count else 0
+
+    def _retry_after(self, chat_id: Any) -> int:
+        """:return: через сколько секунд повторить запрос в чат, 0 - лимиты не превышены"""
+        now = time.monotonic()
+        # у групп и каналов отрицательный id или @username
+        is_private = isinstance(chat_id, int) and chat_id > 0
+        sent_to_chat = self._sent_to_chat.setdefault(chat_id, deque())
+        wait = max(
+            self._wait(self._sent, OVERALL_LIMIT, now),
+            self._wait(sent_to_chat, CHAT_LIMIT if is_private else GROUP_LIMIT, now),
+        )
+        if wait:
+            # Telegram отвечает целым числом секунд
+            return max(1, math.ceil(wait))
+        self._sent.append(now)
+        sent_to_chat.append(now)
+        return 0
+
+    # ответы на запросы бота
+
+    def _message(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = parameters['chat_id']
+        message_id = parameters.get('message_id') or next(self._message_ids)
+        text = parameters.get('text', '')
+        reply_markup = parameters.get('reply_markup')
+        if reply_markup and 'inline_keyboard' in reply_markup:
+            buttons = [
+                (button['text'], button['callback_data']) for row in reply_markup['inline_keyboard'] for button in row
+            ]
+            self.chats[chat_id] = Chat(message_id=message_id, buttons=buttons, text=text, last_text=text)
+        elif 'text' in parameters:
+            self.chats.setdefault(chat_id, Chat()).last_text = text
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'bot'},
+            'text': text,
+        }
+
+    async def _handle(self, endpoint: str, parameters: Dict[str, Any]) -> Any:
+        if endpoint == 'getUpdates':
+            return await self._get_updates(**parameters)
+        if endpoint == 'getMe':
+            return {
+                'id': BOT_ID,
+                'is_bot': True,
+                'first_name': 'bot',
+                'username': 'loadtest_bot',
+                'can_join_groups': False,
+                'can_read_all_group_messages': False,
+                'supports_inline_queries': False,
+            }
+        if endpoint in _MESSAGE_ENDPOINTS:
+            return self._message(parameters)
+        if endpoint == 'getFile':
+            file_id = parameters['file_id']
+            return {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_size': len(self._files[file_id]),
+                'file_path': file_id,
+            }
+        return True
+
+    @staticmethod
+    def _parse(body: bytes) -> Dict[str, Any]:
+        parameters = {}
+        for name, value in parse_qsl(body.decode()):
+            if name not in _RAW_PARAMETERS:
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            parameters[name] = value
+        return parameters
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: bytes, content_type: bytes, body: bytes) -> None:
+        writer.write(
+            b'HTTP/1.1 ' + status + b'\r\nContent-Type: ' + content_type + b'\r\n'
+            + f'Content-Length: {len(body)}\r\n\r\n'.encode()
+            + body
+        )
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Минимальный HTTP/1.1 с keep-alive, ровно то, что отправляет httpx"""
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                path = request_line.split()[1].decode()
+                endpoint = path.rsplit('/', 1)[-1]
+                if path.startswith('/file/'):
+                    # скачивание файла, endpoint - file_path из ответа getFile
+                    self._respond(writer, b'200 OK', b'application/octet-stream', self._files[endpoint])
+                    await writer.drain()
+                    continue
+                if endpoint != 'getUpdates':
+                    self.requests += 1
+                parameters = self._parse(body)
+                retry_after = self.limits and 'chat_id' in parameters and self._retry_after(parameters['chat_id'])
+                if retry_after:
+                    self.rate_limited += 1
+                    status = b'429 Too Many Requests'
+                    payload = {
+                        'ok': False,
+                        'error_code': 429,
+                        'description': f'Too Many Requests: retry after {retry_after}',
+                        'parameters': {'retry_after': retry_after},
+                    }
+                else:
+                    status = b'200 OK'
+                    payload = {'ok': True, 'result': await self._handle(endpoint, parameters)}
+                self._respond(writer, status, b'application/json', json.dumps(payload).encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
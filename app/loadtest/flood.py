@@ -0,0 +1,85 @@
+"""
+Флуд: каждый пользователь без ожидания ответов присылает пачку /add и много раз жмёт одну кнопку
+
+Пользователи сначала заводят счета и категории в темпе, который пропускает защита от флуда, затем
+шлют всё разом. Число SQL-запросов за время флуда должно определяться корзиной токенов, а не числом
+присланных обновлений; для сравнения тот же флуд можно прогнать без защиты (rate=0)
+"""
+import asyncio
+import statistics
+from typing import Any, Dict, List
+
+from prometheus_client import REGISTRY
+
+from common.flood import REASON__DUPLICATE, REASON__RATE, FloodGuard
+from common.metrics import PREFIX
+from db.uow import UnitOfWorkStats, stats_listeners
+from loadtest.runner import (
+    STEP_TIMEOUT,
+    LoadTestApplication,
+    new_user_ids,
+    no_flood_guard,
+    running_bot,
+    send_step,
+    simulate_user,
+)
+from loadtest.scripts import BUTTON, MESSAGE, setup
+
+
+def _dropped(reason: str) -> float:
+    return REGISTRY.get_sample_value(f'{PREFIX}_dropped_updates_total', {'reason': reason}) or 0
+
+
+async def flood(
+    users: int,
+    messages: int,
+    presses: int,
+    budget: float,
+    rate: float,
+    burst: float,
+    duplicate_window: float,
+) -> Dict[str, Any]:
+    """
+    :param messages: сколько /add присылает каждый пользователь
+    :param presses: сколько раз каждый нажимает «Расход» в одном и том же сообщении
+    :param budget: допустимое число SQL-запросов на пользователя за время флуда
+    :param rate: обновлений в секунду от пользователя, 0 - без защиты от флуда
+    """
+    guard = FloodGuard(rate, burst, duplicate_window) if rate else no_flood_guard()
+    user_ids = [uid for uid, _ in zip(new_user_ids(), range(users))]
+    statements: List[int] = []
+
+    def count_statements(stats: UnitOfWorkStats) -> None:
+        statements.append(stats.statements)
+
+    async def flood_user(api, user_id: int) -> None:
+        futures = [send_step(api, user_id, (MESSAGE, '/add')) for _ in range(messages)]
+        futures += [send_step(api, user_id, (BUTTON, 'Расход')) for _ in range(presses)]
+        await asyncio.wait_for(asyncio.gather(*futures), STEP_TIMEOUT)
+
+    async with running_bot(flood_guard=guard) as api:
+        # подготовка в темпе, который защита пропускает, последний /add оставляет клавиатуру с «Расход»
+        pause = 1 / rate if rate else 0
+        await asyncio.gather(*(
+            simulate_user(api, user_id, setup() + [(MESSAGE, '/add')], [], pause) for user_id in user_ids
+        ))
+        dropped_before = {reason: _dropped(reason) for reason in (REASON__RATE, REASON__DUPLICATE)}
+        stats_listeners.append(count_statements)
+        try:
+            await asyncio.gather(*(flood_user(api, user_id) for user_id in user_ids))
+        finally:
+            stats_listeners.remove(count_statements)
+
+    dropped = {reason: int(_dropped(reason) - before) for reason, before in dropped_before.items()}
+    statements_per_user = sum(statements) / users
+    return {
+        'users': users,
+        'updates': len(statements),
+        'dropped': dropped,
+        'errors': LoadTestApplication.errors,
+        'statements': sum(statements),
+        'statements_per_user': round(statements_per_user, 1),
+        'statements_per_update': round(statistics.mean(statements), 2),
+        'budget': budget,
+        'passed': statements_per_user <= budget and not LoadTestApplication.errors,
+    }
@@ -0,0 +1,67 @@
+"""
+Клавиатура категорий (см. common.keyboards) у пользователя с большим числом категорий
+
+Клавиатура строится тем же методом, что и в /categories, по категориям в user_data, без базы и Bot API.
+Замеряется построение страницы без кэша (версия пользователя сбрасывается перед каждым построением,
+как после записи) и из кэша. Все страницы должны укладываться в ограничение Telegram на число кнопок
+"""
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict
+
+from common.keyboards import PAGE_SIZE, invalidate
+from db.snapshots import CategorySnapshot
+from handlers.categories import Categories
+from loadtest.runner import new_user_ids
+
+# столько кнопок Telegram принимает в одной инлайн-клавиатуре
+TELEGRAM_MAX_BUTTONS = 100
+
+
+def _best_us(repeat: int, func: Callable[[], Any]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started_at)
+    return round(min(timings) * 1_000_000, 1)
+
+
+def keyboards(categories: int, repeat: int) -> Dict[str, Any]:
+    """
+    :param categories: сколько категорий у пользователя, все на верхнем уровне
+    :param repeat: сколько раз повторять замер, берётся лучший
+    """
+    user_id = next(new_user_ids())
+    context = SimpleNamespace(user_data={
+        'user_id': user_id,
+        'categories': {
+            n: CategorySnapshot(id=n, title=f'Категория {n}', disabled=False, parent_id=None)
+            for n in range(1, categories + 1)
+        },
+    })
+    pages = max(1, -(-categories // PAGE_SIZE))
+
+    def cold(page: int = 0) -> None:
+        invalidate(user_id)
+        Categories.categories_keyboard(context, page)
+
+    report: Dict[str, Any] = {
+        'categories': categories,
+        'pages': pages,
+        'cold_us': _best_us(repeat, cold),
+        'cached_us': _best_us(repeat, lambda: Categories.categories_keyboard(context)),
+        'cold_all_pages_us': _best_us(repeat, lambda: [cold(page) for page in range(pages)]),
+    }
+    report['speedup'] = round(report['cold_us'] / report['cached_us'], 1)
+
+    buttons = [
+        sum(len(row) for row in Categories.categories_keyboard(context, page).inline_keyboard)
+        for page in range(pages)
+    ]
+    report['max_buttons_per_page'] = max(buttons)
+    report['passed'] = (
+        max(buttons) <= TELEGRAM_MAX_BUTTONS
+        and Categories.categories_keyboard(context) is Categories.categories_keyboard(context)
+    )
+    return report
@@ -0,0 +1,109 @@
+"""
+Объединение запросов счетов и категорий (см. db.loaders) при одновременных обновлениях
+
+Каждый из users пользователей одновременно открывает единицу работы и запрашивает свои счета и категории,
+как Accounts.entrypoint и шаги клавиатуры Add. Сценарий прогоняется с объединением запросов и без него
+(запрос на пользователя в его сессии), считаются все SQL-запросы к основной базе. Результаты сверяются
+"""
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, event
+
+from db import AccountModel, CategoryModel, UserModel
+from db.base import engine, in_ids, warm_up
+from db.loaders import (
+    accounts_loader,
+    categories_loader,
+    get_accounts,
+    get_categories,
+    load_user_accounts,
+    load_user_categories,
+)
+from db.uow import get_session, unit_of_work
+from loadtest.runner import new_user_ids
+
+MODE__BATCHED = 'batched'
+MODE__PER_USER = 'per_user'
+
+ACCOUNTS = 2
+CATEGORIES = 5
+
+
+async def _setup(users: int) -> List[int]:
+    ids = new_user_ids()
+    user_ids = [next(ids) for _ in range(users)]
+    async with unit_of_work():
+        session = get_session()
+        session.add_all([UserModel(id=user_id) for user_id in user_ids])
+        await session.flush()
+        for user_id in user_ids:
+            session.add_all([
+                AccountModel(title=f'Счёт {n + 1}', user_id=user_id, amount=n * 100, currency='RUB')
+                for n in range(ACCOUNTS)
+            ])
+            session.add_all([CategoryModel(title=f'Категория {n + 1}', user_id=user_id) for n in range(CATEGORIES)])
+    return user_ids
+
+
+async def _lookup(mode: str, user_id: int) -> tuple:
+    async with unit_of_work():
+        # все пользователи открывают единицы работы до первого запроса, как при одновременных нажатиях
+        await asyncio.sleep(0)
+        if mode == MODE__BATCHED:
+            accounts, categories = await get_accounts(user_id), await get_categories(user_id)
+        else:
+            session = get_session()
+            accounts = await load_user_accounts(session, user_id)
+            categories = await load_user_categories(session, user_id)
+    return [(account.id, account.amount) for account in accounts], [category.id for category in categories]
+
+
+async def _run_mode(mode: str, user_ids: List[int]) -> Dict[str, Any]:
+    queries = 0
+
+    def count_query(*args) -> None:
+        nonlocal queries
+        queries += 1
+
+    batches = accounts_loader.batches + categories_loader.batches
+    event.listen(engine.sync_engine, 'before_cursor_execute', count_query)
+    try:
+        started_at = time.perf_counter()
+        results = await asyncio.gather(*(_lookup(mode, user_id) for user_id in user_ids))
+        elapsed = time.perf_counter() - started_at
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', count_query)
+
+    lookups = len(user_ids) * 2
+    return {
+        'lookups': lookups,
+        'queries': queries,
+        'batches': accounts_loader.batches + categories_loader.batches - batches,
+        'elapsed_s': round(elapsed, 3),
+        'lookups_per_second': round(lookups / elapsed, 1),
+        'queries_per_second': round(queries / elapsed, 1),
+        'results': results,
+    }
+
+
+async def loaders(users: int) -> Dict[str, Any]:
+    """
+    :param users: сколько пользователей запрашивают счета и категории одновременно
+    """
+    await warm_up()
+    user_ids = await _setup(users)
+    try:
+        modes = {mode: await _run_mode(mode, user_ids) for mode in (MODE__PER_USER, MODE__BATCHED)}
+    finally:
+        async with unit_of_work():
+            await get_session().execute(delete(UserModel).where(in_ids(UserModel.id, user_ids)))
+
+    results = [mode.pop('results') for mode in modes.values()]
+    return {
+        'users': users,
+        'modes': modes,
+        'speedup': round(modes[MODE__BATCHED]['lookups_per_second'] / modes[MODE__PER_USER]['lookups_per_second'], 2),
+        'passed': results[0] == results[1] and modes[MODE__BATCHED]['queries'] < modes[MODE__PER_USER]['queries'],
+    }
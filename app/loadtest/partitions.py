@@ -0,0 +1,128 @@
+"""
+Отсечение секций entry и transfer (см. db.partitions) в запросах за период
+
+Для запросов за день, текущий месяц и квартал выполняется EXPLAIN ANALYZE: секции, которые
+просматривает план, должны совпадать с секциями месяцев периода. Те же запросы замеряются
+с выключенным отсечением секций (enable_partition_pruning), настройка меняется только в транзакции
+замера и откатывается вместе с ней
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from db import EntryModel
+from db.base import SQLITE, engine
+from db.partitions import PARTITIONED_TABLES, add_months, iter_months, month_start, partition_name
+
+QUERIES = {
+    'entry_totals': (
+        'entry',
+        'SELECT category_id, sum(amount) FROM entry '
+        'WHERE user_id = :user_id AND date_created >= :start AND date_created < :end GROUP BY category_id',
+    ),
+    'entry_count': (
+        'entry',
+        'SELECT count(*) FROM entry WHERE date_created >= :start AND date_created < :end',
+    ),
+    'transfer_totals': (
+        'transfer',
+        'SELECT sum(amount_from), sum(amount_to) FROM transfer '
+        'WHERE user_id = :user_id AND date_created >= :start AND date_created < :end',
+    ),
+}
+
+
+def _months_back(month: date, months: int) -> date:
+    for _ in range(months):
+        month = month_start(month - timedelta(days=1))
+    return month
+
+
+def _periods(today: date) -> Dict[str, Tuple[date, date]]:
+    """Период - [начало, конец)"""
+    this_month = month_start(today)
+    return {
+        'day': (today, today + timedelta(days=1)),
+        'month': (this_month, add_months(this_month, 1)),
+        'quarter': (_months_back(this_month, 2), add_months(this_month, 1)),
+    }
+
+
+def _relations(plan: Dict[str, Any]) -> Iterator[str]:
+    if 'Relation Name' in plan:
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from _relations(child)
+
+
+def _expected(table: str, existing: Set[str], start: date, end: date) -> Set[str]:
+    names = {partition_name(table, month) for month in iter_months(start, end - timedelta(days=1))}
+    # месяцы без своей секции лежат в секции по умолчанию
+    return (names & existing) | ({f'{table}_default'} if names - existing else set())
+
+
+async def _explain(connection: AsyncConnection, sql: str, params: Dict[str, Any]) -> Tuple[Set[str], float]:
+    """:return: просмотренные секции и время выполнения, мс"""
+    result, = (await connection.execute(text(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}'), params)).scalar_one()
+    return set(_relations(result['Plan'])), round(result['Execution Time'], 2)
+
+
+async def _existing_partitions(connection: AsyncConnection) -> Dict[str, Set[str]]:
+    return {
+        table: set((await connection.execute(
+            text('SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)'),
+            {'table': table},
+        )).scalars().all())
+        for table in PARTITIONED_TABLES
+    }
+
+
+async def _measure(connection: AsyncConnection, user_id: int, existing: Dict[str, Set[str]],
+                   periods: Dict[str, Tuple[date, date]]) -> List[Dict[str, Any]]:
+    results = []
+    for name, (table, sql) in QUERIES.items():
+        for period, (start, end) in periods.items():
+            scanned, elapsed = await _explain(connection, sql, {'user_id': user_id, 'start': start, 'end': end})
+            results.append({
+                'query': name,
+                'period': period,
+                'expected': sorted(_expected(table, existing[table], start, end)),
+                'scanned': sorted(scanned),
+                'ms': elapsed,
+            })
+    return results
+
+
+async def partition_pruning(today: date = None) -> Dict[str, Any]:
+    """
+    :param today: день, от которого отсчитываются периоды, по умолчанию сегодня
+    """
+    if SQLITE:
+        raise ValueError('Partition pruning is checked on PostgreSQL')
+    periods = _periods(today or date.today())
+    async with engine.connect() as connection:
+        existing = await _existing_partitions(connection)
+        if not all(existing.values()):
+            raise ValueError('entry and transfer are not partitioned, run alembic upgrade head')
+        user_id = (await connection.execute(
+            select(EntryModel.user_id).group_by(EntryModel.user_id).order_by(func.count().desc()).limit(1)
+        )).scalar_one_or_none()
+        if user_id is None:
+            raise ValueError('No entries, seed them with python -m db.fixtures seed')
+
+        pruned = await _measure(connection, user_id, existing, periods)
+        await connection.execute(text('SET LOCAL enable_partition_pruning = off'))
+        unpruned = await _measure(connection, user_id, existing, periods)
+        await connection.rollback()
+
+    for result, without_pruning in zip(pruned, unpruned):
+        result['partitions_without_pruning'] = len(without_pruning['scanned'])
+        result['ms_without_pruning'] = without_pruning['ms']
+    return {
+        'user_id': user_id,
+        'periods': {period: [start.isoformat(), end.isoformat()] for period, (start, end) in periods.items()},
+        'queries': pruned,
+        'passed': all(result['scanned'] == result['expected'] for result in pruned),
+    }
@@ -0,0 +1,293 @@
+"""
+Прогон нагрузки: настоящее приложение со всеми обработчиками опрашивает поддельный Bot API,
+имитируемые пользователи одновременно проходят свои сценарии
+
+Задержка обновления - от его появления в getUpdates до окончания process_update, то есть
+вместе с фиксацией транзакции и всеми запросами бота к API. С --workers обновления получает
+супервизор и раздаёт процессам-обработчикам, задержка считается до подтверждения обработчика
+"""
+import asyncio
+import itertools
+import random
+import statistics
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from telegram import Bot, Update
+from telegram.ext import Updater
+from telegram.request import HTTPXRequest
+
+from common import logs
+from common.application import Application
+from common.flood import FloodGuard
+from common.outbox import Outbox
+from common.supervisor import Message, Supervisor, WorkerApplication, run_supervisor, serve_worker
+from db.uow import UnitOfWorkStats, stats_listeners
+from loadtest.fake_api import FakeBotApi
+from loadtest.scripts import BUTTON, DOCUMENT, Step
+
+# сколько ждать ответа бота на один шаг
+STEP_TIMEOUT = 30
+
+_completed: Dict[int, asyncio.Future] = {}
+
+
+def _complete(update_id: int) -> None:
+    future = _completed.pop(update_id, None)
+    if future is not None and not future.done():
+        future.set_result(time.perf_counter())
+
+
+class LoadTestApplication(Application):
+    """Сообщает имитируемому пользователю, что его обновление обработано"""
+
+    errors = 0
+
+    async def process_update(self, update: object) -> None:
+        try:
+            await super().process_update(update)
+        finally:
+            if isinstance(update, Update):
+                _complete(update.update_id)
+
+    async def process_error(self, update: Optional[object], error: Exception, *args, **kwargs) -> bool:
+        LoadTestApplication.errors += 1
+        return await super().process_error(update, error, *args, **kwargs)
+
+
+def _find_button(api: FakeBotApi, user_id: int, title: str) -> str:
+    chat = api.chats.get(user_id)
+    for text, callback_data in chat.buttons if chat else ():
+        if text.startswith(title):
+            return callback_data
+    raise LookupError(f'user {user_id}: no button {title!r} in {chat.buttons if chat else []}')
+
+
+def send_step(api: FakeBotApi, user_id: int, step: Step) -> asyncio.Future:
+    """Отправляет шаг сценария, результат - время окончания обработки обновления"""
+    kind, value = step
+    if kind == BUTTON:
+        update_id = api.press_button(user_id, _find_button(api, user_id, value))
+    elif kind == DOCUMENT:
+        update_id = api.send_document(user_id, *value)
+    else:
+        update_id = api.send_message(user_id, value)
+    future = _completed[update_id] = asyncio.get_running_loop().create_future()
+    return future
+
+
+async def simulate_user(
+    api: FakeBotApi, user_id: int, script: List[Step], latencies: List[float], pause: float = 0,
+) -> None:
+    """:param pause: пауза между шагами, секунд"""
+    for step in script:
+        future = send_step(api, user_id, step)
+        started_at = time.perf_counter()
+        latencies.append(await asyncio.wait_for(future, STEP_TIMEOUT) - started_at)
+        if pause:
+            await asyncio.sleep(pause)
+
+
+def percentile(values: List[float], percent: int) -> float:
+    return statistics.quantiles(values, n=100)[percent - 1] if len(values) > 1 else values[0]
+
+
+def no_flood_guard() -> FloodGuard:
+    """Защита от флуда, которая ничего не отбрасывает: её цена входит в замер, а ограничения - нет"""
+    return FloodGuard(rate=1e6, burst=1e6, duplicate_window=0)
+
+
+def _builder_kwargs(
+    base_url: str, concurrency: Optional[int], base_file_url: Optional[str] = None,
+) -> Dict[str, Any]:
+    builder_kwargs = {
+        'base_url': base_url,
+        # поддельный сервер умеет только HTTP/1.1
+        'http_version': '1.1',
+        'get_updates_http_version': '1.1',
+        'application_class': LoadTestApplication,
+        # лимиты Telegram здесь не проверяются, меряем сам бот, а не ожидание в очереди
+        'rate_limiter': Outbox(overall_rate=1e6, overall_burst=1e6, chat_rate=1e6, chat_burst=1e6),
+    }
+    if base_file_url is not None:
+        builder_kwargs['base_file_url'] = base_file_url
+    if concurrency is not None:
+        builder_kwargs['concurrent_updates'] = concurrency or False
+    return builder_kwargs
+
+
+@asynccontextmanager
+async def running_bot(
+    concurrency: Optional[int] = None, flood_guard: Optional[FloodGuard] = None,
+) -> AsyncIterator[FakeBotApi]:
+    """
+    Запускает приложение, опрашивающее поддельный Bot API, и останавливает по выходе
+
+    :param concurrency: сколько обновлений обрабатывать одновременно, по умолчанию CONCURRENT_UPDATES
+    :param flood_guard: защита от флуда, по умолчанию ничего не отбрасывающая
+    """
+    import start_bot
+
+    api = FakeBotApi()
+    await api.start()
+
+    application = start_bot.build_application(
+        flood_guard=flood_guard or no_flood_guard(),
+        **_builder_kwargs(api.base_url, concurrency, api.base_file_url),
+    )
+    logs.configure(level='WARNING', json_format=False)
+    LoadTestApplication.errors = 0
+    try:
+        async with application:
+            # run_polling вызывает post_init сам, здесь приложение запускается вручную
+            await application.post_init(application)
+            await application.updater.start_polling(poll_interval=0, timeout=10)
+            await application.start()
+            try:
+                yield api
+            finally:
+                await application.updater.stop()
+                await application.stop()
+    finally:
+        await api.stop()
+
+
+def serve_loadtest_worker(base_url: str, concurrency: Optional[int] = None) -> None:
+    """Процесс-обработчик для running_supervisor, запускается как python -m loadtest worker"""
+    import start_bot
+
+    builder_kwargs = _builder_kwargs(base_url, concurrency)
+    builder_kwargs['application_class'] = WorkerApplication
+    application = start_bot.build_application(
+        jobs=False, flood_guard=no_flood_guard(), updater=None, **builder_kwargs,
+    )
+    logs.configure(level='WARNING', json_format=False)
+    asyncio.run(serve_worker(application))
+
+
+@asynccontextmanager
+async def running_supervisor(
+    workers: int,
+    on_processed: Callable[[Message], None],
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[FakeBotApi]:
+    """Как running_bot, но обновления раздаёт супервизор workers процессам-обработчикам"""
+    from config import settings
+
+    api = FakeBotApi()
+    await api.start()
+
+    def command(index: int) -> List[str]:
+        arguments = [sys.executable, '-m', 'loadtest', 'worker', '--base-url', api.base_url]
+        if concurrency is not None:
+            arguments += ['--concurrency', str(concurrency)]
+        return arguments
+
+    ready = asyncio.Event()
+    stop = asyncio.Event()
+    supervisor = Supervisor(workers, command, on_ready=ready.set, on_processed=on_processed)
+    bot = Bot(
+        settings.BOT_TOKEN,
+        base_url=api.base_url,
+        request=HTTPXRequest(http_version='1.1'),
+        get_updates_request=HTTPXRequest(http_version='1.1'),
+    )
+    task = asyncio.create_task(run_supervisor(Updater(bot, asyncio.Queue()), supervisor, stop))
+    try:
+        await ready.wait()
+        yield api
+    finally:
+        stop.set()
+        await task
+        await api.stop()
+
+
+def new_user_ids() -> Iterator[int]:
+    """Новые пользователи на каждый прогон, чтобы сценарий начинался с пустой базы"""
+    return itertools.count(random.randint(10 ** 9, 2 * 10 ** 9))
+
+
+async def run(
+    users: int,
+    script: List[Step],
+    concurrency: Optional[int] = None,
+    workers: int = 0,
+) -> Dict[str, Any]:
+    """
+    Прогоняет сценарий для users новых пользователей и возвращает отчёт
+
+    :param concurrency: сколько обновлений обрабатывать одновременно, по умолчанию CONCURRENT_UPDATES
+    :param workers: сколько процессов-обработчиков запустить под супервизором, 0 - всё в этом процессе
+    """
+    from config import settings
+
+    statements: List[int] = []
+
+    def count_statements(stats: UnitOfWorkStats) -> None:
+        statements.append(stats.statements)
+
+    def worker_processed(message: Message) -> None:
+        statements.append(message['statements'])
+        if message['failed']:
+            LoadTestApplication.errors += 1
+        _complete(message['update_id'])
+
+    stats_listeners.append(count_statements)
+    LoadTestApplication.errors = 0
+    latencies: List[float] = []
+    user_ids = new_user_ids()
+    if workers:
+        bot = running_supervisor(workers, worker_processed, concurrency)
+    else:
+        bot = running_bot(concurrency)
+    try:
+        async with bot as api:
+            requests_before = api.requests
+            started_at = time.perf_counter()
+            await asyncio.gather(*(
+                simulate_user(api, next(user_ids), script, latencies) for _ in range(users)
+            ))
+            seconds = time.perf_counter() - started_at
+            api_requests = api.requests - requests_before
+    finally:
+        stats_listeners.remove(count_statements)
+
+    return {
+        'users': users,
+        'updates': len(latencies),
+        'errors': LoadTestApplication.errors,
+        'concurrent_updates': settings.CONCURRENT_UPDATES if concurrency is None else concurrency,
+        'workers': workers,
+        'seconds': round(seconds, 3),
+        'updates_per_second': round(len(latencies) / seconds, 1),
+        'latency_ms': {
+            f'p{percent}': round(percentile(latencies, percent) * 1000, 2) for percent in (50, 95, 99)
+        },
+        'statements_per_update': round(statistics.mean(statements), 2),
+        'api_requests_per_update': round(api_requests / len(latencies), 2),
+    }
+
+
+def compare(baseline: Dict[str, Any], report: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Сравнивает отчёт с эталонным, возвращает список регрессий
+
+    Число запросов к базе детерминировано и не должно расти вовсе, скорость и задержки
+    зависят от машины, для них допускается отклонение tolerance (доля)
+    """
+    regressions = []
+    if report['errors']:
+        regressions.append(f'{report["errors"]} updates failed')
+    if report['statements_per_update'] > baseline['statements_per_update'] + 0.01:
+        regressions.append(
+            f'statements per update: {baseline["statements_per_update"]} -> {report["statements_per_update"]}'
+        )
+    if report['updates_per_second'] < baseline['updates_per_second'] * (1 - tolerance):
+        regressions.append(f'updates/s: {baseline["updates_per_second"]} -> {report["updates_per_second"]}')
+    for percentile in ('p95', 'p99'):
+        was, now = baseline['latency_ms'][percentile], report['latency_ms'][percentile]
+        if now > was * (1 + tolerance):
+            regressions.append(f'{percentile} latency: {was} ms -> {now} ms')
+    return regressions
@@ -0,0 +1,63 @@
+"""
+Сценарии имитируемых пользователей
+
+Шаг - сообщение, нажатие кнопки из последней присланной ботом клавиатуры или документ
+(имя файла и содержимое). Кнопка ищется по началу текста (у счетов в тексте ещё и баланс)
+"""
+from typing import List, Tuple, Union
+
+MESSAGE = 'message'
+BUTTON = 'button'
+DOCUMENT = 'document'
+
+Step = Tuple[str, Union[str, Tuple[str, bytes]]]
+
+
+def setup() -> List[Step]:
+    """Два счёта и две категории, у нового пользователя бот сразу просит название"""
+    return [
+        (MESSAGE, '/accounts'), (MESSAGE, 'Наличка'), (MESSAGE, '1000 руб'),
+        (BUTTON, 'Добавить'), (MESSAGE, 'Карта'), (MESSAGE, '5000 руб'), (BUTTON, 'Закрыть'),
+        (MESSAGE, '/categories'), (MESSAGE, 'Еда, Транспорт'), (BUTTON, 'Закрыть'),
+    ]
+
+
+def expense(number: int) -> List[Step]:
+    category = 'Еда' if number % 3 else 'Транспорт'
+    return [
+        (MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Наличка'), (BUTTON, category),
+        (MESSAGE, f'{10 + number % 5} расход-{number}'),
+    ]
+
+
+def transfer() -> List[Step]:
+    return [(MESSAGE, '/add'), (BUTTON, 'Перевод'), (BUTTON, 'Карта'), (BUTTON, 'Наличка'), (MESSAGE, '100')]
+
+
+def browse() -> List[Step]:
+    """Просмотр списков без изменений, проверяет кэш клавиатур"""
+    return [
+        (MESSAGE, '/accounts'), (BUTTON, 'Наличка'), (BUTTON, 'Закрыть'),
+        (MESSAGE, '/categories'), (BUTTON, 'Закрыть'),
+    ]
+
+
+def expenses_script(expenses: int = 50, transfers: int = 5) -> List[Step]:
+    """Заводит счета и категории, добавляет расходы, через каждые десять - перевод и просмотр списков"""
+    steps = setup()
+    for number in range(expenses):
+        steps.extend(expense(number))
+        if number % 10 == 9:
+            steps.extend(browse())
+    for _ in range(transfers):
+        steps.extend(transfer())
+    return steps
+
+
+def soak_script() -> List[Step]:
+    """Короткие диалоги, каждый доходит до конца: счёт, категория, расход"""
+    return [
+        (MESSAGE, '/accounts'), (MESSAGE, 'Наличка'), (MESSAGE, '1000 руб'), (BUTTON, 'Закрыть'),
+        (MESSAGE, '/categories'), (MESSAGE, 'Еда'), (BUTTON, 'Закрыть'),
+        (MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Наличка'), (BUTTON, 'Еда'), (MESSAGE, '10 обед'),
+    ]
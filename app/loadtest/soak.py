@@ -0,0 +1,98 @@
+"""
+Проверка на утечки памяти: много пользователей проходят короткие законченные диалоги,
+между волнами снимаются снимки tracemalloc
+
+После разогрева (пулы, кэши шаблонов и запросов SQLAlchemy) всё, что продолжает расти вместе
+с числом пользователей, считается удерживаемой памятью на пользователя. Если она больше бюджета,
+проверка не проходит, а для разбора выводится разница снимков по местам выделения
+"""
+import asyncio
+import gc
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from common import keyboards
+from loadtest.runner import LoadTestApplication, new_user_ids, running_bot, simulate_user
+from loadtest.scripts import Step
+
+# собственные выделения tracemalloc и импорта в разницу снимков не попадают
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+def _retained() -> int:
+    # кэш клавиатур ограничен CACHE_SIZE, за время проверки он просто заполняется, это не утечка
+    keyboards._cache.clear()
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+async def soak(
+    users: int,
+    script: List[Step],
+    budget: int,
+    warmup: int = 200,
+    interval: int = 1000,
+    wave: int = 50,
+    frames: int = 1,
+    top: int = 25,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    :param users: сколько пользователей пройдёт сценарий после разогрева
+    :param budget: допустимая удерживаемая память на пользователя, байт
+    :param warmup: сколько пользователей прогнать до первого снимка
+    :param interval: через сколько пользователей замерять память
+    :param wave: сколько пользователей одновременно проходят сценарий
+    :param frames: глубина стека в снимках, больше - точнее разница, но медленнее
+    :param top: сколько строк разницы снимков вывести
+    """
+    tracemalloc.start(frames)
+    user_ids = new_user_ids()
+    samples = []
+
+    async def run_users(count: int) -> None:
+        for start in range(0, count, wave):
+            batch = [next(user_ids) for _ in range(min(wave, count - start))]
+            await asyncio.gather(*(simulate_user(api, user_id, script, []) for user_id in batch))
+            for user_id in batch:
+                api.forget(user_id)
+
+    try:
+        async with running_bot(concurrency) as api:
+            await run_users(warmup)
+            baseline = _retained()
+            baseline_snapshot = _snapshot()
+            done = 0
+            while done < users:
+                count = min(interval, users - done)
+                await run_users(count)
+                done += count
+                retained = _retained() - baseline
+                samples.append({'users': done, 'retained_bytes': retained, 'bytes_per_user': retained // done})
+                print(f'{done:>8} users: {retained / 2 ** 20:8.2f} MiB, {retained / done:8.0f} B/user', flush=True)
+            final_snapshot = _snapshot()
+    finally:
+        tracemalloc.stop()
+
+    key_type = 'traceback' if frames > 1 else 'lineno'
+    diff = [str(stat) for stat in final_snapshot.compare_to(baseline_snapshot, key_type)[:top]]
+    bytes_per_user = samples[-1]['bytes_per_user']
+    return {
+        'users': users,
+        'warmup': warmup,
+        'errors': LoadTestApplication.errors,
+        'bytes_per_user': bytes_per_user,
+        'budget': budget,
+        'passed': bytes_per_user <= budget and not LoadTestApplication.errors,
+        'samples': samples,
+        'top_allocations': diff,
+    }
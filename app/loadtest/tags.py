@@ -0,0 +1,107 @@
+"""
+Фильтр записей по меткам на синтетическом журнале (python -m db.fixtures seed)
+
+Для выборки пользователей с записями выполняются запросы /entries (db.tags): последние записи
+и итог по валютам - без меток, с одной частой меткой, с одной редкой, И из двух меток, ИЛИ из двух.
+Те же запросы замеряются со всеми индексами, без GIN-индекса ix_entry_tags и затем ещё без
+ix_entry_user_id_date_created: индексы удаляются внутри транзакции, которая затем откатывается.
+DROP INDEX блокирует таблицу entry до отката, поэтому запускать только на отдельной базе для замеров
+"""
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from db import EntryModel
+from db.base import SQLITE, engine, in_ids
+from db.tags import find_entries, tag_totals
+
+# режим замера и индекс, удаляемый перед ним
+MODES = (
+    ('indexed', None),
+    ('without_gin', 'ix_entry_tags'),
+    ('without_indexes', 'ix_entry_user_id_date_created'),
+)
+
+
+def _queries(tags: List[str]) -> Dict[str, List[List[str]]]:
+    """Метки по убыванию частоты"""
+    return {
+        'all': [],
+        'frequent': [[tags[0]]],
+        'rare': [[tags[-1]]],
+        'and': [sorted(tags[:2])],
+        'or': [[tags[0]], [tags[-1]]],
+    }
+
+
+async def _measure(connection: AsyncConnection, user_ids: List[int], queries: Dict[str, Any],
+                   repeat: int) -> Dict[str, float]:
+    session = AsyncSession(bind=connection)
+    timings = {}
+    for name, groups in queries.items():
+        best = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            for user_id in user_ids:
+                await tag_totals(session, user_id, groups)
+                await find_entries(session, user_id, groups)
+            best.append(time.perf_counter() - started_at)
+            session.expunge_all()
+        # на одного пользователя: оба запроса /entries
+        timings[name] = round(min(best) / len(user_ids) * 1000, 2)
+    return timings
+
+
+async def _results(connection: AsyncConnection, user_ids: List[int], queries: Dict[str, Any]) -> list:
+    session = AsyncSession(bind=connection)
+    results = []
+    for groups in queries.values():
+        for user_id in user_ids:
+            totals = await tag_totals(session, user_id, groups)
+            entries = await find_entries(session, user_id, groups)
+            results.append((totals, [entry.id for entry, *_ in entries]))
+    return results
+
+
+async def tag_filter(users: int, repeat: int) -> Dict[str, Any]:
+    """
+    :param users: для скольких пользователей выполнять запросы
+    :param repeat: сколько раз повторять замер, берётся лучший
+    """
+    if SQLITE:
+        raise ValueError('Tag filter is benchmarked on PostgreSQL')
+    async with engine.connect() as connection:
+        entries = (await connection.execute(select(func.count()).select_from(EntryModel))).scalar_one()
+        user_ids = (await connection.execute(
+            select(EntryModel.user_id).where(EntryModel.tags.is_not(None))
+            .group_by(EntryModel.user_id).order_by(EntryModel.user_id.desc()).limit(users)
+        )).scalars().all()
+        tag = func.unnest(EntryModel.tags).label('tag')
+        tags = (await connection.execute(
+            select(tag).where(in_ids(EntryModel.user_id, user_ids)).group_by(tag).order_by(func.count().desc(), tag)
+        )).scalars().all()
+        if len(tags) < 2:
+            raise ValueError('No tagged entries, seed them with python -m db.fixtures seed')
+        queries = _queries(tags)
+        report: Dict[str, Any] = {'entries': entries, 'users': len(user_ids), 'queries': queries}
+
+        # удаление индексов - в той же транзакции, что и все запросы, откатывается вместе с ней
+        results = []
+        for mode, index in MODES:
+            if index is not None:
+                await connection.execute(text(f'DROP INDEX {index}'))
+            report[f'{mode}_ms'] = await _measure(connection, user_ids, queries, repeat)
+            results.append(await _results(connection, user_ids, queries))
+        await connection.rollback()
+
+    report['speedup'] = {
+        mode: {
+            name: round(report[f'{mode}_ms'][name] / report['indexed_ms'][name], 1)
+            for name in queries if report['indexed_ms'][name]
+        }
+        for mode, index in MODES if index is not None
+    }
+    report['passed'] = all(result == results[0] for result in results)
+    return report
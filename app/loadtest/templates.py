@@ -0,0 +1,52 @@
+"""
+Скорость рендеринга шаблонов ответов (см. common.templates)
+
+Статические шаблоны рендерятся тремя способами: с компиляцией при каждом рендеринге (окружение
+без кэша шаблонов и байткода, с проверкой файла), скомпилированным заранее шаблоном и готовой
+строкой из render_template. Тексты во всех режимах должны совпадать
+"""
+import time
+from typing import Any, Callable, Dict, List
+
+from common.templates import compile_templates, environment, get_template, render_template, static_template_names
+
+MODE__COLD = 'cold'
+MODE__CACHED = 'cached'
+MODE__MEMOISED = 'memoised'
+
+
+def _renders_per_second(repeat: int, renders: int, template_names: List[str], render: Callable[[str], str]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for n in range(renders):
+            render(template_names[n % len(template_names)])
+        timings.append(time.perf_counter() - started_at)
+    return round(renders / min(timings), 1)
+
+
+def templates(renders: int, repeat: int) -> Dict[str, Any]:
+    """
+    :param renders: сколько рендерингов в одном замере, шаблоны чередуются
+    :param repeat: сколько раз повторять замер, берётся лучший
+    """
+    compile_templates()
+    template_names = static_template_names()
+    cold_environment = environment.overlay(cache_size=0, bytecode_cache=None, auto_reload=True)
+    modes: Dict[str, Callable[[str], str]] = {
+        MODE__COLD: lambda template_name: cold_environment.get_template(template_name).render(),
+        MODE__CACHED: lambda template_name: get_template(template_name).render(),
+        MODE__MEMOISED: render_template,
+    }
+
+    report: Dict[str, Any] = {'templates': len(template_names), 'renders': renders}
+    for mode, render in modes.items():
+        report[f'{mode}_per_second'] = _renders_per_second(repeat, renders, template_names, render)
+    report['speedup'] = {
+        mode: round(report[f'{mode}_per_second'] / report[f'{MODE__COLD}_per_second'], 1)
+        for mode in (MODE__CACHED, MODE__MEMOISED)
+    }
+    report['passed'] = all(
+        len({render(template_name) for render in modes.values()}) == 1 for template_name in template_names
+    )
+    return report
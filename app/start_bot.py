@@ -1,36 +1,241 @@
+import argparse
 import logging
-import traceback
+from datetime import timedelta
 
-from telegram import Message
-from telegram.ext import ApplicationBuilder, CommandHandler
+# модуль замеров импортируется первым, до тяжёлых зависимостей
+from common.startup import import_profiler, mark_not_ready, mark_ready, phase, report
 
-import handlers
-from common import constants
-from common.utils import send_response, cancel
-from config import settings
-
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def error_handler(update, context) -> Message:
+async def error_handler(update, context):
     """DEBUG"""
+    import traceback
+
+    from common.utils import send_response
+
     tb_list = traceback.format_exception(None, context.error, context.error.__traceback__)
     tb_string = ("".join(tb_list)).replace('<', '[').replace('>', ']')
     return await send_response(update=update, context=context, response=tb_string)
 
 
-if __name__ == '__main__':
-    application = ApplicationBuilder().token(settings.BOT_TOKEN).build()
+async def post_init(application) -> None:
+    """Прогрев перед приёмом обновлений: соединения с базой и шаблоны готовятся одновременно"""
+    import asyncio
+
+    from common.templates import compile_templates_async
+    from config import settings
+    from db.base import warm_up
+
+    with phase('warm-up'):
+        _, templates = await asyncio.gather(warm_up(), compile_templates_async())
+    logger.info('Compiled %s templates', templates)
+
+    if import_profiler.installed:
+        import_profiler.uninstall()
+        report()
+    mark_ready(settings.READY_FILE)
+
+
+async def post_shutdown(application) -> None:
+    from config import settings
+
+    mark_not_ready(settings.READY_FILE)
+
+
+def build_application(workers: int = 1, jobs: bool = True, flood_guard=None, **builder_kwargs):
+    """
+    Собирает приложение со всеми обработчиками
+
+    :param workers: сколько процессов-обработчиков делят общий лимит Telegram на бота
+    :param jobs: запускать ли периодические задачи (при нескольких обработчиках - только в одном)
+    :param flood_guard: защита от флуда вместо настроенной в FLOOD
+    :param builder_kwargs: дополнительные настройки ApplicationBuilder (метод -> аргумент), например request
+    """
+    with phase('import telegram'):
+        from telegram.ext import ApplicationBuilder, CommandHandler
+
+    with phase('import config'):
+        from config import settings
+
+    with phase('import db'):
+        from common.application import Application
+        from common.flood import FloodGuard
+        from common.metrics import instrument
+        from common.outbox import OVERALL_RATE, Outbox
+        from db.ledger import purge_job
+        from db.partitions import ensure_partitions_job
+        from db.postings import compact_job
+
+    with phase('import handlers'):
+        import handlers
+        from common import constants
+
+        # from common.utils import cancel
+        handler_classes = [handlers.Add, handlers.Categories, handlers.Accounts, handlers.Import, handlers.Entries]
+
+    with phase('build application'):
+        builder = (
+            ApplicationBuilder()
+            .application_class(Application)
+            .token(settings.BOT_TOKEN)
+            .concurrent_updates(settings.CONCURRENT_UPDATES or False)
+            .rate_limiter(Outbox(overall_rate=OVERALL_RATE / workers))
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+        )
+        if settings.BOT_API_URL:
+            builder = builder.base_url(settings.BOT_API_URL)
+        for method, value in builder_kwargs.items():
+            builder = getattr(builder, method)(value)
+        application = builder.build()
+
+        if flood_guard is None and settings.FLOOD.RATE:
+            flood_guard = FloodGuard(settings.FLOOD.RATE, settings.FLOOD.BURST, settings.FLOOD.DUPLICATE_WINDOW)
+        if flood_guard is not None:
+            # группа -1 проверяется раньше обработчиков из группы 0
+            application.add_handler(flood_guard.handler(), group=-1)
+
+        application.add_handler(instrument(CommandHandler(constants.COMMAND_START, handlers.start), 'start'))
+        # application.add_handler(instrument(CommandHandler(constants.COMMAND_CANCEL, cancel), 'cancel'))
+        application.add_handler(instrument(CommandHandler(constants.COMMAND_HELP, handlers.help_), 'help'))
+
+        for handler_class in handler_classes:
+            application.add_handler(instrument(handler_class.handler(), handler_class.__name__))
+
+        # application.add_error_handler(error_handler)
+
+        if jobs:
+            application.job_queue.run_repeating(ensure_partitions_job, interval=timedelta(days=1), first=timedelta(0))
+            application.job_queue.run_repeating(purge_job, interval=timedelta(hours=1), first=timedelta(0))
+            if settings.POSTINGS.ENABLED:
+                application.job_queue.run_repeating(
+                    compact_job, interval=settings.POSTINGS.COMPACT_INTERVAL, first=settings.POSTINGS.COMPACT_INTERVAL,
+                )
+
+    return application
 
-    application.add_handler(CommandHandler(constants.COMMAND_START, handlers.start))
-    # application.add_handler(CommandHandler(constants.COMMAND_CANCEL, cancel))
-    application.add_handler(CommandHandler(constants.COMMAND_HELP, handlers.help_))
 
-    application.add_handler(handlers.Add.handler())
-    application.add_handler(handlers.Categories.handler())
-    application.add_handler(handlers.Accounts.handler())
+def run_worker(index: int, workers: int) -> None:
+    """Процесс-обработчик: получает обновления от супервизора через stdin"""
+    import asyncio
+    import signal
 
-    # application.add_error_handler(error_handler)
+    from common.supervisor import WorkerApplication, serve_worker
+    from config import settings
 
-    application.run_polling()
+    # Ctrl+C получает вся группа процессов, а обработчик останавливает супервизор, закрывая stdin
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # о готовности сообщает супервизор, когда готовы все обработчики
+    settings.READY_FILE = None
+
+    application = build_application(
+        workers=workers, jobs=index == 0, application_class=WorkerApplication, updater=None,
+    )
+    if settings.METRICS_PORT:
+        from common.metrics import serve
+
+        serve(settings.METRICS_PORT + 1 + index, settings.METRICS_ADDR)
+    asyncio.run(serve_worker(application))
+
+
+def run_supervisor(workers: int) -> None:
+    """Получает обновления и раздаёт их workers процессам-обработчикам"""
+    import asyncio
+    import signal
+    import sys
+
+    from telegram import Bot
+    from telegram.ext import Updater
+
+    from common import supervisor
+    from config import settings
+
+    def command(index: int):
+        return [sys.executable, __file__, '--worker', str(index), '--workers', str(workers)]
+
+    async def supervise() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+
+        bot = Bot(settings.BOT_TOKEN, **({'base_url': settings.BOT_API_URL} if settings.BOT_API_URL else {}))
+        updater = Updater(bot, asyncio.Queue())
+        workers_supervisor = supervisor.Supervisor(workers, command, on_ready=lambda: mark_ready(settings.READY_FILE))
+        try:
+            await supervisor.run_supervisor(updater, workers_supervisor, stop)
+        finally:
+            mark_not_ready(settings.READY_FILE)
+
+    if settings.METRICS_PORT:
+        from common.metrics import serve
+
+        serve(settings.METRICS_PORT, settings.METRICS_ADDR)
+    mark_not_ready(settings.READY_FILE)
+    asyncio.run(supervise())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help='вывести в лог самые медленные импорты и длительность этапов запуска',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='сколько процессов-обработчиков запустить, по умолчанию WORKERS',
+    )
+    parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.profile_startup:
+        import_profiler.install()
+
+    with phase('configure logging'):
+        from common import logs
+        from config import settings
+
+        logs.configure(
+            level=settings.LOGGING.LEVEL,
+            json_format=settings.LOGGING.JSON,
+            sql=settings.LOGGING.SQL,
+            sampling=settings.LOGGING.SAMPLING,
+        )
+
+    workers = args.workers or settings.WORKERS
+    if args.worker is not None:
+        run_worker(args.worker, workers)
+        return
+    if workers > 1:
+        run_supervisor(workers)
+        return
+
+    application = build_application()
+
+    if settings.METRICS_PORT:
+        from common.metrics import serve
+
+        serve(settings.METRICS_PORT, settings.METRICS_ADDR)
+        logger.info('Serving metrics on %s:%s', settings.METRICS_ADDR, settings.METRICS_PORT)
+
+    # файл мог остаться от аварийно завершённого процесса
+    mark_not_ready(settings.READY_FILE)
+    if settings.WEBHOOK.URL:
+        from urllib.parse import urlparse
+
+        application.run_webhook(
+            listen=settings.WEBHOOK.LISTEN,
+            port=settings.WEBHOOK.PORT,
+            url_path=urlparse(settings.WEBHOOK.URL).path.lstrip('/'),
+            webhook_url=settings.WEBHOOK.URL,
+            secret_token=settings.WEBHOOK.SECRET_TOKEN,
+        )
+    else:
+        application.run_polling()
+
+
+if __name__ == '__main__':
+    main()
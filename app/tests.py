@@ -1 +0,0 @@
-# todo
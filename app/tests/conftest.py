@@ -0,0 +1,78 @@
+"""
+Тесты идут на SQLite в памяти (см. db.sqlite): схема создаётся по моделям, сервер базы не нужен.
+С TEST_DATABASE тесты идут на указанной базе PostgreSQL, к ней сначала применяются миграции
+(alembic upgrade head): секции и функции для меток по моделям не создаются.
+Настройки читаются при импорте config, поэтому переменные окружения выставляются до импорта приложения
+"""
+import os
+
+os.environ['DSN__DATABASE'] = os.environ.get('TEST_DATABASE', 'sqlite://')
+os.environ.setdefault('BOT_TOKEN', '123456:test')
+
+import asyncio  # noqa: E402
+from typing import List  # noqa: E402
+
+import pytest  # noqa: E402
+
+from common import flood, outbox  # noqa: E402
+from db.base import create_schema  # noqa: E402
+from loadtest.runner import STEP_TIMEOUT, new_user_ids, running_bot, send_step  # noqa: E402
+from loadtest.scripts import Step  # noqa: E402
+
+_user_ids = new_user_ids()
+
+
+@pytest.fixture(scope='session')
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture(scope='session')
+async def schema():
+    await create_schema()
+
+
+@pytest.fixture(scope='session')
+async def bot(schema):
+    """Приложение со всеми обработчиками и поддельный Bot API, одно на все тесты"""
+    async with running_bot() as api:
+        yield api
+
+
+@pytest.fixture
+def user_id() -> int:
+    """Новый пользователь Telegram на каждый тест"""
+    return next(_user_ids)
+
+
+@pytest.fixture
+def play(bot, user_id):
+    """Проходит шаги сценария от имени user_id, возвращает текст последнего сообщения бота"""
+    async def play(steps: List[Step]) -> str:
+        for step in steps:
+            await asyncio.wait_for(send_step(bot, user_id, step), STEP_TIMEOUT)
+        return bot.chats[user_id].last_text
+
+    return play
+
+
+class Clock:
+    """Время, которое идёт, только когда тест сдвигает now"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    perf_counter = monotonic
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    """Часы защиты от флуда и очереди исходящих запросов"""
+    clock = Clock()
+    # подменяется только время, которое видят модули, а не весь модуль time
+    for module in (flood, outbox):
+        monkeypatch.setattr(module, 'time', clock)
+    return clock
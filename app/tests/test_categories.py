@@ -0,0 +1,150 @@
+"""Объединение и перемещение категорий: чужие категории не затрагиваются; сценарии /categories"""
+from typing import Dict, Optional, Tuple
+
+import pytest
+from sqlalchemy import select
+
+from db import AccountModel, CategoryModel, EntryModel, UserModel
+from db.base import async_session
+from db.categories import add_to_tree, move_category
+from db.deletes import merge_categories
+from db.uow import get_session, unit_of_work
+from loadtest.scripts import BUTTON, MESSAGE, expense, setup
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def categories(schema, user_id):
+    """Категории пользователя и категория другого пользователя"""
+    other_id = user_id + 10 ** 6
+    async with unit_of_work():
+        session = get_session()
+        session.add_all([UserModel(id=user_id), UserModel(id=other_id)])
+        own = [CategoryModel(title=title, user_id=user_id) for title in ('Еда', 'Транспорт')]
+        foreign = CategoryModel(title='Чужая', user_id=other_id)
+        session.add_all([*own, foreign])
+        await session.flush()
+        await add_to_tree(session, [category.id for category in (*own, foreign)])
+    return user_id, [category.id for category in own], foreign.id
+
+
+async def _category_ids(user_id: int) -> list:
+    async with unit_of_work():
+        return (await get_session().execute(
+            select(CategoryModel.id).where(CategoryModel.user_id == user_id).order_by(CategoryModel.id)
+        )).scalars().all()
+
+
+async def test_merge_into_foreign_category(categories):
+    user_id, (source_id, _), foreign_id = categories
+
+    with pytest.raises(ValueError):
+        async with unit_of_work():
+            await merge_categories(get_session(), user_id, [source_id], foreign_id)
+
+    assert source_id in await _category_ids(user_id)
+
+
+async def test_merge_categories(categories):
+    user_id, (source_id, target_id), _ = categories
+    async with unit_of_work():
+        session = get_session()
+        account = AccountModel(title='Наличка', user_id=user_id, currency='RUB')
+        session.add(account)
+        await session.flush()
+        session.add(EntryModel(user_id=user_id, amount=-100, category_id=source_id, account_id=account.id))
+
+    async with unit_of_work():
+        assert await merge_categories(get_session(), user_id, [source_id], target_id) == 1
+
+    assert await _category_ids(user_id) == [target_id]
+
+
+async def _parent_id(category_id: int) -> int:
+    async with unit_of_work():
+        return (await get_session().execute(
+            select(CategoryModel.parent_id).where(CategoryModel.id == category_id)
+        )).scalar_one()
+
+
+async def test_move_under_foreign_category(categories):
+    user_id, (category_id, _), foreign_id = categories
+
+    with pytest.raises(ValueError):
+        async with unit_of_work():
+            await move_category(get_session(), user_id, category_id, foreign_id)
+
+    assert await _parent_id(category_id) is None
+
+
+async def test_move_category(categories):
+    user_id, (category_id, parent_id), _ = categories
+
+    async with unit_of_work():
+        await move_category(get_session(), user_id, category_id, parent_id)
+
+    assert await _parent_id(category_id) == parent_id
+
+
+async def _tree(user_id: int) -> Dict[str, Tuple[Optional[str], bool]]:
+    """Название категории - (название родителя, скрыта ли)"""
+    async with async_session() as session:
+        categories = (await session.execute(select(CategoryModel).filter_by(user_id=user_id))).scalars().all()
+    titles = {category.id: category.title for category in categories}
+    return {category.title: (titles.get(category.parent_id), category.disabled) for category in categories}
+
+
+async def test_subcategory_and_move(play, user_id):
+    await play(setup() + [(MESSAGE, '/categories'), (BUTTON, 'Еда'), (BUTTON, 'Подкатегория'), (MESSAGE, 'Кафе')])
+    assert (await _tree(user_id))['Кафе'] == ('Еда', False)
+
+    # открыт уровень Еды: вверх и снова вниз, к действиям над подкатегорией
+    await play([(BUTTON, 'Вверх'), (BUTTON, 'Еда'), (BUTTON, 'Кафе'), (BUTTON, 'Переместить'), (BUTTON, 'Транспорт')])
+    assert (await _tree(user_id))['Кафе'] == ('Транспорт', False)
+
+    await play([(BUTTON, 'Кафе'), (BUTTON, 'Переместить'), (BUTTON, 'На верхний уровень')])
+    assert (await _tree(user_id))['Кафе'] == (None, False)
+
+
+async def test_rename_hide_and_show(play, user_id):
+    await play(setup() + [(MESSAGE, '/categories'), (BUTTON, 'Еда'), (BUTTON, 'Изменить'), (MESSAGE, 'продукты')])
+    await play([(BUTTON, 'Продукты'), (BUTTON, 'Скрыть')])
+    assert await _tree(user_id) == {'Продукты': (None, True), 'Транспорт': (None, False)}
+
+    await play([(MESSAGE, '/categories'), (BUTTON, '(скрыта) Продукты'), (BUTTON, 'Показать')])
+    assert (await _tree(user_id))['Продукты'] == (None, False)
+
+
+async def test_category_title_checks(play, user_id):
+    await play(setup())
+
+    for title in ('/start', 'еда', 'Закрыть', 'транспорт'):
+        await play([(MESSAGE, '/categories'), (BUTTON, 'Еда'), (BUTTON, 'Изменить'), (MESSAGE, title)])
+    await play([(MESSAGE, '/categories'), (BUTTON, 'Еда'), (BUTTON, 'Назад'), (BUTTON, 'Закрыть')])
+    await play([(MESSAGE, '/categories'), (BUTTON, 'Еда'), (BUTTON, 'Закрыть')])
+
+    assert await _tree(user_id) == {'Еда': (None, False), 'Транспорт': (None, False)}
+
+
+async def test_merge_and_delete(play, user_id):
+    # запись в Еде
+    await play(setup() + expense(1) + [
+        (MESSAGE, '/categories'), (BUTTON, 'Еда'), (BUTTON, 'Объединить'), (BUTTON, 'Транспорт'),
+    ])
+    assert await _tree(user_id) == {'Транспорт': (None, False)}
+    async with async_session() as session:
+        titles = (await session.execute(
+            select(CategoryModel.title).join(EntryModel.category).where(EntryModel.user_id == user_id)
+        )).scalars().all()
+    assert titles == ['Транспорт']
+
+    await play([(BUTTON, 'Транспорт'), (BUTTON, 'Удалить'), (BUTTON, 'Удалить вместе с записями')])
+    assert await _tree(user_id) == {}
+
+
+async def test_duplicate_category(play, user_id):
+    await play(setup() + [(MESSAGE, '/categories'), (BUTTON, 'Добавить'), (MESSAGE, 'еда, Дом')])
+
+    # с существующей категорией не создаётся ни одна
+    assert set(await _tree(user_id)) == {'Еда', 'Транспорт'}
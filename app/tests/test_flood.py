@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+from telegram.ext import ApplicationHandlerStop
+
+from common.flood import FloodGuard
+from loadtest.flood import flood
+
+pytestmark = pytest.mark.anyio
+
+
+class Query:
+
+    def __init__(self, data: str):
+        self.data = data
+        self.message = SimpleNamespace(message_id=1)
+        self.answers = 0
+
+    async def answer(self) -> None:
+        self.answers += 1
+
+
+def press(query: Query) -> SimpleNamespace:
+    return SimpleNamespace(effective_user=SimpleNamespace(id=1), callback_query=query)
+
+
+async def test_dropped_press_is_answered_once_per_window(clock):
+    guard = FloodGuard(rate=1, burst=10, duplicate_window=1)
+    query = Query('Наличка')
+
+    await guard.guard(press(query), None)
+    assert query.answers == 0
+
+    for _ in range(3):
+        with pytest.raises(ApplicationHandlerStop):
+            await guard.guard(press(query), None)
+    assert query.answers == 1
+
+    clock.now += 0.5
+    with pytest.raises(ApplicationHandlerStop):
+        await guard.guard(press(query), None)
+    assert query.answers == 1
+
+    clock.now += 0.6
+    other = Query('Карта')
+    await guard.guard(press(other), None)
+    with pytest.raises(ApplicationHandlerStop):
+        await guard.guard(press(other), None)
+    assert other.answers == 1
+
+
+async def test_dropped_message_is_not_answered(clock):
+    guard = FloodGuard(rate=1, burst=1, duplicate_window=1)
+    message = SimpleNamespace(effective_user=SimpleNamespace(id=1), callback_query=None)
+
+    await guard.guard(message, None)
+    with pytest.raises(ApplicationHandlerStop):
+        await guard.guard(message, None)
+
+
+async def test_flood_costs_only_the_bucket(schema, clock):
+    # часы стоят, токены не пополняются: подготовка (10 шагов и /add) оставляет 3 токена из 14
+    report = await flood(users=1, messages=20, presses=20, budget=3, rate=100, burst=14, duplicate_window=1)
+
+    # из 20 /add проходят 3, первое нажатие «Расход» упирается в пустую корзину, остальные - дубли
+    assert report['dropped'] == {'rate': 17 + 1, 'duplicate': 19}
+    # по запросу на каждый пропущенный /add, отброшенные обновления до базы не доходят
+    assert report['statements'] == 3
+    assert report['passed']
@@ -0,0 +1,214 @@
+"""Основные сценарии бота от сообщения пользователя до строк в базе"""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select, text
+from telegram.ext import ConversationHandler
+
+from config import settings
+from db import AccountModel, CategoryModel, EntryModel
+from db.base import async_session
+from handlers.accounts import Accounts
+from handlers.add import Add
+from handlers.categories import Categories
+from handlers.imports import Import
+from loadtest.scripts import BUTTON, MESSAGE, setup
+
+pytestmark = pytest.mark.anyio
+
+
+def expense(note: str):
+    return [(MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Наличка'), (BUTTON, 'Еда'), (MESSAGE, note)]
+
+
+async def test_add_entry(play, user_id):
+    reply = await play(setup() + expense('350 кофе #Работа'))
+
+    assert 'Запись добавлена' in reply
+    assert '650.00 руб' in reply
+    async with async_session() as session:
+        entry = (await session.execute(select(EntryModel).filter_by(user_id=user_id))).scalar_one()
+        account = (await session.execute(select(AccountModel).filter_by(id=entry.account_id))).scalar_one()
+    assert (entry.amount, entry.title, entry.tags) == (-35000, 'кофе', ['работа'])
+    assert account.amount == 65000
+
+
+async def test_invalid_amount(play, user_id):
+    reply = await play(setup() + expense('кофе'))
+
+    assert 'Выберите' in reply
+    async with async_session() as session:
+        entries = (await session.execute(select(EntryModel).filter_by(user_id=user_id))).all()
+    assert entries == []
+
+
+async def test_entry_without_tags_is_null(play, user_id):
+    await play(setup() + expense('10'))
+
+    async with async_session() as session:
+        # SQL NULL, а не JSON-строка 'null': фильтры по меткам в SQLite и PostgreSQL ведут себя одинаково
+        nulls = (await session.execute(
+            text('SELECT count(*) FROM entry WHERE user_id = :user_id AND tags IS NULL'), {'user_id': user_id},
+        )).scalar_one()
+    assert nulls == 1
+
+
+async def test_entries_tag_filters(play):
+    await play(
+        setup()
+        + expense('350 кофе #работа #командировка')
+        + expense('1200\nужин #работа')
+        + expense('90 #отпуск')
+        + expense('10')
+    )
+
+    assert 'Записи: 4' in await play([(MESSAGE, '/entries')])
+    assert ': 2' in await play([(MESSAGE, '/entries #работа')])
+    assert ': 1' in await play([(MESSAGE, '/entries #работа #командировка')])
+    assert ': 3' in await play([(MESSAGE, '/entries #работа | #отпуск')])
+    assert 'Нет записей' in await play([(MESSAGE, '/entries #нет')])
+
+
+async def test_transfer(play, user_id):
+    reply = await play(setup() + [
+        (MESSAGE, '/add'), (BUTTON, 'Перевод'), (BUTTON, 'Карта'), (BUTTON, 'Наличка'), (MESSAGE, '100'),
+    ])
+
+    assert 'Наличка</b> 1100.00 руб' in reply
+    async with async_session() as session:
+        balances = dict((await session.execute(
+            select(AccountModel.title, AccountModel.amount).filter_by(user_id=user_id)
+        )).all())
+    assert balances == {'Наличка': 110000, 'Карта': 490000}
+
+
+async def test_rename_account(play, user_id):
+    await play(setup() + [(MESSAGE, '/accounts'), (BUTTON, 'Наличка'), (BUTTON, 'Изменить'), (MESSAGE, 'кошелёк')])
+
+    async with async_session() as session:
+        titles = (await session.execute(select(AccountModel.title).filter_by(user_id=user_id))).scalars().all()
+    assert sorted(titles) == ['Карта', 'Кошелёк']
+
+
+async def test_hide_category(play, user_id):
+    await play(setup() + [(MESSAGE, '/categories'), (BUTTON, 'Еда'), (BUTTON, 'Скрыть')])
+
+    async with async_session() as session:
+        hidden = (await session.execute(
+            select(CategoryModel.title).filter_by(user_id=user_id, disabled=True)
+        )).scalars().all()
+    assert hidden == ['Еда']
+
+
+async def test_add_from_scratch(play, user_id):
+    """У нового пользователя /add сам предлагает создать счёт и категорию"""
+    await play([
+        (MESSAGE, '/add'), (BUTTON, 'Доход'), (MESSAGE, 'Наличка'), (MESSAGE, '100 руб'),
+        (MESSAGE, 'Зарплата'), (BUTTON, 'Наличка'), (BUTTON, 'Зарплата'),
+    ])
+    reply = await play([(MESSAGE, '1000')])
+
+    assert 'Запись добавлена' in reply and '1100.00 руб' in reply
+
+
+async def test_add_close(play, user_id):
+    await play(setup())
+
+    for steps in ([(BUTTON, 'Закрыть')], [(BUTTON, 'Расход'), (BUTTON, 'Закрыть')],
+                  [(BUTTON, 'Расход'), (BUTTON, 'Наличка'), (BUTTON, 'Закрыть')]):
+        await play([(MESSAGE, '/add')] + steps)
+
+    # после закрытия диалог начинается заново
+    assert 'Запись добавлена' in await play(expense('10'))
+
+
+async def test_cancel(play, user_id):
+    await play(setup())
+
+    for steps in ([(MESSAGE, '/add'), (BUTTON, 'Расход')], [(MESSAGE, '/import'), (BUTTON, 'Карта')]):
+        assert (await play(steps + [(MESSAGE, '/cancel')])).startswith('Отмена операции')
+
+    assert 'Запись добавлена' in await play(expense('10'))
+
+
+async def test_add_account_inside_add(play, user_id):
+    await play(setup() + [
+        (MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Добавить'), (MESSAGE, 'Вклад'), (MESSAGE, '10 usd'),
+        (BUTTON, 'Еда'),
+    ])
+    reply = await play([(MESSAGE, '1.5')])
+
+    assert '8.50 usd' in reply
+
+
+async def test_add_category_inside_add(play, user_id):
+    await play(setup() + [
+        (MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Наличка'), (BUTTON, 'Добавить'), (MESSAGE, 'Кафе'),
+        (BUTTON, 'Наличка'), (BUTTON, 'Кафе'),
+    ])
+    reply = await play([(MESSAGE, '200')])
+
+    assert '800.00 руб' in reply
+    async with async_session() as session:
+        entry = (await session.execute(select(EntryModel).filter_by(user_id=user_id))).scalar_one()
+        category = (await session.execute(select(CategoryModel).filter_by(id=entry.category_id))).scalar_one()
+    assert category.title == 'Кафе'
+
+
+async def test_category_pages(play, user_id):
+    titles = [f'Категория {n:02}' for n in range(1, 26)]
+    await play(setup() + [
+        (MESSAGE, '/categories'), (BUTTON, 'Добавить'), (MESSAGE, ', '.join(titles)), (BUTTON, 'Закрыть'),
+    ])
+
+    # последняя категория на второй странице, на первую возвращаются и листают снова
+    await play([
+        (MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Наличка'), (BUTTON, '→'), (BUTTON, '←'), (BUTTON, '→'),
+    ])
+    reply = await play([(BUTTON, 'Категория 25'), (MESSAGE, '10')])
+
+    assert 'Запись добавлена' in reply
+    async with async_session() as session:
+        entry = (await session.execute(select(EntryModel).filter_by(user_id=user_id))).scalar_one()
+        category = (await session.execute(select(CategoryModel).filter_by(id=entry.category_id))).scalar_one()
+    assert category.title == 'Категория 25'
+
+
+async def test_delete_account(play, user_id):
+    await play(setup() + expense('100') + [
+        (MESSAGE, '/accounts'), (BUTTON, 'Наличка'), (BUTTON, 'Удалить'), (BUTTON, 'Удалить вместе с записями'),
+    ])
+
+    async with async_session() as session:
+        titles = (await session.execute(select(AccountModel.title).filter_by(user_id=user_id))).scalars().all()
+        entries = (await session.execute(select(EntryModel).filter_by(user_id=user_id))).all()
+    assert (titles, entries) == (['Карта'], [])
+
+
+async def test_account_title_checks(play, user_id):
+    await play(setup())
+
+    for title in ('/start', 'Закрыть', 'карта'):
+        await play([(MESSAGE, '/accounts'), (BUTTON, 'Добавить'), (MESSAGE, title)])
+    for title in ('/start', 'наличка', 'Закрыть', 'Карта'):
+        await play([(MESSAGE, '/accounts'), (BUTTON, 'Наличка'), (BUTTON, 'Изменить'), (MESSAGE, title)])
+    await play([(MESSAGE, '/accounts'), (BUTTON, 'Наличка'), (BUTTON, 'Назад'), (BUTTON, 'Закрыть')])
+    # удаление можно отменить
+    await play([(MESSAGE, '/accounts'), (BUTTON, 'Наличка'), (BUTTON, 'Удалить'), (BUTTON, 'Назад')])
+    await play([(MESSAGE, '/accounts'), (BUTTON, 'Наличка'), (BUTTON, 'Удалить'), (BUTTON, 'Закрыть')])
+
+    async with async_session() as session:
+        titles = (await session.execute(select(AccountModel.title).filter_by(user_id=user_id))).scalars().all()
+    assert sorted(titles) == ['Карта', 'Наличка']
+
+
+@pytest.mark.parametrize('handler_class', [Accounts, Add, Categories, Import])
+async def test_abandoned_conversation_expires(handler_class):
+    handler = handler_class.handler()
+    timeout_handler, = handler.states[ConversationHandler.TIMEOUT]
+    context = SimpleNamespace(user_data={'user_id': 1, 'accounts': {}, 'account_id': 2, 'msg': (1, 3)})
+
+    await timeout_handler.callback(object(), context)
+
+    assert handler.conversation_timeout == settings.CONVERSATION_TIMEOUT
+    assert context.user_data == {'user_id': 1}
@@ -0,0 +1,100 @@
+"""Импорт выписок: разбор CSV, дубликаты при повторной загрузке и баланс счёта"""
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from common.money import Money
+from db import AccountModel, EntryModel, UserModel
+from db.importer import IMPORT_DEFAULT_CATEGORY, import_entries, parse_amount, parse_date, parse_row
+from db.uow import DuplicateUpdate, commit_before_reply, get_session, unit_of_work
+
+pytestmark = pytest.mark.anyio
+
+STATEMENT = '''Дата;Сумма;Категория;Описание
+2023-03-01;-350,50;Еда;кофе
+01.03.2023 12:30;1 000;;зарплата
+2023-03-02;-90;Транспорт;
+2023-03-02;-90;Транспорт;
+вчера;-10;Еда;
+2023-03-03;много;Еда;
+'''.encode('cp1251')
+
+
+def test_parse_amount():
+    assert parse_amount('-350,50', 2) == -35050
+    assert parse_amount('1\xa0000', 2) == 100000
+    assert parse_amount('−5', 0) == -5
+    assert parse_amount('много', 2) is None
+
+
+def test_parse_date():
+    assert parse_date('01.03.2023 12:30') == datetime(2023, 3, 1, 12, 30, tzinfo=timezone.utc)
+    assert parse_date('2023-03-01') == datetime(2023, 3, 1, tzinfo=timezone.utc)
+    assert parse_date('вчера') is None
+
+
+def test_parse_row():
+    assert parse_row(['2023-03-01', '-1'], 2) == (
+        datetime(2023, 3, 1, tzinfo=timezone.utc), -100, IMPORT_DEFAULT_CATEGORY, None,
+    )
+    assert parse_row(['2023-03-01'], 2) is None
+
+
+@pytest.fixture
+async def account_id(schema, user_id):
+    async with unit_of_work():
+        session = get_session()
+        session.add(UserModel(id=user_id))
+        account = AccountModel(title='Карта', user_id=user_id, amount=100000, currency='RUB')
+        session.add(account)
+        await session.flush()
+    return account.id
+
+
+async def _import(user_id: int, account_id: int, content: bytes = STATEMENT):
+    async with unit_of_work():
+        return await import_entries(get_session(), user_id, account_id, content)
+
+
+async def _entries(user_id: int) -> int:
+    async with unit_of_work():
+        return (await get_session().execute(
+            select(func.count()).select_from(EntryModel).where(EntryModel.user_id == user_id)
+        )).scalar_one()
+
+
+async def test_import(user_id, account_id):
+    stats = await _import(user_id, account_id)
+
+    # заголовок не считается ошибкой, повтор строки внутри файла - дубликат
+    assert (stats.parsed, stats.invalid, stats.inserted, stats.duplicates) == (4, 2, 3, 1)
+    assert stats.balance == Money(100000 - 35050 + 100000 - 9000, 2)
+    assert await _entries(user_id) == 3
+
+
+async def test_reimport_skips_duplicates(user_id, account_id):
+    await _import(user_id, account_id)
+    stats = await _import(user_id, account_id)
+
+    assert (stats.inserted, stats.duplicates) == (0, 4)
+    assert stats.balance == Money(155950, 2)
+    assert await _entries(user_id) == 3
+
+
+async def test_redelivered_import_is_rolled_back(user_id, account_id):
+    async with unit_of_work((user_id, 1)):
+        await import_entries(get_session(), user_id, account_id, STATEMENT)
+
+    # та же выписка, но другой файл: проверка дубликатов строк его бы не отбросила
+    with pytest.raises(DuplicateUpdate):
+        async with unit_of_work((user_id, 1)):
+            await import_entries(get_session(), user_id, account_id, '2023-04-01;-1;Еда;чай\n'.encode())
+            await commit_before_reply()
+
+    assert await _entries(user_id) == 3
+
+
+async def test_foreign_account(user_id, account_id):
+    assert await _import(user_id + 1, account_id) is None
+    assert await _import(user_id, account_id + 1000) is None
@@ -0,0 +1,55 @@
+"""Сценарии /import: выбор счёта, загрузка выписки через поддельный Bot API и ответы на неподходящие файлы"""
+import pytest
+from sqlalchemy import func, select
+
+from db import EntryModel
+from db.base import async_session
+from loadtest.scripts import BUTTON, DOCUMENT, MESSAGE, setup
+
+pytestmark = pytest.mark.anyio
+
+STATEMENT = '2023-03-01;-350,50;Еда;кофе\n2023-03-02;-90;;\n2023-03-02;-90;;\nвчера;-10;Еда;\n'.encode()
+
+
+async def _entries(user_id: int) -> int:
+    async with async_session() as session:
+        return (await session.execute(
+            select(func.count()).select_from(EntryModel).where(EntryModel.user_id == user_id)
+        )).scalar_one()
+
+
+async def test_import(play, user_id):
+    reply = await play(setup() + [
+        (MESSAGE, '/import'), (BUTTON, 'Наличка'), (DOCUMENT, ('statement.csv', STATEMENT)),
+    ])
+
+    assert 'добавлено записей: <b>2</b>' in reply
+    assert 'пропущено дубликатов: 1' in reply
+    assert 'пропущено строк с ошибками: 1' in reply
+    assert '559.50 руб' in reply
+    assert await _entries(user_id) == 2
+
+    reply = await play([(MESSAGE, '/import'), (BUTTON, 'Наличка'), (DOCUMENT, ('statement.csv', STATEMENT))])
+    assert 'добавлено записей: <b>0</b>' in reply
+    assert await _entries(user_id) == 2
+
+
+async def test_wrong_files(play, user_id):
+    reply = await play(setup() + [(MESSAGE, '/import'), (BUTTON, 'Карта'), (DOCUMENT, ('statement.xlsx', b''))])
+    assert reply == 'Нужен файл в формате CSV'
+
+    # диалог ждёт другой файл
+    reply = await play([(DOCUMENT, ('statement.csv', 'Дата;Сумма\n'.encode()))])
+    assert reply == 'В файле не найдено ни одной записи'
+    assert await _entries(user_id) == 0
+
+
+async def test_no_accounts(play):
+    assert '/accounts' in await play([(MESSAGE, '/import')])
+
+
+async def test_close(play, user_id):
+    await play(setup() + [(MESSAGE, '/import'), (BUTTON, 'Закрыть')])
+    # после закрытия документ не относится ни к какому диалогу
+    await play([(DOCUMENT, ('statement.csv', STATEMENT))])
+    assert await _entries(user_id) == 0
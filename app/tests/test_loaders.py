@@ -0,0 +1,42 @@
+"""Объединение запросов счетов и категорий одновременных обновлений"""
+import asyncio
+
+import pytest
+
+from db import AccountModel, UserModel
+from db.loaders import accounts_loader, get_accounts
+from db.uow import get_session, unit_of_work
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user_ids(schema, user_id):
+    user_ids = [user_id, user_id + 10 ** 6]
+    async with unit_of_work():
+        session = get_session()
+        for n, user_id in enumerate(user_ids):
+            session.add(UserModel(id=user_id))
+            session.add(AccountModel(title=f'Счёт {n}', user_id=user_id, amount=n, currency='RUB'))
+    return user_ids
+
+
+async def _titles(user_id: int) -> list:
+    async with unit_of_work():
+        # даём остальным обновлениям начаться
+        await asyncio.sleep(0)
+        return [account.title for account in await get_accounts(user_id)]
+
+
+async def test_single_update_is_not_batched(user_ids):
+    batches = accounts_loader.batches
+
+    assert await _titles(user_ids[0]) == ['Счёт 0']
+    assert accounts_loader.batches == batches
+
+
+async def test_concurrent_updates_are_batched(user_ids):
+    batches = accounts_loader.batches
+
+    assert await asyncio.gather(*(_titles(user_id) for user_id in user_ids)) == [['Счёт 0'], ['Счёт 1']]
+    assert accounts_loader.batches == batches + 1
@@ -0,0 +1,53 @@
+"""Логи: контекст обновления в записях, выборка шумных логгеров и оформление"""
+import json
+import logging
+import sys
+
+from common.logs import JsonFormatter, SamplingFilter, TextFormatter, _QueueHandler, log_context, update_context
+
+
+def _record(name: str = 'handlers', level: int = logging.INFO, msg: str = 'saved %s', args=(1,)) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def _prepared(record: logging.LogRecord, **context) -> logging.LogRecord:
+    """Запись в том виде, в каком её получает поток слушателя"""
+    token = log_context.set(dict(context) if context else None)
+    try:
+        update_context(state=1)
+        return _QueueHandler(None).prepare(record)
+    finally:
+        log_context.reset(token)
+
+
+def test_sampling():
+    sampling = SamplingFilter({'sqlalchemy': 1.0, 'sqlalchemy.engine': 0.0})
+
+    assert sampling.filter(_record('sqlalchemy.pool'))
+    assert not sampling.filter(_record('sqlalchemy.engine.Engine'))
+    assert sampling.filter(_record('sqlalchemy.engine.Engine', logging.WARNING))
+    assert sampling.filter(_record('sqlalchemyx'))
+
+
+def test_json():
+    record = _prepared(_record(), update_id=7)
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert (entry['message'], entry['level'], entry['update_id'], entry['state']) == ('saved 1', 'INFO', 7, 1)
+    assert record.args is None
+
+
+def test_json_exception():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logging.LogRecord('handlers', logging.ERROR, __file__, 1, 'failed', None, sys.exc_info())
+
+    assert 'ValueError: boom' in json.loads(JsonFormatter().format(record))['exception']
+
+
+def test_text():
+    formatter = TextFormatter('%(message)s')
+
+    assert formatter.format(_prepared(_record())) == 'saved 1'
+    assert formatter.format(_prepared(_record(msg='a\nb %s'), user_id=5)) == 'a [user_id=5 state=1]\nb 1'
@@ -0,0 +1,9 @@
+from db.metrics import _operation
+
+
+def test_operation():
+    assert _operation('SELECT 1') == 'SELECT'
+    assert _operation('\n  with t AS (SELECT 1) SELECT * FROM t') == 'WITH'
+    assert _operation('PRAGMA foreign_keys=ON') == 'PRAGMA'
+    assert _operation('') == 'OTHER'
+    assert _operation(' \n\t') == 'OTHER'
@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+import pytest
+
+from common.money import Money, currency_exponent
+
+
+@pytest.mark.parametrize('text, exponent, minor', [
+    ('350', 2, 35000),
+    ('350,50', 2, 35050),
+    ('350.5', 2, 35050),
+    ('1.5k', 2, 150000),
+    ('10к', 2, 1000000),
+    ('-200', 2, 20000),
+    ('0.005', 2, 1),
+    ('1000', 0, 1000),
+    ('1.2345', 3, 1235),
+])
+def test_parse(text, exponent, minor):
+    assert Money.parse(text, exponent) == Money(minor, exponent)
+
+
+@pytest.mark.parametrize('text', ['', 'кофе', '1.2.3'])
+def test_parse_invalid(text):
+    assert Money.parse(text) is None
+
+
+def test_from_decimal_rounds_half_up():
+    assert Money.from_decimal(Decimal('0.125')) == Money(13)
+    assert Money.from_decimal(Decimal('12.5'), exponent=0) == Money(13, 0)
+
+
+def test_arithmetic():
+    assert Money(150) + Money(50) == Money(200)
+    assert Money(150) - Money(200) == Money(-50)
+    assert -Money(150) == Money(-150)
+    assert not Money(0)
+
+
+def test_arithmetic_with_different_exponents():
+    with pytest.raises(ValueError):
+        Money(100, 2) + Money(100, 0)
+    with pytest.raises(ValueError):
+        Money(100, 2) - Money(100, 3)
+
+
+@pytest.mark.parametrize('money, text', [
+    (Money(35050), '350.50'),
+    (Money(-5), '-0.05'),
+    (Money(1000, 0), '1000'),
+    (Money(1, 8), '0.00000001'),
+])
+def test_str(money, text):
+    assert str(money) == text
+
+
+@pytest.mark.parametrize('currency, exponent', [('руб', 2), ('usd', 2), ('JPY', 0), ('¥', 0), (' kwd ', 3), ('BTC', 8)])
+def test_currency_exponent(currency, exponent):
+    assert currency_exponent(currency) == exponent
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+from common import outbox
+from common.outbox import Outbox, TokenBucket
+from config import settings
+from loadtest.fake_api import FakeBotApi
+
+
+def test_burst_then_empty(clock):
+    bucket = TokenBucket(rate=1, capacity=3)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_refill(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.try_acquire()
+
+    clock.now += 0.25
+    assert not bucket.try_acquire()
+    clock.now += 0.25
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_refill_is_capped(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    bucket.try_acquire()
+
+    clock.now += 60
+    assert bucket.tokens <= 2 and bucket.idle
+    assert [bucket.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+@pytest.mark.anyio
+async def test_acquire_waits_for_token(clock, monkeypatch):
+    slept = []
+
+    async def sleep(delay: float) -> None:
+        slept.append(delay)
+        clock.now += delay
+
+    monkeypatch.setattr(outbox, 'asyncio', SimpleNamespace(Lock=asyncio.Lock, sleep=sleep))
+    bucket = TokenBucket(rate=4, capacity=1)
+
+    await bucket.acquire()
+    await bucket.acquire()
+
+    assert slept == [pytest.approx(0.25)]
+
+
+@pytest.fixture
+async def sent_outbox():
+    """Outbox без общего лимита и список отправленных им запросов"""
+    box = Outbox(overall_rate=1e6, overall_burst=1e6, chat_rate=20, chat_burst=1)
+    await box.initialize()
+    sent = []
+
+    async def send(text: str) -> str:
+        sent.append(text)
+        return text
+
+    yield box, sent, send
+    await box.shutdown()
+
+
+@pytest.mark.anyio
+async def test_edits_are_coalesced(sent_outbox):
+    box, sent, send = sent_outbox
+
+    async def edit(text: str) -> str:
+        data = {'chat_id': 1, 'message_id': 10, 'text': text}
+        return await box.process_request(send, (text,), {}, 'editMessageText', data, None)
+
+    first = asyncio.ensure_future(edit('1'))
+    await asyncio.sleep(0)
+    # первая правка ушла, остальные ждут токен чата, отправится только последняя
+    results = await asyncio.gather(first, edit('2'), edit('3'), edit('4'))
+
+    assert sent == ['1', '4']
+    assert results == ['1', '4', '4', '4']
+    assert box.coalesced == 2
+
+
+@pytest.mark.anyio
+async def test_edits_of_different_messages_are_not_coalesced(sent_outbox):
+    box, sent, send = sent_outbox
+
+    await asyncio.gather(*(
+        box.process_request(send, (str(n),), {}, 'editMessageText', {'chat_id': 1, 'message_id': n}, None)
+        for n in range(3)
+    ))
+
+    assert sorted(sent) == ['0', '1', '2']
+    assert box.coalesced == 0
+
+
+@pytest.mark.anyio
+async def test_retry_after(sent_outbox):
+    box, sent, send = sent_outbox
+    calls = []
+
+    async def limited(text: str) -> str:
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RetryAfter(0.2)
+        return await send(text)
+
+    started_at = time.monotonic()
+    result = await box.process_request(limited, ('1',), {}, 'sendMessage', {'chat_id': 1}, None)
+
+    assert result == '1' and box.retries == 1
+    assert calls[1] - calls[0] >= 0.2
+    # после 429 ждут и запросы в другие чаты
+    await box.process_request(send, ('2',), {}, 'sendMessage', {'chat_id': 2}, None)
+    assert time.monotonic() - started_at >= 0.2
+
+
+@pytest.mark.anyio
+async def test_retry_after_gives_up(sent_outbox):
+    box, _, _ = sent_outbox
+    box.max_retries = 1
+
+    async def limited() -> None:
+        raise RetryAfter(0.01)
+
+    with pytest.raises(RetryAfter):
+        await box.process_request(limited, (), {}, 'sendMessage', {'chat_id': 1}, None)
+    assert box.retries == 1
+
+
+async def _send_messages(box: Outbox, count: int, chats: int = 1) -> FakeBotApi:
+    api = FakeBotApi(limits=True)
+    await api.start()
+    bot = ExtBot(settings.BOT_TOKEN, base_url=api.base_url, request=HTTPXRequest(http_version='1.1'),
+                 rate_limiter=box)
+    try:
+        async with bot:
+            await asyncio.gather(*(bot.send_message(n % chats + 1, str(n)) for n in range(count)))
+    finally:
+        await api.stop()
+    return api
+
+
+@pytest.mark.anyio
+async def test_chat_limit_holds():
+    # 3 сообщения сразу, остальные раз в секунду
+    box = Outbox()
+
+    started_at = time.monotonic()
+    api = await _send_messages(box, 6)
+
+    assert api.rate_limited == 0 and box.retries == 0
+    assert time.monotonic() - started_at >= 2.9
+
+
+@pytest.mark.anyio
+async def test_chat_limit_exceeded_is_retried():
+    box = Outbox(overall_rate=1e6, overall_burst=1e6, chat_rate=1e6, chat_burst=1e6)
+
+    api = await _send_messages(box, 8)
+
+    # Bot API отказал сверх лимита чата, после retry_after все сообщения дошли
+    assert api.rate_limited == box.retries > 0
+    assert api.chats[1].last_text in {str(n) for n in range(8)}
+    # и getMe при запуске бота
+    assert api.requests - api.rate_limited == 8 + 1
+
+
+@pytest.mark.anyio
+async def test_overall_limit_holds():
+    box = Outbox()
+
+    started_at = time.monotonic()
+    # по сообщению в 45 разных чатов: лимиты чатов не мешают, ждать приходится общего
+    api = await _send_messages(box, 45, chats=45)
+
+    assert api.rate_limited == 0 and box.retries == 0
+    assert time.monotonic() - started_at >= 44 / outbox.OVERALL_RATE
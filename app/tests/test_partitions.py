@@ -0,0 +1,67 @@
+"""Помесячные секции entry и transfer: границы месяцев и перенос строк из секции по умолчанию"""
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from db.base import SQLITE, engine
+from db.partitions import (
+    _create_partition,
+    add_months,
+    create_partition_sql,
+    ensure_partitions,
+    iter_months,
+    partition_name,
+)
+from loadtest.scripts import expense, setup
+
+pytestmark = pytest.mark.anyio
+
+postgresql_only = pytest.mark.skipif(SQLITE, reason='секции есть только в PostgreSQL, см. TEST_DATABASE')
+
+
+def test_months():
+    assert list(iter_months(date(2023, 11, 20), date(2024, 2, 1))) == [
+        date(2023, 11, 1), date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1),
+    ]
+    assert add_months(date(2023, 12, 1), 3) == date(2024, 3, 1)
+    assert partition_name('entry', date(2024, 2, 1)) == 'entry_y2024m02'
+    assert create_partition_sql('transfer', date(2023, 12, 1)) == (
+        'CREATE TABLE IF NOT EXISTS transfer_y2023m12 PARTITION OF transfer '
+        "FOR VALUES FROM ('2023-12-01') TO ('2024-01-01')"
+    )
+
+
+async def test_sqlite_is_not_partitioned(schema):
+    if not SQLITE:
+        pytest.skip('проверяется на SQLite')
+    assert await ensure_partitions() == []
+
+
+@postgresql_only
+async def test_ensure_partitions(schema):
+    await ensure_partitions()
+    this_month = date.today().replace(day=1)
+    async with engine.connect() as connection:
+        partitions = set((await connection.execute(text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'entry'::regclass"
+        ))).scalars())
+    months = iter_months(this_month, add_months(this_month, 3))
+    assert {partition_name('entry', month) for month in months} <= partitions
+    assert 'entry_default' in partitions
+
+
+@postgresql_only
+async def test_rows_move_out_of_default_partition(play, user_id):
+    await play(setup() + expense(1))
+    month = date(2100, 1, 1)
+    async with engine.begin() as connection:
+        # записи месяца без своей секции лежат в секции по умолчанию, пока секцию не создадут
+        await connection.execute(
+            text("UPDATE entry SET date_created = '2100-01-15' WHERE user_id = :user_id"), {'user_id': user_id},
+        )
+        await _create_partition(connection, 'entry', month)
+        partition = (await connection.execute(
+            text('SELECT tableoid::regclass::text FROM entry WHERE user_id = :user_id'), {'user_id': user_id},
+        )).scalar_one()
+    assert partition == partition_name('entry', month)
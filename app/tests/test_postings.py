@@ -0,0 +1,55 @@
+"""Балансы по проводкам: запись добавляет проводку, свёртка и перенос балансов их не меняют"""
+import pytest
+from sqlalchemy import func, select
+
+from config import settings
+from db import AccountModel, PostingModel
+from db.base import async_session
+from db.postings import accounts_with_balances, compact, compact_job, select_accounts, settle
+from loadtest.scripts import BUTTON, MESSAGE, setup, transfer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def postings(monkeypatch):
+    monkeypatch.setattr(settings.POSTINGS, 'ENABLED', True)
+
+
+async def _balances(user_id: int) -> dict:
+    async with async_session() as session:
+        accounts = accounts_with_balances(await session.execute(select_accounts().filter_by(user_id=user_id)))
+        return {account.title: account.amount for account in accounts}
+
+
+async def _stored(user_id: int) -> tuple:
+    """amount счёта в строке и число проводок пользователя"""
+    async with async_session() as session:
+        amount = (await session.execute(
+            select(AccountModel.amount).filter_by(user_id=user_id, title='Наличка')
+        )).scalar_one()
+        count = (await session.execute(
+            select(func.count()).select_from(PostingModel).join(AccountModel).where(AccountModel.user_id == user_id)
+        )).scalar_one()
+    return amount, count
+
+
+async def test_postings(postings, play, user_id):
+    reply = await play(setup() + [
+        (MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Наличка'), (BUTTON, 'Еда'), (MESSAGE, '350'),
+    ])
+    await play(transfer())
+
+    assert '650.00 руб' in reply
+    assert await _stored(user_id) == (100000, 3)
+    assert await _balances(user_id) == {'Наличка': 75000, 'Карта': 490000}
+
+    assert await compact() >= 3
+    await compact_job(None)
+    assert await _stored(user_id) == (100000, 0)
+    assert await _balances(user_id) == {'Наличка': 75000, 'Карта': 490000}
+
+    await play([(MESSAGE, '/add'), (BUTTON, 'Доход'), (BUTTON, 'Наличка'), (BUTTON, 'Еда'), (MESSAGE, '50')])
+    assert await settle() >= 2
+    assert await _stored(user_id) == (80000, 0)
+    assert await _balances(user_id) == {'Наличка': 80000, 'Карта': 490000}
@@ -0,0 +1,43 @@
+"""Маршрутизация чтений: сессия после записи читает из основной базы"""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert, select
+
+from db import UserModel, base, routing
+from db.base import RoutingSession
+
+REPLICA = SimpleNamespace(sync_engine='replica')
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    monkeypatch.setattr(base, 'replica_engine', REPLICA)
+
+
+def test_reads_go_to_replica(replica):
+    session = RoutingSession()
+
+    assert session.get_bind(clause=select(UserModel)) == REPLICA.sync_engine
+    assert not session.wrote
+
+
+def test_session_is_pinned_after_write(replica):
+    session = RoutingSession()
+    assert routing.current_user_id.get() is None
+
+    # без пользователя отметка о записи не ставится, но сессия всё равно переходит на основную базу
+    assert session.get_bind(clause=insert(UserModel)) == base.engine.sync_engine
+    assert session.get_bind(clause=select(UserModel)) == base.engine.sync_engine
+    assert RoutingSession().get_bind(clause=select(UserModel)) == REPLICA.sync_engine
+
+
+def test_user_is_sticky_after_write(replica):
+    token = routing.current_user_id.set(-1)
+    try:
+        RoutingSession().get_bind(clause=insert(UserModel))
+        assert RoutingSession().get_bind(clause=select(UserModel)) == base.engine.sync_engine
+    finally:
+        routing.current_user_id.reset(token)
+        routing._last_writes.pop(-1, None)
+    assert RoutingSession().get_bind(clause=select(UserModel)) == REPLICA.sync_engine
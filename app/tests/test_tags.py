@@ -0,0 +1,37 @@
+import pytest
+
+from common.tags import extract_tags, parse_tag_query, strip_tags
+
+
+@pytest.mark.parametrize('text, tags', [
+    ('кофе #Работа #отпуск #работа', ['отпуск', 'работа']),
+    ('#поездка2023, #море!', ['море', 'поездка2023']),
+    ('кофе', None),
+    ('', None),
+    (None, None),
+    ('#' + 'a' * 65, None),
+])
+def test_extract_tags(text, tags):
+    assert extract_tags(text) == tags
+
+
+@pytest.mark.parametrize('text, stripped', [
+    ('350 кофе #работа', '350 кофе'),
+    ('350 #а кофе', '350 кофе'),
+    ('350\nужин #а #б', '350\nужин'),
+    ('#а', ''),
+])
+def test_strip_tags(text, stripped):
+    assert strip_tags(text) == stripped
+
+
+@pytest.mark.parametrize('query, groups', [
+    ('#отпуск #море | #работа', [['море', 'отпуск'], ['работа']]),
+    ('отпуск или работа', [['отпуск'], ['работа']]),
+    ('#а|#б #в', [['а'], ['б', 'в']]),
+    ('корица', [['корица']]),
+    ('', []),
+    (' | ', []),
+])
+def test_parse_tag_query(query, groups):
+    assert parse_tag_query(query) == groups
@@ -0,0 +1,130 @@
+"""Единица работы: число запросов на обновление и фиксация до ответа пользователю"""
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+import pytest
+from sqlalchemy import func, select, update
+
+from common.keyboards import build_keyboard
+from db import ProcessedUpdateModel, UserModel
+from db.base import async_session
+from db.ledger import purge_job, record
+from db.uow import DuplicateUpdate, UnitOfWorkStats, commit_before_reply, get_session, stats_listeners, unit_of_work
+from loadtest.scripts import BUTTON, MESSAGE, setup
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def stats():
+    collected: List[UnitOfWorkStats] = []
+    stats_listeners.append(collected.append)
+    yield collected
+    stats_listeners.remove(collected.append)
+
+
+async def _counts(play, stats: List[UnitOfWorkStats], step) -> Tuple[int, int, int]:
+    """(запросы, из них записи, обращения к базе) обновления шага"""
+    before = len(stats)
+    await play([step])
+    update_stats, = stats[before:]
+    return update_stats.statements, update_stats.writes, update_stats.round_trips
+
+
+async def test_entry_statements(play, stats):
+    await play(setup() + [(MESSAGE, '/add'), (BUTTON, 'Расход'), (BUTTON, 'Наличка')])
+
+    # категории уже загружены на предыдущем шаге
+    assert await _counts(play, stats, (BUTTON, 'Еда')) == (0, 0, 0)
+    # INSERT записи, UPDATE баланса, INSERT в журнал обработанных обновлений; BEGIN и COMMIT
+    assert await _counts(play, stats, (MESSAGE, '350 кофе')) == (3, 3, 5)
+
+
+async def test_transfer_statements(play, stats):
+    await play(setup() + [(MESSAGE, '/add'), (BUTTON, 'Перевод'), (BUTTON, 'Карта')])
+
+    assert await _counts(play, stats, (BUTTON, 'Наличка')) == (0, 0, 0)
+    # INSERT перевода, UPDATE двух балансов, INSERT в журнал
+    assert await _counts(play, stats, (MESSAGE, '100')) == (4, 4, 6)
+
+
+async def test_browsing_statements(play, stats):
+    await play(setup())
+
+    statements, writes, _ = await _counts(play, stats, (MESSAGE, '/accounts'))
+    assert (statements, writes) == (1, 0)
+    assert await _counts(play, stats, (BUTTON, 'Наличка')) == (0, 0, 0)
+    assert await _counts(play, stats, (BUTTON, 'Закрыть')) == (0, 0, 0)
+
+
+async def _user_exists(user_id: int) -> bool:
+    async with async_session() as session:
+        return (await session.execute(select(func.count()).where(UserModel.id == user_id))).scalar_one() == 1
+
+
+async def test_commit_before_reply(schema, user_id):
+    async with unit_of_work((user_id, 1)):
+        get_session().add(UserModel(id=user_id))
+        await commit_before_reply()
+        # ответ уходит уже после фиксации: изменения видны другим сессиям
+        assert await _user_exists(user_id)
+
+
+async def test_commit_before_reply_without_writes(schema, stats):
+    async with unit_of_work((1, 1)):
+        await commit_before_reply()
+
+    assert stats[-1].round_trips == 0
+
+
+async def test_duplicate_update_is_not_answered(schema, user_id):
+    async with unit_of_work((user_id, 1)):
+        get_session().add(UserModel(id=user_id))
+
+    with pytest.raises(DuplicateUpdate):
+        async with unit_of_work((user_id, 1)) as uow:
+            get_session().add(UserModel(id=user_id + 1))
+            await commit_before_reply()
+
+    assert uow.stats.duplicate
+    assert not await _user_exists(user_id + 1)
+    async with async_session() as session:
+        keys = (await session.execute(
+            select(func.count()).select_from(ProcessedUpdateModel).where(ProcessedUpdateModel.update_id == user_id)
+        )).scalar_one()
+    assert keys == 1
+
+
+async def _processed(key: Tuple[int, int]) -> int:
+    update_id, message_id = key
+    async with async_session() as session:
+        return (await session.execute(
+            select(func.count()).select_from(ProcessedUpdateModel).filter_by(update_id=update_id, message_id=message_id)
+        )).scalar_one()
+
+
+async def test_purge_processed_updates(schema, user_id):
+    old, new = (user_id, 1), (user_id, 2)
+    async with async_session() as session, session.begin():
+        for key in (old, new):
+            await record(session, key)
+        await session.execute(
+            update(ProcessedUpdateModel)
+            .filter_by(update_id=user_id, message_id=1)
+            .values(date_created=datetime.now(timezone.utc) - timedelta(days=3))
+        )
+
+    await purge_job(None)
+
+    assert (await _processed(old), await _processed(new)) == (0, 1)
+
+
+async def test_keyboard_is_rebuilt_after_commit_before_reply(schema, user_id):
+    build_keyboard(user_id, 'test', lambda: [('старая', 1)])
+
+    async with unit_of_work((user_id, 1)):
+        get_session().add(UserModel(id=user_id))
+        await commit_before_reply()
+        reply_markup = build_keyboard(user_id, 'test', lambda: [('новая', 1)])
+
+    assert reply_markup.inline_keyboard[0][0].text == 'новая'